@@ -0,0 +1,284 @@
+# alerts.py
+
+"""
+心率提醒规则引擎。
+
+规则在每个样本到达时增量计算（O(规则数)），只在状态变化时产生提醒事件，
+接收端不必再自己从连续的心率流中判断"是否超过 170"。
+
+规则在 config.json 的 "alerts" 列表中配置：
+
+    "alerts": [
+        {"type": "zone", "zones": [{"name": "热身", "min": 100}, {"name": "燃脂", "min": 120},
+                                    {"name": "有氧", "min": 140}, {"name": "极限", "min": 165}], "hysteresis": 2},
+        {"type": "threshold", "name": "心率过高", "above": 170, "hysteresis": 5},
+        {"type": "threshold", "name": "心率过低", "below": 50, "hysteresis": 5},
+        {"type": "sustained", "name": "持续高心率", "above": 160, "seconds": 60},
+        {"type": "no_data", "seconds": 10}
+    ]
+
+产生的事件类型见 ALERT_TRIGGERS，可以在 Webhook 的触发器、WebSocket 订阅（alerts 字段）中使用；
+OSC 则通过 HeartRateZone / HeartRateAlert 两个 Avatar 参数反映当前状态。
+"""
+
+import threading
+from typing import NamedTuple, Optional
+
+# 提醒事件类型
+ALERT_ZONE_ENTER = "zone_enter"
+ALERT_ZONE_EXIT = "zone_exit"
+ALERT_ABOVE = "threshold_above"
+ALERT_BELOW = "threshold_below"
+ALERT_NORMAL = "threshold_normal"
+ALERT_SUSTAINED = "sustained_above"
+ALERT_SUSTAINED_END = "sustained_end"
+ALERT_NO_DATA = "no_data"
+ALERT_DATA_RESUMED = "data_resumed"
+
+# 事件类型 -> 界面和 {event} 占位符中使用的描述
+ALERT_TRIGGERS = {
+    ALERT_ZONE_ENTER: "进入区间",
+    ALERT_ZONE_EXIT: "离开区间",
+    ALERT_ABOVE: "超过阈值",
+    ALERT_BELOW: "低于阈值",
+    ALERT_NORMAL: "恢复正常",
+    ALERT_SUSTAINED: "持续过高",
+    ALERT_SUSTAINED_END: "持续过高结束",
+    ALERT_NO_DATA: "无数据",
+    ALERT_DATA_RESUMED: "数据恢复",
+}
+
+
+class Alert(NamedTuple):
+    kind: str     # ALERT_*
+    detail: str   # 规则或区间的名称
+
+
+class _Rule:
+    """规则基类。process/tick 返回本次产生的提醒列表。"""
+    # 处于提醒状态（超过阈值、持续过高、无数据）时为 True，用于 OSC 的 HeartRateAlert
+    active = False
+
+    def process(self, bpm: int, now: float) -> list[Alert]:
+        return []
+
+    def tick(self, now: float) -> list[Alert]:
+        return []
+
+    def reset(self, now: Optional[float]):
+        """设备连接（now 为当前时间）或断开（now 为 None）时调用"""
+        self.active = False
+
+
+class ZoneRule(_Rule):
+    """
+    心率区间。zones 按 min 升序，每个区间的上限是下一个区间的 min。
+    向上进入区间立即生效，向下离开需要再低 hysteresis bpm，避免在边界附近反复切换。
+    """
+
+    def __init__(self, zones: list[dict], hysteresis: float = 2):
+        zones = sorted(zones, key=lambda z: float(z["min"]))
+        self.names = [str(z.get("name") or f"区间{i + 1}") for i, z in enumerate(zones)]
+        self.lower = [float(z["min"]) for z in zones]
+        self.hysteresis = float(hysteresis)
+        # 0 表示低于所有区间，i 表示处于第 i 个区间（从 1 开始）
+        self.index = 0
+
+    def _target(self, bpm: float) -> int:
+        index = self.index
+        while index < len(self.lower) and bpm >= self.lower[index]:
+            index += 1
+        while index > 0 and bpm < self.lower[index - 1] - self.hysteresis:
+            index -= 1
+        return index
+
+    def process(self, bpm: int, now: float) -> list[Alert]:
+        index = self._target(bpm)
+        if index == self.index:
+            return []
+        alerts = []
+        if self.index:
+            alerts.append(Alert(ALERT_ZONE_EXIT, self.names[self.index - 1]))
+        if index:
+            alerts.append(Alert(ALERT_ZONE_ENTER, self.names[index - 1]))
+        self.index = index
+        return alerts
+
+    def reset(self, now: Optional[float]):
+        self.index = 0
+
+
+class ThresholdRule(_Rule):
+    """越过阈值时提醒一次，回到阈值另一侧 hysteresis bpm 以外才恢复"""
+
+    def __init__(self, name: str, above: Optional[float] = None, below: Optional[float] = None,
+                 hysteresis: float = 5):
+        if (above is None) == (below is None):
+            raise ValueError("threshold 规则需要且只能指定 above 或 below 之一")
+        self.name = name
+        self.above = above
+        self.below = below
+        self.hysteresis = float(hysteresis)
+
+    def process(self, bpm: int, now: float) -> list[Alert]:
+        if self.above is not None:
+            crossed = bpm >= self.above
+            recovered = bpm <= self.above - self.hysteresis
+            kind = ALERT_ABOVE
+        else:
+            crossed = bpm <= self.below
+            recovered = bpm >= self.below + self.hysteresis
+            kind = ALERT_BELOW
+        if not self.active and crossed:
+            self.active = True
+            return [Alert(kind, self.name)]
+        if self.active and recovered:
+            self.active = False
+            return [Alert(ALERT_NORMAL, self.name)]
+        return []
+
+
+class SustainedRule(_Rule):
+    """心率连续 seconds 秒不低于 above 时提醒一次；低于 above - hysteresis 后结束"""
+
+    def __init__(self, name: str, above: float, seconds: float, hysteresis: float = 0):
+        self.name = name
+        self.above = float(above)
+        self.seconds = float(seconds)
+        self.hysteresis = float(hysteresis)
+        self._since: Optional[float] = None
+
+    def process(self, bpm: int, now: float) -> list[Alert]:
+        if bpm >= self.above:
+            if self._since is None:
+                self._since = now
+            return self._check(now)
+        if bpm < self.above - self.hysteresis:
+            self._since = None
+            if self.active:
+                self.active = False
+                return [Alert(ALERT_SUSTAINED_END, self.name)]
+        return []
+
+    def tick(self, now: float) -> list[Alert]:
+        # 样本间隔较长时，也能按时触发
+        return self._check(now) if self._since is not None else []
+
+    def _check(self, now: float) -> list[Alert]:
+        if not self.active and now - self._since >= self.seconds:
+            self.active = True
+            return [Alert(ALERT_SUSTAINED, self.name)]
+        return []
+
+    def reset(self, now: Optional[float]):
+        self.active = False
+        self._since = None
+
+
+class NoDataRule(_Rule):
+    """设备已连接但 seconds 秒没有收到样本时提醒；收到新样本后发送数据恢复"""
+
+    def __init__(self, name: str, seconds: float):
+        self.name = name
+        self.seconds = float(seconds)
+        self._last: Optional[float] = None
+
+    def process(self, bpm: int, now: float) -> list[Alert]:
+        self._last = now
+        if self.active:
+            self.active = False
+            return [Alert(ALERT_DATA_RESUMED, self.name)]
+        return []
+
+    def tick(self, now: float) -> list[Alert]:
+        if self._last is not None and not self.active and now - self._last >= self.seconds:
+            self.active = True
+            return [Alert(ALERT_NO_DATA, self.name)]
+        return []
+
+    def reset(self, now: Optional[float]):
+        # 连接后从连接时刻开始计时；断开后不再计时（断开本身已有 disconnected 事件）
+        self.active = False
+        self._last = now
+
+
+def create_rule(config: dict) -> _Rule:
+    rule_type = config.get("type")
+    name = str(config.get("name") or rule_type)
+    if rule_type == "zone":
+        return ZoneRule(config["zones"], config.get("hysteresis", 2))
+    if rule_type == "threshold":
+        return ThresholdRule(name, config.get("above"), config.get("below"), config.get("hysteresis", 5))
+    if rule_type == "sustained":
+        return SustainedRule(name, config["above"], config["seconds"], config.get("hysteresis", 0))
+    if rule_type == "no_data":
+        return NoDataRule(name, config.get("seconds", 10))
+    raise ValueError(f"未知的规则类型: {rule_type}")
+
+
+class AlertEngine:
+    """
+    持有所有规则。process() 在 BLE 回调（运行时的事件循环线程）中随样本调用，tick() 由定时器调用（用于"无数据"等
+    与时间相关的规则），两者可能在不同线程，因此用锁串行化。
+    """
+
+    def __init__(self, logger=print):
+        self.logger = logger
+        self._rules: list[_Rule] = []
+        self._lock = threading.Lock()
+
+    def configure(self, rules: list[dict]):
+        """按配置重建规则，单条规则出错只跳过该规则"""
+        created = []
+        for config in rules or []:
+            if not config.get("enabled", True):
+                continue
+            try:
+                created.append(create_rule(config))
+            except (KeyError, TypeError, ValueError) as e:
+                self.logger(f"提醒规则配置错误 {config}: {e}")
+        with self._lock:
+            self._rules = created
+
+    def has_rules(self) -> bool:
+        return bool(self._rules)
+
+    def process(self, bpm: int, now: float) -> list[Alert]:
+        with self._lock:
+            alerts = []
+            for rule in self._rules:
+                alerts.extend(rule.process(bpm, now))
+            return alerts
+
+    def tick(self, now: float) -> list[Alert]:
+        with self._lock:
+            alerts = []
+            for rule in self._rules:
+                alerts.extend(rule.tick(now))
+            return alerts
+
+    def reset(self, now: Optional[float] = None):
+        with self._lock:
+            for rule in self._rules:
+                rule.reset(now)
+
+    @property
+    def zone_index(self) -> int:
+        """当前所在区间（从 1 开始），未配置区间或低于所有区间时为 0"""
+        for rule in self._rules:
+            if isinstance(rule, ZoneRule):
+                return rule.index
+        return 0
+
+    @property
+    def zones(self) -> list[tuple[str, float]]:
+        """区间规则中配置的 (名称, 下限)，供统计区间停留时间使用"""
+        for rule in self._rules:
+            if isinstance(rule, ZoneRule):
+                return list(zip(rule.names, rule.lower))
+        return []
+
+    @property
+    def alert_active(self) -> bool:
+        """是否有规则处于提醒状态"""
+        return any(rule.active for rule in self._rules)
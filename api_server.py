@@ -1,85 +1,252 @@
 # api_server.py
 
-import http.server
-import socketserver
-import threading
+import asyncio
+import concurrent.futures
 import json
+import os
+import time
 from typing import TYPE_CHECKING, Optional
 
+import metrics
+from http_async import Request, Response, serve_connection
+from profiling import PROFILER, ProfilingError
+from snapshot import Snapshot
+
 # 使用类型检查来避免循环导入，同时获得代码提示
 if TYPE_CHECKING:
     from heart_rate_display_ui import HeartRateMonitor
+    from runtime import AsyncRuntime
+    from websocket_server import WebSocketServer
+
+# 等待端口绑定完成的时间（秒）
+BIND_TIMEOUT = 5.0
+# 允许访问 /debug/* 的客户端地址
+LOCAL_CLIENTS = ('127.0.0.1', '::1', '::ffff:127.0.0.1')
+
+
+def heartrate_json(snapshot: Snapshot) -> bytes:
+    """/heartrate 的响应体"""
+    has_sample = snapshot.seq > 0
+    response = {
+        'heart_rate': snapshot.heart_rate,
+        'connected': snapshot.connected,
+        # 最近一个样本的序号和采集时间，尚无样本时为 null
+        'raw_heart_rate': snapshot.raw_heart_rate if has_sample else None,
+        'seq': snapshot.seq if has_sample else None,
+        'timestamp': round(snapshot.timestamp, 3) if has_sample else None,
+        'monotonic': round(snapshot.monotonic, 6) if has_sample else None,
+        # 1 分钟 / 10 分钟 / 会话统计
+        'stats': snapshot.stats,
+    }
+    return json.dumps(response).encode('utf-8')
+
+
+class HeartRateApiHandler:
+    """
+    处理 HTTP 请求。/heartrate 和 /metrics 直接在事件循环中生成；
+    查询数据库、读写文件的接口放到运行时的线程池中执行，不阻塞其他连接。
+    /overlay 下的悬浮窗页面由 Overlay 从内存中提供。
+    """
+
+    def __init__(self, monitor_instance: 'HeartRateMonitor', runtime: 'AsyncRuntime'):
+        from overlay import Overlay
+        self.heart_rate_monitor_instance = monitor_instance
+        self.runtime = runtime
+        self.overlay = Overlay(monitor_instance)
+
+    async def handle(self, request: Request) -> Response:
+        path = request.path
+        if request.method in ('GET', 'HEAD'):
+            if path == '/heartrate':
+                return self._heartrate()
+            if path.rstrip('/') in ('/history', '/history/sessions', '/history/export'):
+                return await self.runtime.run_blocking(self._handle_history, request)
+            if path == '/metrics':
+                body = metrics.REGISTRY.render().encode('utf-8')
+                return Response(200, body, 'text/plain; version=0.0.4; charset=utf-8')
+            if path == '/overlay' or path.startswith('/overlay/'):
+                if self.overlay.needs_blocking(request):
+                    return await self.runtime.run_blocking(self.overlay.handle, request)
+                return self.overlay.handle(request)
+        if path.startswith('/debug/') and request.method in ('GET', 'POST'):
+            return await self.runtime.run_blocking(self._handle_debug, request)
+        return Response.text(404, 'Not Found')
+
+    def _heartrate(self) -> Response:
+        # 只读取一次快照引用，心率与连接状态总是来自同一时刻；同一快照只序列化一次
+        snapshot = self.heart_rate_monitor_instance.state.current if self.heart_rate_monitor_instance else Snapshot()
+        body = snapshot.cached('api', heartrate_json)
+        return Response(200, body, 'application/json', {'Access-Control-Allow-Origin': '*'})  # 允许跨域请求
+
+    def _handle_history(self, request: Request) -> Response:
+        """
+        - GET /history?days=30&resolution=60&device=AA:BB:...
+          也可以用 since/until（Unix 秒）指定时间范围。数据来自按分钟/小时预先汇总的表。
+        - GET /history/sessions?limit=100                       最近的会话
+        - GET /history/export?session=latest&format=csv&interval=0  导出会话（csv/jsonl/tcx）
+        """
+        history = self.heart_rate_monitor_instance.history if self.heart_rate_monitor_instance else None
+        if history is None:
+            return Response.json(404, {'error': '未开启历史记录（config.json 的 history.enabled）'})
+        path = request.path.rstrip('/')
+        if path == '/history/sessions':
+            try:
+                return Response.json(200, {'sessions': history.sessions(int(request.param('limit', '100')))})
+            except ValueError as e:
+                return Response.json(400, {'error': str(e)})
+        if path == '/history/export':
+            return self._handle_export(history, request)
+        try:
+            until = float(request.param('until', time.time()))
+            if 'since' in request.query:
+                since = float(request.param('since'))
+            else:
+                since = until - float(request.param('days', '1')) * 86400
+            resolution = int(request.param('resolution', '60'))
+            device = request.param('device')
+            rows = history.query(since, until, resolution, device)
+        except ValueError as e:
+            return Response.json(400, {'error': str(e)})
+        return Response.json(200, {
+            'since': since,
+            'until': until,
+            'resolution': resolution,
+            'columns': ['time', 'avg', 'min', 'max', 'count'],
+            'rows': rows,
+        })
+
+    def _handle_export(self, history, request: Request) -> Response:
+        """边生成边发送，不设置 Content-Length，发送完毕后关闭连接"""
+        from export import EXPORT_FORMATS, export_session, default_filename, latest_session_id
+        try:
+            session_id = request.param('session', 'latest')
+            session_id = latest_session_id(history) if session_id == 'latest' else int(session_id)
+            if session_id is None:
+                raise ValueError('还没有任何会话')
+            fmt = request.param('format', 'csv')
+            chunks = export_session(history, session_id, fmt, float(request.param('interval', '0')))
+        except ValueError as e:
+            return Response.json(400, {'error': str(e)})
+        filename = default_filename(history.session(session_id), fmt)
+        return Response(200, chunks, EXPORT_FORMATS[fmt].content_type,
+                        {'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    def _handle_debug(self, request: Request) -> Response:
+        """
+        性能分析接口（默认关闭，所有接口只接受本机请求）:
+        - POST /debug/enable                    开启分析功能（仅限本机请求）
+        - POST /debug/profile/start?seconds=30  开始 CPU 分析
+        - POST /debug/profile/stop              提前停止 CPU 分析并写出结果
+        - POST /debug/tracemalloc               拍摄内存快照并与上一次对比
+        - POST /debug/stacks                    立即导出所有线程的调用栈
+        - POST /debug/stacks/sample?seconds=10  采样线程栈
+        - GET  /debug/results                   列出结果文件
+        - GET  /debug/results/<name>            下载结果文件
+        """
+        method = request.method
+        route = (method, request.path.rstrip('/'))
+        # API 监听所有网卡，分析结果（线程栈、内存快照）可能包含敏感信息，不对局域网开放
+        if request.client not in LOCAL_CLIENTS:
+            return Response.json(403, {'error': '性能分析接口只允许本机访问'})
+        try:
+            if route == ('POST', '/debug/enable'):
+                PROFILER.enabled = True
+                return Response.json(200, {'enabled': True})
+            elif route == ('POST', '/debug/profile/start'):
+                seconds = PROFILER.start_cpu(float(request.param('seconds', '30')))
+                return Response.json(200, {'running': True, 'seconds': seconds})
+            elif route == ('POST', '/debug/profile/stop'):
+                return Response.json(200, {'file': os.path.basename(PROFILER.stop_cpu())})
+            elif route == ('POST', '/debug/tracemalloc'):
+                return Response.json(200, {'file': os.path.basename(PROFILER.tracemalloc_snapshot())})
+            elif route == ('POST', '/debug/stacks'):
+                return Response.json(200, {'file': os.path.basename(PROFILER.dump_stacks())})
+            elif route == ('POST', '/debug/stacks/sample'):
+                path = PROFILER.sample_stacks(float(request.param('seconds', '10')))
+                return Response.json(202, {'file': os.path.basename(path)})
+            elif route == ('GET', '/debug/results'):
+                return Response.json(200, {'enabled': PROFILER.enabled, 'cpu_running': PROFILER.cpu_running(),
+                                           'results': PROFILER.list_results()})
+            elif method == 'GET' and request.path.startswith('/debug/results/'):
+                path = PROFILER.result_path(request.path[len('/debug/results/'):]) if PROFILER.enabled else None
+                if not path:
+                    return Response.json(404, {'error': '文件不存在'})
+                with open(path, 'rb') as f:
+                    data = f.read()
+                return Response(200, data, 'application/octet-stream',
+                                {'Content-Disposition': f'attachment; filename="{os.path.basename(path)}"'})
+            else:
+                return Response.json(404, {'error': 'Not Found'})
+        except ProfilingError as e:
+            return Response.json(409 if PROFILER.enabled else 403, {'error': str(e)})
+        except ValueError as e:
+            return Response.json(400, {'error': str(e)})
 
-class HeartRateApiHandler(http.server.BaseHTTPRequestHandler):
-    """处理HTTP请求的处理器"""
-    
-    # [修正1] 使用 Optional 允许类型为 None
-    heart_rate_monitor_instance: Optional['HeartRateMonitor'] = None
-
-    def do_GET(self):
-        if self.path == '/heartrate':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*') # 允许跨域请求
-            self.end_headers()
-            
-            # 从主程序实例获取当前心率 (这里的代码因为有判断，所以本身是安全的)
-            current_heart_rate = self.heart_rate_monitor_instance.heart_rate if self.heart_rate_monitor_instance else 0
-            is_connected = self.heart_rate_monitor_instance.connected if self.heart_rate_monitor_instance else False
-            
-            response = {
-                'heart_rate': current_heart_rate,
-                'connected': is_connected
-            }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
-        else:
-            self.send_response(404)
-            self.end_headers()
-            self.wfile.write(b'Not Found')
-    def log_message(self, format, *args):
-        pass  # 禁用默认日志输出
 
 class ApiServer:
-    """运行在独立线程中的API服务器"""
-    def __init__(self, monitor_instance: 'HeartRateMonitor', port=8080):
+    """
+    运行在后台运行时中的 API 服务器。每个连接是事件循环中的一个协程，
+    服务器本身是受看管的任务 "api"：意外退出时会重新监听端口。
+    设置了 websocket 时，同一端口上的 WebSocket 升级请求也由这里接收。
+    """
+    def __init__(self, monitor_instance: 'HeartRateMonitor', port=8080, runtime: Optional['AsyncRuntime'] = None):
         self.port = port
         self.monitor_instance = monitor_instance
-        self.httpd: Optional[socketserver.ThreadingTCPServer] = None
-        self.server_thread: Optional[threading.Thread] = None
+        self.runtime = runtime or monitor_instance.runtime
+        self.handler = HeartRateApiHandler(monitor_instance, self.runtime)
+        self.httpd: Optional[asyncio.AbstractServer] = None
+        # 正在处理的连接；停止服务器时一并取消，keep-alive 的连接不会残留
+        self._connections: set[asyncio.Task] = set()
+        # 与 WebSocket 共用端口时为 WebSocketServer（shared=True），升级请求交给它处理
+        self.websocket: Optional['WebSocketServer'] = None
+
+    async def _bind(self) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._on_connection, port=self.port)
+
+    async def _on_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            websocket = self.websocket
+            await serve_connection(reader, writer, self.handler.handle, self.runtime.run_blocking,
+                                   websocket.handle_upgrade if websocket else None,
+                                   self.monitor_instance.log_message)
+        except asyncio.CancelledError:
+            pass  # 服务器停止时被取消；正常结束，asyncio 的连接回调不接受被取消的任务
+        finally:
+            self._connections.discard(task)
+
+    async def _serve(self):
+        if self.httpd is None:
+            self.httpd = await self._bind()
+        try:
+            await self.httpd.serve_forever()
+        finally:
+            self.httpd.close()
+            self.httpd = None
+            connections = list(self._connections)
+            for task in connections:
+                task.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
 
     def start(self):
-        """启动服务器"""
-        if self.server_thread and self.server_thread.is_alive():
+        """启动服务器。端口绑定在返回前完成，失败时记录日志且 httpd 保持为 None"""
+        if self.runtime.is_running("api"):
             self.monitor_instance.log_message("API服务器已在运行中。")
             return
-
-        # 将主程序实例传递给请求处理器
-        handler = HeartRateApiHandler
-        handler.heart_rate_monitor_instance = self.monitor_instance
-        
         try:
-            # 使用 ThreadingTCPServer 以便能正确关闭
-            self.httpd = socketserver.ThreadingTCPServer(("", self.port), handler)
-            self.server_thread = threading.Thread(target=self.httpd.serve_forever)
-            self.server_thread.daemon = True
-            self.server_thread.start()
-            self.monitor_instance.log_message(f"API服务器已在 http://127.0.0.1:{self.port} 启动")
-        except Exception as e:
+            self.httpd = self.runtime.submit(self._bind()).result(BIND_TIMEOUT)
+        except (OSError, concurrent.futures.TimeoutError) as e:
             self.monitor_instance.log_message(f"启动API服务器失败: {e}")
             self.httpd = None
-            self.server_thread = None
+            return
+        self.runtime.supervise("api", self._serve)
+        self.monitor_instance.log_message(f"API服务器已在 http://127.0.0.1:{self.port} 启动")
 
     def stop(self):
-        """停止服务器"""
-        if self.httpd:
+        """停止服务器，返回时端口已释放"""
+        if self.httpd or self.runtime.is_running("api"):
             self.monitor_instance.log_message("正在停止API服务器...")
-            self.httpd.shutdown()
-            self.httpd.server_close()
-            
-            # [修正2] 在调用 join 之前检查线程对象是否存在
-            if self.server_thread:
-                self.server_thread.join(timeout=2)
-
+            self.runtime.cancel("api", timeout=2)
             self.httpd = None
-            self.server_thread = None
-            self.monitor_instance.log_message("API服务器已停止。")
\ No newline at end of file
+            self.monitor_instance.log_message("API服务器已停止。")
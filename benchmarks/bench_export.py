@@ -0,0 +1,73 @@
+# bench_export.py
+
+"""
+会话导出的耗时与内存。
+
+在临时数据库中生成一个 24 小时、1 Hz 的会话，依次导出为 CSV / JSON Lines / TCX，
+用 tracemalloc 记录导出过程中的内存峰值，验证其不随会话长度增长。
+
+用法: python benchmarks/bench_export.py [--hours 24] [--interval 0]
+"""
+
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import HistoryStore, BATCH_SIZE
+from export import EXPORT_FORMATS, export_to_file
+
+
+def fill(store: HistoryStore, seconds: int) -> int:
+    store.open_writer()
+    start = time.time() - seconds
+    session_id = store.start_session("AA:BB:CC:DD:EE:FF", start)
+    rows = []
+    for i in range(seconds):
+        bpm = int(90 + 30 * math.sin(i / 900) + (i * 7919) % 11)
+        rows.append((session_id, start + i, i + 1, bpm, bpm, "0.6667"))
+        if len(rows) == BATCH_SIZE:
+            store.write_batch("AA:BB:CC:DD:EE:FF", rows)
+            rows = []
+    if rows:
+        store.write_batch("AA:BB:CC:DD:EE:FF", rows)
+    store.end_session(session_id, start + seconds)
+    store.close_writer()
+    return session_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话导出基准")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--interval", type=float, default=0, help="降采样间隔（秒）")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        store = HistoryStore(os.path.join(directory, "history.db"))
+        samples = int(args.hours * 3600)
+        session_id = fill(store, samples)
+        print(f"会话: {samples} 个样本，降采样间隔 {args.interval} 秒")
+        for fmt in EXPORT_FORMATS:
+            path = os.path.join(directory, f"export.{fmt}")
+            began = time.perf_counter()
+            written = export_to_file(store, session_id, fmt, path, args.interval)
+            elapsed = time.perf_counter() - began
+            # tracemalloc 本身很慢，内存峰值单独再导出一次测量
+            tracemalloc.start()
+            export_to_file(store, session_id, fmt, path, args.interval)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {fmt:6} {elapsed:6.2f} s  {written / 1024 / 1024:7.1f} MB  内存峰值 {peak / 1024:7.1f} KB")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# bench_filter.py
+
+"""
+以 1 kHz 的合成心率信号测量滤波器的开销和效果。
+
+信号为 60~150 bpm 缓慢变化的正弦，叠加 ±2 bpm 噪声，并随机插入 1% 的单点尖峰（40 或 190）。
+
+用法: python benchmarks/bench_filter.py [--seconds 60]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hr_filter import HeartRateFilter
+
+RATE_HZ = 1000
+
+CONFIGS = {
+    "关闭": {"enabled": False},
+    "默认 (中位数 3)": {},
+    "中位数 5 + 变化率 + EMA": {"median_window": 5, "max_slew": 20, "ema_tau": 0.5},
+    "中位数 31": {"median_window": 31},
+}
+
+
+def make_signal(seconds: int, seed: int = 1) -> tuple[list[int], list[float], list[bool]]:
+    rng = random.Random(seed)
+    values, truth, spikes = [], [], []
+    for i in range(seconds * RATE_HZ):
+        t = i / RATE_HZ
+        true_bpm = 105 + 45 * math.sin(t / 20)
+        is_spike = rng.random() < 0.01
+        value = rng.choice((40, 190)) if is_spike else int(round(true_bpm + rng.uniform(-2, 2)))
+        values.append(value)
+        truth.append(true_bpm)
+        spikes.append(is_spike)
+    return values, truth, spikes
+
+
+def run(name: str, config: dict, values: list[int], truth: list[float], spikes: list[bool]):
+    hr_filter = HeartRateFilter(config)
+    process = hr_filter.process
+    outputs = []
+    step = 1.0 / RATE_HZ
+    start = time.perf_counter()
+    for i, value in enumerate(values):
+        outputs.append(process(value, i * step, True))
+    elapsed = time.perf_counter() - start
+
+    errors = [abs(o - t) for o, t in zip(outputs, truth) if o is not None]
+    spike_errors = [abs(o - t) for o, t, s in zip(outputs, truth, spikes) if s and o is not None]
+    per_sample_us = elapsed / len(values) * 1e6
+    print(f"{name:<26}{per_sample_us:>10.2f}{RATE_HZ * per_sample_us / 1e4:>10.3f}"
+          f"{sum(errors) / len(errors):>12.2f}{max(spike_errors, default=0):>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="心率滤波器基准")
+    parser.add_argument("--seconds", type=int, default=60)
+    args = parser.parse_args()
+
+    values, truth, spikes = make_signal(args.seconds)
+    print(f"{args.seconds} 秒 × {RATE_HZ} Hz = {len(values)} 个样本，其中尖峰 {sum(spikes)} 个\n")
+    print(f"{'配置':<26}{'µs/样本':>10}{'CPU %':>10}{'平均误差':>12}{'尖峰处最大误差':>14}")
+    for name, config in CONFIGS.items():
+        run(name, config, values, truth, spikes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench_history.py
+
+"""
+历史记录数据库的写入与查询耗时。
+
+生成 N 天、1 Hz 的模拟心率，按 HistorySink 的批大小写入临时数据库，
+然后对比"最近 N 天、每分钟一个点"从汇总表查询与直接扫描原始样本的耗时。
+
+用法: python benchmarks/bench_history.py [--days 30] [--keep history_bench.db]
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import HistoryStore, BATCH_SIZE
+
+DEVICE = "AA:BB:CC:DD:EE:FF"
+
+
+def fill(store: HistoryStore, days: int, start: float) -> float:
+    """写入模拟数据，返回耗时（秒）"""
+    store.open_writer()
+    session_id = store.start_session(DEVICE, start)
+    total = days * 86400
+    began = time.perf_counter()
+    rows = []
+    for i in range(total):
+        bpm = int(90 + 30 * math.sin(i / 900) + (i * 7919) % 11)
+        rows.append((session_id, start + i, i + 1, bpm, bpm, ""))
+        if len(rows) == BATCH_SIZE:
+            store.write_batch(DEVICE, rows)
+            rows = []
+    if rows:
+        store.write_batch(DEVICE, rows)
+    elapsed = time.perf_counter() - began
+    store.end_session(session_id, start + total)
+    store.close_writer()
+    return elapsed
+
+
+def timed(fn, runs: int = 5) -> tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(runs):
+        began = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - began)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史记录数据库基准")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--keep", help="保留生成的数据库到该路径（默认使用临时文件并在结束后删除）")
+    args = parser.parse_args()
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(), "history_bench.db")
+    store = HistoryStore(path)
+    until = time.time() // 60 * 60
+    since = until - args.days * 86400
+    try:
+        write_s = fill(store, args.days, since)
+        samples = args.days * 86400
+        print(f"写入 {samples} 个样本（每批 {BATCH_SIZE} 条）: {write_s:.1f} s，"
+              f"{samples / write_s / 1000:.0f}k 样本/秒，每批 {write_s / (samples / BATCH_SIZE) * 1000:.2f} ms")
+
+        rollup_s, rows = timed(lambda: store.query(since, until, 60))
+        print(f"最近 {args.days} 天、1 分钟分辨率（汇总表）: {rollup_s * 1000:.1f} ms，{len(rows)} 个点")
+        hourly_s, rows = timed(lambda: store.query(since, until, 3600))
+        print(f"最近 {args.days} 天、1 小时分辨率（汇总表）: {hourly_s * 1000:.1f} ms，{len(rows)} 个点")
+
+        conn = store._connect_reader()
+        scan_sql = ("SELECT CAST(ts / 60 AS INTEGER) AS b, AVG(bpm), MIN(bpm), MAX(bpm), COUNT(*) "
+                    "FROM samples WHERE ts >= ? AND ts < ? GROUP BY b ORDER BY b")
+        scan_s, rows = timed(lambda: conn.execute(scan_sql, (since, until)).fetchall(), runs=1)
+        conn.close()
+        print(f"对比：扫描原始样本: {scan_s * 1000:.1f} ms，{len(rows)} 个点")
+    finally:
+        if not args.keep:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# bench_local_feed.py
+
+"""
+本机数据源的读取开销与通知延迟。
+
+- 共享内存：另一个进程以最快速度 poll()/read()，统计每次读取的耗时；
+  同时本进程以 --rate 的频率写入，确认读取方从未读到写了一半的记录；
+- 数据报：从写入到另一个进程收到通知的延迟（用 time.monotonic() 比较，两个进程使用同一个时钟）；
+- 作为对照：通过 HTTP keep-alive 请求 /heartrate 的耗时。
+
+用法: python benchmarks/bench_local_feed.py [--seconds 3] [--rate 1000]
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_feed import LocalFeedReader, LocalFeedSink, LocalFeedSubscriber
+from sinks import capture_sample
+
+NAME = "hrm_feed_bench"
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), "hrm_feed_bench.sock")
+PORT = 8798
+RR = (0.8,) * 8
+
+
+def run_reader(seconds: float):
+    """子进程：轮询共享内存，打印 读取次数、平均耗时（纳秒）、不完整记录数"""
+    reader = LocalFeedReader(NAME)
+    expected = tuple(round(r * 1024) / 1024 for r in RR)
+    reads = torn = 0
+    deadline = time.monotonic() + seconds
+    started = time.perf_counter_ns()
+    while time.monotonic() < deadline:
+        sample = reader.read()
+        reads += 1
+        if sample is not None and sample.rr_intervals != expected:
+            torn += 1
+    elapsed = time.perf_counter_ns() - started
+    polls = 100_000
+    started = time.perf_counter_ns()
+    for _ in range(polls):
+        reader.poll()
+    poll_ns = (time.perf_counter_ns() - started) / polls
+    reader.close()
+    print(reads, elapsed / reads, poll_ns, torn)
+
+
+def run_subscriber(seconds: float):
+    """子进程：接收数据报，打印每条通知的延迟（微秒）的中位数和 p99"""
+    subscriber = LocalFeedSubscriber(SOCKET_PATH)
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        sample = subscriber.recv(0.5)
+        if sample is not None:
+            latencies.append((time.monotonic() - sample.monotonic) * 1e6)
+    subscriber.close()
+    latencies.sort()
+    if latencies:
+        print(len(latencies), statistics.median(latencies), latencies[int(len(latencies) * 0.99)])
+    else:
+        print(0, 0, 0)
+
+
+def write_for(sink: LocalFeedSink, child: subprocess.Popen, rate: float):
+    interval = 1 / rate
+    next_write = time.monotonic()
+    while child.poll() is None:
+        sink.handle(capture_sample(72, RR))
+        next_write += interval
+        delay = next_write - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    return child.stdout.read().split()
+
+
+def bench_http(seconds: float) -> float:
+    """HTTP keep-alive 请求 /heartrate 的平均耗时（微秒）"""
+    from api_server import ApiServer
+    from runtime import AsyncRuntime
+    from snapshot import SnapshotHolder
+
+    class _Monitor:
+        def __init__(self, runtime):
+            self.runtime = runtime
+            self.state = SnapshotHolder()
+            self.history = None
+
+        def log_message(self, message):
+            pass
+
+    runtime = AsyncRuntime(print)
+    runtime.start()
+    server = ApiServer(_Monitor(runtime), PORT, runtime)
+    server.start()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", PORT)
+        count = 0
+        deadline = time.monotonic() + seconds
+        started = time.perf_counter()
+        while time.monotonic() < deadline:
+            conn.request("GET", "/heartrate")
+            conn.getresponse().read()
+            count += 1
+        conn.close()
+        return (time.perf_counter() - started) / count * 1e6
+    finally:
+        server.stop()
+        runtime.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本机数据源的读取开销与通知延迟")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--rate", type=float, default=1000.0, help="写入频率（次/秒）")
+    parser.add_argument("--child", choices=("reader", "subscriber"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child == "reader":
+        run_reader(args.seconds)
+        return
+    if args.child == "subscriber":
+        run_subscriber(args.seconds)
+        return
+
+    sink = LocalFeedSink(NAME, SOCKET_PATH if hasattr(socket, "AF_UNIX") else None)
+    sink.logger = lambda message: None
+    sink.open()
+    try:
+        sink.handle(capture_sample(72, RR))
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", "reader",
+                                  "--seconds", str(args.seconds)], stdout=subprocess.PIPE, text=True)
+        reads, read_ns, poll_ns, torn = write_for(sink, child, args.rate)
+        print(f"共享内存  read() {float(read_ns):7.0f} ns  poll() {float(poll_ns):5.0f} ns  "
+              f"{int(reads) / args.seconds:10.0f} 次/秒  不完整记录 {torn}（写入 {args.rate:.0f} 次/秒）")
+
+        if sink.socket_path:
+            child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", "subscriber",
+                                      "--seconds", str(args.seconds)], stdout=subprocess.PIPE, text=True)
+            count, median, p99 = write_for(sink, child, args.rate)
+            print(f"数据报    延迟中位数 {float(median):6.1f} µs  p99 {float(p99):6.1f} µs  收到 {count} 条")
+    finally:
+        sink.close()
+
+    print(f"HTTP      /heartrate {bench_http(args.seconds):6.1f} µs/次（keep-alive）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# bench_mqtt.py
+
+"""
+MQTT 输出端的发布开销与在途窗口的效果。
+
+在进程内启动一个最小的 MQTT 服务器替身，每条 QoS 1 消息延迟 --rtt 毫秒后才回复 PUBACK（模拟网络往返）。
+对比不同的 max_inflight：
+- 1 相当于逐条等待确认，吞吐量受往返时间限制；
+- 窗口越大，同一时间在途的消息越多，吞吐量越接近服务器的处理能力。
+同时统计 publish() 本身的耗时：无论服务器多慢，它都只是入队。
+
+用法: python benchmarks/bench_mqtt.py [--messages 2000] [--rtt 20]
+"""
+
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mqtt_client import MqttClient, read_packet, _packet, CONNECT, CONNACK, PUBLISH, PUBACK, PINGREQ, PINGRESP
+from runtime import AsyncRuntime
+
+
+class BrokerStandIn:
+    """只实现 CONNECT / PUBLISH(QoS 0/1) / PINGREQ 的服务器替身，统计收到的消息数"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.received = 0
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._connection, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            packet_type, _, _ = await read_packet(reader)
+            if packet_type != CONNECT:
+                return
+            writer.write(_packet(CONNACK, 0, b"\x00\x00"))
+            while True:
+                packet_type, flags, body = await read_packet(reader)
+                if packet_type == PUBLISH:
+                    self.received += 1
+                    if self.received >= self.expected:
+                        self.done.set()
+                    if flags & 0x06:
+                        topic_length = struct.unpack_from("!H", body)[0]
+                        ack = _packet(PUBACK, 0, body[2 + topic_length:4 + topic_length])
+                        loop.call_later(self.rtt, writer.write, ack)
+                elif packet_type == PINGREQ:
+                    writer.write(_packet(PINGRESP, 0, b""))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def bench(runtime: AsyncRuntime, messages: int, rtt: float, max_inflight: int) -> tuple[float, float]:
+    """返回 (每秒送达的消息数, publish() 平均耗时微秒)"""
+    broker = BrokerStandIn(rtt)
+    broker.expected = messages
+    port = runtime.submit(broker.start()).result()
+    client = MqttClient(runtime, "127.0.0.1", port, max_inflight=max_inflight, queue_size=messages,
+                        logger=lambda message: None, name=f"bench-mqtt-{max_inflight}")
+    client.start()
+    while not client.connected:
+        time.sleep(0.01)
+    started = time.perf_counter()
+    for i in range(messages):
+        client.publish("bench/heart_rate", b'{"heart_rate": 72}', 1)
+    publish_us = (time.perf_counter() - started) / messages * 1e6
+    runtime.submit(asyncio.wait_for(broker.done.wait(), 120)).result()
+    # 最后一条消息的确认还需要一个往返
+    while client._inflight:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    client.stop(timeout=2)
+    broker.server.close()
+    return messages / elapsed, publish_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT 输出端的发布开销与在途窗口")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rtt", type=float, default=20.0, help="模拟的往返时间（毫秒）")
+    args = parser.parse_args()
+
+    runtime = AsyncRuntime(print)
+    runtime.start()
+    try:
+        print(f"{args.messages} 条 QoS 1 消息，往返 {args.rtt:.0f} ms")
+        for max_inflight in (1, 5, 20, 100):
+            rate, publish_us = bench(runtime, args.messages, args.rtt / 1000, max_inflight)
+            print(f"max_inflight {max_inflight:3d}  送达 {rate:8.0f} 条/秒  publish() {publish_us:5.1f} µs")
+    finally:
+        runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# bench_runtime.py
+
+"""
+后台运行时在负载下的线程数与上下文切换次数。
+
+在同一负载下对比两种模式：
+- runtime：API 服务器运行在 AsyncRuntime 的事件循环中，模拟的 Webhook 请求交给运行时的线程池；
+- threads：旧的做法，ThreadingHTTPServer 每个连接一个线程，每次 Webhook 请求一个线程。
+负载为另一个进程中的 N 个客户端不断新建连接请求 /heartrate，同时以 10 Hz 触发模拟的 Webhook
+（每次请求耗时 50 ms）。只统计服务端进程的线程（客户端在子进程中）。
+
+用法: python benchmarks/bench_runtime.py [--clients 20] [--seconds 5]
+"""
+
+import argparse
+import http.client
+import http.server
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_server import ApiServer, heartrate_json
+from runtime import AsyncRuntime
+from snapshot import Snapshot, SnapshotHolder
+
+PORT = 8799
+WEBHOOK_RATE = 10
+WEBHOOK_LATENCY = 0.05
+
+
+def context_switches() -> int:
+    """本进程所有线程的上下文切换次数之和（Linux 读取 /proc，其他平台退回 getrusage）"""
+    task_dir = "/proc/self/task"
+    if os.path.isdir(task_dir):
+        total = 0
+        for tid in os.listdir(task_dir):
+            try:
+                with open(os.path.join(task_dir, tid, "status")) as f:
+                    for line in f:
+                        # voluntary_ctxt_switches 与 nonvoluntary_ctxt_switches
+                        if "ctxt_switches" in line:
+                            total += int(line.split()[-1])
+            except OSError:
+                pass  # 线程已退出
+        return total
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_nvcsw + usage.ru_nivcsw
+
+
+class _Monitor:
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.state = SnapshotHolder()
+        self.state.publish(Snapshot(heart_rate=80, connected=True, seq=1, timestamp=time.time()))
+        self.history = None
+
+    def log_message(self, message):
+        pass
+
+
+def _fake_webhook():
+    time.sleep(WEBHOOK_LATENCY)
+
+
+def run_clients(clients: int, seconds: float):
+    """子进程：clients 个线程不断新建连接请求 /heartrate，结束时打印请求总数"""
+    counts = [0] * clients
+    deadline = time.monotonic() + seconds
+
+    def worker(index):
+        while time.monotonic() < deadline:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=5)
+            try:
+                conn.request("GET", "/heartrate", headers={"Connection": "close"})
+                conn.getresponse().read()
+                counts[index] += 1
+            except OSError:
+                time.sleep(0.01)
+            finally:
+                conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(sum(counts))
+
+
+def load(clients: int, seconds: float, submit_webhook) -> tuple[int, int, int]:
+    """施加负载，返回 (请求数, 峰值线程数, 上下文切换次数)"""
+    client = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--client",
+                               "--clients", str(clients), "--seconds", str(seconds)],
+                              stdout=subprocess.PIPE, text=True)
+    switches = context_switches()
+    peak = threading.active_count()
+    next_webhook = time.monotonic()
+    while client.poll() is None:
+        now = time.monotonic()
+        if now >= next_webhook:
+            submit_webhook()
+            next_webhook += 1 / WEBHOOK_RATE
+        peak = max(peak, threading.active_count())
+        time.sleep(0.01)
+    switches = context_switches() - switches
+    return int(client.stdout.read().strip() or 0), peak, switches
+
+
+def bench_runtime(clients: int, seconds: float):
+    runtime = AsyncRuntime(print)
+    runtime.start()
+    server = ApiServer(_Monitor(runtime), PORT, runtime)
+    server.start()
+    try:
+        return load(clients, seconds, lambda: runtime.executor.submit(_fake_webhook))
+    finally:
+        server.stop()
+        runtime.stop()
+
+
+def bench_threads(clients: int, seconds: float):
+    monitor = _Monitor(None)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = monitor.state.current.cached("api", heartrate_json)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(("", PORT), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        return load(clients, seconds, lambda: threading.Thread(target=_fake_webhook, daemon=True).start())
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后台运行时的线程数与上下文切换")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--client", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.client:
+        run_clients(args.clients, args.seconds)
+        return
+
+    print(f"{args.clients} 个客户端，{args.seconds:.0f} 秒，Webhook {WEBHOOK_RATE} 次/秒")
+    for name, bench in (("threads", bench_threads), ("runtime", bench_runtime)):
+        requests, peak, switches = bench(args.clients, args.seconds)
+        print(f"{name:8s} 请求 {requests / args.seconds:7.0f}/s  峰值线程 {peak:3d}  "
+              f"上下文切换 {switches / args.seconds:8.0f}/s（每请求 {switches / max(1, requests):.2f}）")
+
+
+if __name__ == "__main__":
+    main()
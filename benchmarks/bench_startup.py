@@ -0,0 +1,87 @@
+# bench_startup.py
+
+"""
+测量启动耗时。
+
+1. 导入耗时：用 python -X importtime 导入 heart_rate_display_ui，列出累计耗时最多的模块。
+2. 窗口耗时：以 HRM_STARTUP_BENCH=1 运行 main.py，窗口显示后程序打印耗时并自动退出
+   （需要图形环境；无显示器时会跳过）。
+
+从启动到收到第一个心率样本的耗时依赖真实设备，无法在这里自动测量；
+正常运行时会写入日志，并通过 /metrics 的 hr_startup_first_sample_seconds 提供。
+
+用法: python benchmarks/bench_startup.py [--runs 5] [--top 15]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str) -> list[tuple[int, int, str]]:
+    """返回 (自身耗时us, 累计耗时us, 模块名) 列表"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append((int(self_us), int(cumulative_us), name.rstrip()[1:]))
+    return entries
+
+
+def bench_imports(runs: int, top: int):
+    totals = []
+    entries = []
+    for _ in range(runs):
+        entries = import_times("heart_rate_display_ui")
+        totals.append(next(c for _, c, name in reversed(entries) if name.strip() == "heart_rate_display_ui"))
+    print(f"导入 heart_rate_display_ui: 中位数 {statistics.median(totals) / 1000:.1f} ms "
+          f"(最小 {min(totals) / 1000:.1f} ms, {runs} 次)")
+    print(f"\nheart_rate_display_ui 直接导入的模块中累计耗时最多的 (最后一次运行):")
+    top_level = [e for e in entries if e[2].startswith("  ") and not e[2].startswith("   ")]
+    for self_us, cumulative_us, name in sorted(top_level, key=lambda e: -e[1])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name.strip()}")
+
+
+def bench_window(runs: int):
+    env = dict(os.environ, HRM_STARTUP_BENCH="1")
+    times = []
+    for _ in range(runs):
+        try:
+            result = subprocess.run([sys.executable, "main.py"], cwd=ROOT, env=env,
+                                    capture_output=True, text=True, timeout=60)
+        except subprocess.TimeoutExpired:
+            print("\n窗口耗时: 超时，跳过")
+            return
+        for line in result.stdout.splitlines():
+            if line.startswith("time_to_window_ms="):
+                times.append(float(line.split("=", 1)[1]))
+                break
+        else:
+            print("\n窗口耗时: 无法启动窗口（可能没有图形环境），跳过")
+            return
+    print(f"\n从进程启动到窗口显示: 中位数 {statistics.median(times):.1f} ms "
+          f"(最小 {min(times):.1f} ms, {runs} 次)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    bench_imports(args.runs, args.top)
+    bench_window(args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bench_websocket_encoding.py
+
+"""
+比较 WebSocket 的 JSON 文本帧与二进制子协议（hrm.binary.v1）：
+- 每个样本在线路上的字节数（含 WebSocket 帧头）；
+- 每个样本的编码耗时；
+- 旧实现（每个客户端各编码一次）与现在（每种格式只编码一次）在 N 个客户端下的总编码耗时。
+
+用法: python benchmarks/bench_websocket_encoding.py [--clients 50]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sinks import capture_sample
+from websocket_server import encode_json, encode_binary
+
+N = 200_000
+
+
+def frame_size(payload_len: int) -> int:
+    """服务器发往客户端的帧不加掩码：2 字节帧头，负载 ≥126 字节时再加 2 字节长度"""
+    return payload_len + (2 if payload_len < 126 else 4)
+
+
+def per_call_us(fn, event) -> float:
+    return min(timeit.repeat(lambda: fn(event), number=N, repeat=3)) / N * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 编码格式基准")
+    parser.add_argument("--clients", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'样本':<14}{'格式':<8}{'负载字节':>8}{'帧字节':>8}{'编码 µs':>10}")
+    for rr_count in (0, 1, 3):
+        event = capture_sample(72, [0.83] * rr_count)
+        for name, fn in (("json", encode_json), ("binary", encode_binary)):
+            payload = fn(event)
+            size = len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+            print(f"{f'{rr_count} 个 RR':<14}{name:<8}{size:>8}{frame_size(size):>8}{per_call_us(fn, event):>10.2f}")
+
+    event = capture_sample(72, [0.83])
+    json_us = per_call_us(encode_json, event)
+    binary_us = per_call_us(encode_binary, event)
+    clients = args.clients
+    print(f"\n{clients} 个客户端，每个样本的总编码耗时:")
+    print(f"  每个客户端各编码一次 (JSON): {json_us * clients:8.1f} µs")
+    print(f"  每种格式编码一次 (JSON):      {json_us:8.1f} µs")
+    print(f"  每种格式编码一次 (二进制):    {binary_us:8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
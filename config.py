@@ -1,27 +1,179 @@
 # config.py
 
+import copy
 import json
 import os
+import tempfile
+import threading
+import time
+from typing import Any, Optional
 
 CONFIG_FILE = "config.json"
 
+# 连续修改时，最后一次修改后等待多久（秒）才真正写盘
+SAVE_DEBOUNCE_SECONDS = 0.5
+# 读取失败（文件被占用、权限、网络盘暂时不可用等）时的重试次数和间隔（秒）
+READ_RETRIES = 3
+READ_RETRY_DELAY = 0.05
+
+
+class ConfigStore:
+    """
+    单个 JSON 配置文件的存取器。
+    - 写入：先写临时文件再原子替换，崩溃时不会留下被截断的文件。
+    - 保存：短时间内的多次保存会合并为一次写盘，由后台线程完成，不阻塞 UI。
+    - 读取：解析结果缓存在内存中，仅当文件的 mtime/大小变化时才重新读盘。
+    """
+
+    def __init__(self, path: str, default: Any = None, ensure_ascii: bool = True,
+                 debounce: float = SAVE_DEBOUNCE_SECONDS):
+        self.path = path
+        self.default = default if default is not None else {}
+        self.ensure_ascii = ensure_ascii
+        self.debounce = debounce
+        self.last_error: Optional[str] = None
+
+        self._lock = threading.Condition()
+        # 保证同一时间只有一个写盘操作，且不占用 _lock，读取不会被写盘阻塞
+        self._write_lock = threading.Lock()
+        self._cache: Any = None
+        self._cache_stamp: Optional[tuple[int, int]] = None
+        self._pending_text: Optional[str] = None
+        self._pending_deadline = 0.0
+        self._writer_active = False
+
+    def _stamp(self) -> Optional[tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def load(self) -> Any:
+        """
+        读取配置。返回值是缓存的副本，调用方可以随意修改。
+        文件不存在时返回默认值；文件损坏（无法解析）时会将其改名为 *.corrupt 保留，再返回默认值。
+        读取出错（OSError）时重试几次；仍然失败则记录到 last_error，文件保持原样，
+        返回上次成功读取的内容（没有时返回默认值），下次调用时再读。
+        """
+        with self._lock:
+            if self._pending_text is not None:
+                return copy.deepcopy(self._cache)
+            stamp = self._stamp()
+            if stamp is None:
+                return copy.deepcopy(self.default)
+            if stamp != self._cache_stamp:
+                for attempt in range(READ_RETRIES):
+                    try:
+                        with open(self.path, "r", encoding="utf-8") as f:
+                            self._cache = json.load(f)
+                        self._cache_stamp = stamp
+                        break
+                    except ValueError as e:
+                        self.last_error = f"{self.path} 无法解析: {e}，损坏的文件已另存为 {self.path}.corrupt"
+                        self._quarantine()
+                        return copy.deepcopy(self.default)
+                    except OSError as e:
+                        if attempt + 1 < READ_RETRIES:
+                            time.sleep(READ_RETRY_DELAY)
+                            continue
+                        self.last_error = f"读取 {self.path} 失败: {e}"
+                        if self._cache_stamp is None:
+                            return copy.deepcopy(self.default)
+            return copy.deepcopy(self._cache)
+
+    def _quarantine(self):
+        """保留损坏的文件，避免之后的保存把它覆盖掉"""
+        try:
+            os.replace(self.path, self.path + ".corrupt")
+        except OSError:
+            pass
+        self._cache = None
+        self._cache_stamp = None
+
+    def save(self, data: Any):
+        """
+        提交一次保存。数据在调用时立即序列化（与之后对 data 的修改无关），
+        实际写盘由后台线程在防抖时间后完成。
+        """
+        text = json.dumps(data, indent=4, ensure_ascii=self.ensure_ascii)
+        with self._lock:
+            self._cache = json.loads(text)
+            self._pending_text = text
+            self._pending_deadline = time.monotonic() + self.debounce
+            if not self._writer_active:
+                self._writer_active = True
+                threading.Thread(target=self._writer_loop, daemon=True).start()
+            self._lock.notify()
+
+    def flush(self):
+        """立即把待写入的数据写盘（程序退出前调用）"""
+        with self._write_lock:
+            with self._lock:
+                text = self._pending_text
+                self._pending_text = None
+            if text is not None:
+                self._write(text)
+
+    def _writer_loop(self):
+        while True:
+            with self._write_lock:
+                with self._lock:
+                    if self._pending_text is None:
+                        self._writer_active = False
+                        return
+                    remaining = self._pending_deadline - time.monotonic()
+                    if remaining <= 0:
+                        text = self._pending_text
+                        self._pending_text = None
+                if remaining <= 0:
+                    self._write(text)
+                    continue
+            with self._lock:
+                if self._pending_text is not None:
+                    self._lock.wait(remaining)
+
+    def _write(self, text: str):
+        """原子写入：同目录下的临时文件 + fsync + os.replace。调用方需持有 _write_lock。"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            stamp = self._stamp()
+            with self._lock:
+                self._cache_stamp = stamp
+            self.last_error = None
+        except OSError as e:
+            self.last_error = f"保存 {self.path} 失败: {e}"
+
+
+_default_store = ConfigStore(CONFIG_FILE)
+
+
 def save_config(config: dict):
     """
-    将包含所有设置的字典保存到 config.json 文件。
+    将包含所有设置的字典保存到 config.json 文件（防抖、原子写入）。
     """
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=4)
+    _default_store.save(config)
 
 def load_config() -> dict:
     """
     从 config.json 文件加载完整的配置。
     如果文件不存在或解析失败，则返回一个空字典。
     """
-    if not os.path.exists(CONFIG_FILE):
-        return {}
-    try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            config = json.load(f)
-        return config
-    except Exception:
-        return {}
\ No newline at end of file
+    return _default_store.load()
+
+def flush_config():
+    """立即写入尚未落盘的配置"""
+    _default_store.flush()
@@ -3,14 +3,50 @@
 import tkinter as tk
 import sys
 import re
-from typing import Optional
-from PIL import Image, ImageTk
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, TYPE_CHECKING
+
+from session_stats import placeholder_names
+from heart_animation import (
+    HeartAnimator, decode_frames, build_pulse_frames,
+    ANIMATION_AUTO, ANIMATION_PULSE, BEAT_SOURCE_BPM,
+)
+
+# PIL 只在设置了图片时才导入，避免拖慢启动
+if TYPE_CHECKING:
+    from PIL import Image, ImageTk
+
+# 缩放图片缓存的最大条目数（按目标高度区分）
+IMAGE_CACHE_SIZE = 8
+# 窗口尺寸停止变化多久之后（毫秒）进行一次高质量重采样
+RESIZE_SETTLE_MS = 150
+
+# 格式字符串中支持的占位符 -> 组件类型
+PLACEHOLDERS = {"{bpm}": "bpm", "{img}": "img"}
+# 统计占位符 {avg}、{max}、{min} 及带窗口后缀的 {avg_1m} 等，见 session_stats.py
+PLACEHOLDERS.update({"{" + name + "}": "stat" for name in placeholder_names()})
+_PLACEHOLDER_RE = re.compile("(" + "|".join(re.escape(p) for p in PLACEHOLDERS) + ")")
+
+
+@lru_cache(maxsize=32)
+def compile_format(display_format: str) -> tuple[tuple[str, str], ...]:
+    """
+    将显示格式编译为渲染计划：由 (类型, 文本) 组成的元组。
+    类型为 'bpm'、'stat'、'img' 或 'text'，结果会被缓存，同一格式只解析一次。
+    """
+    plan = []
+    for part in _PLACEHOLDER_RE.split(display_format):
+        if part:
+            plan.append((PLACEHOLDERS.get(part, 'text'), part))
+    return tuple(plan)
+
 
 class FloatingWindow:
     """
     悬浮窗类
-    - 支持使用 {bpm} 和 {img} 占位符自定义显示格式。
-    - 支持加载并显示图片。
+    - 支持使用 {bpm}、{img} 以及 {avg}/{max}/{min} 等统计占位符自定义显示格式。
+    - 支持加载并显示图片，包括 GIF/APNG 动图以及随心跳脉冲的动画。
     """
     def __init__(self, heart_rate_monitor):
         self.heart_rate_monitor = heart_rate_monitor
@@ -24,15 +60,31 @@ class FloatingWindow:
         self.last_geometry = "200x80+100+100"
         self.display_format = "❤️{bpm}"
         self.image_path: Optional[str] = None
-        self.image_original: Optional[Image.Image] = None
-        self.image_tk: Optional[ImageTk.PhotoImage] = None
+        self.image_original: Optional['Image.Image'] = None
+        self.image_tk: Optional['ImageTk.PhotoImage'] = None
+        self.animation_mode = ANIMATION_AUTO
+        self.beat_source = BEAT_SOURCE_BPM
+        # 预解码的原始帧及每帧时长；_render_frames 为当前模式下实际要缩放显示的帧
+        self._decoded_frames: list['Image.Image'] = []
+        self._frame_durations: list[float] = []
+        self._render_frames: list['Image.Image'] = []
+        self._frames_tk: list['ImageTk.PhotoImage'] = []
+        self._animator: Optional[HeartAnimator] = None
+        # LRU 缓存: (目标高度, 是否高质量) -> 缩放后的全部帧
+        self._image_cache: "OrderedDict[tuple[int, bool], list[ImageTk.PhotoImage]]" = OrderedDict()
+        self._last_size: Optional[tuple[int, int]] = None
+        self._settle_after_id: Optional[str] = None
 
         self.unlocked_color = "#00FF00"
         self.locked_color = "#FF6600"
 
         self.content_frame: Optional[tk.Frame] = None
+        self.render_plan = compile_format(self.display_format)
         self.display_widgets: list[dict] = []
         self.bpm_label: Optional[tk.Label] = None
+        self._bpm_text = "--"
+        # 统计占位符名称 -> 文本
+        self._stat_texts: dict[str, str] = {}
 
     def create_window(self):
         """创建悬浮窗"""
@@ -45,7 +97,8 @@ class FloatingWindow:
         
         self.content_frame = tk.Frame(self.window, bg="black")
         self.content_frame.pack(expand=True, fill="both")
-        
+
+        self._animator = HeartAnimator(self.window, self._show_frame)
         self.rebuild_display()
         
         self.bind_events()
@@ -56,51 +109,127 @@ class FloatingWindow:
 
     def rebuild_display(self):
         """
-        根据 display_format 重新构建悬浮窗内容。
+        根据 display_format 的渲染计划同步悬浮窗内容。
+        已有的 Label 会按位置复用，只创建或销毁数量上的差额。
         """
         if not self.content_frame:
             return
 
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-        
-        self.display_widgets = []
-        self.bpm_label = None
+        plan = compile_format(self.display_format)
+        self.render_plan = plan
 
-        parts = re.split(r'({bpm}|{img})', self.display_format)
-
-        for part in parts:
-            if not part:
-                continue
-            
-            if part == "{bpm}":
-                label = tk.Label(self.content_frame, text="--")
-                label.pack(side=tk.LEFT, padx=0, pady=0)
-                self.bpm_label = label
-                self.display_widgets.append({'type': 'bpm', 'widget': label})
+        # 销毁多余的组件
+        while len(self.display_widgets) > len(plan):
+            self.display_widgets.pop()['widget'].destroy()
 
-            elif part == "{img}":
+        for index, (kind, text) in enumerate(plan):
+            if index < len(self.display_widgets):
+                item = self.display_widgets[index]
+            else:
                 label = tk.Label(self.content_frame)
                 label.pack(side=tk.LEFT, padx=0, pady=0)
-                self.display_widgets.append({'type': 'img', 'widget': label})
+                item = {'type': None, 'widget': label, 'text': None, 'font': None, 'image': None}
+                self.display_widgets.append(item)
+
+            if item['type'] != kind:
+                item['type'] = kind
+                # 类型变化时清空旧的文字/图片，交由后续步骤重新设置
+                if kind == 'img':
+                    self._set_item(item, text="")
+                else:
+                    self._set_item(item, image="")
+                item['font'] = None
+            if kind == 'text':
+                self._set_item(item, text=text)
+            elif kind == 'bpm':
+                self._set_item(item, text=self._bpm_text)
+            elif kind == 'stat':
+                self._set_item(item, text=self._stat_texts.get(text[1:-1], "--"))
+
+        self.bpm_label = next((i['widget'] for i in self.display_widgets if i['type'] == 'bpm'), None)
 
-            else:
-                label = tk.Label(self.content_frame, text=part)
-                label.pack(side=tk.LEFT, padx=0, pady=0)
-                self.display_widgets.append({'type': 'text', 'widget': label})
-        
         self._update_font_size()
         self.apply_lock_state()
         self.update_heart_rate(self.heart_rate_monitor.heart_rate)
 
+    @staticmethod
+    def _set_item(item: dict, **options):
+        """仅在值与上次不同时才调用 Tk 的 config，避免无谓的重绘"""
+        changed = {key: value for key, value in options.items() if item.get(key) != value}
+        if changed:
+            item['widget'].config(**changed)
+            item.update(changed)
 
     def bind_events(self):
         """绑定拖拽和大小调整事件"""
         if not self.window:
             return
-        self.window.bind("<Configure>", self._update_font_size)
-        
-    def _update_font_size(self, event=None):
+        self.window.bind("<Configure>", self._on_configure)
+
+    def _on_configure(self, event):
+        """
+        <Configure> 事件处理。
+        - 拖动窗口只改变位置，尺寸不变时直接返回，不做任何重绘。
+        - 尺寸变化时先用快速滤镜即时缩放，并在窗口稳定后补一次高质量缩放。
+        """
+        if not self.window or event.widget is not self.window:
+            return
+        size = (event.width, event.height)
+        if size == self._last_size:
+            return
+        self._last_size = size
+
+        self._update_font_size(high_quality=False)
+
+        if self._settle_after_id:
+            self.window.after_cancel(self._settle_after_id)
+        self._settle_after_id = self.window.after(RESIZE_SETTLE_MS, self._on_resize_settled)
+
+    def _on_resize_settled(self):
+        """窗口尺寸稳定后，使用高质量滤镜重新缩放图片"""
+        self._settle_after_id = None
+        self._update_font_size(high_quality=True)
+
+    def _get_scaled_frames(self, img_h: int, high_quality: bool) -> list['ImageTk.PhotoImage']:
+        """
+        从 LRU 缓存中获取指定高度的全部缩放帧，未命中时才真正执行缩放。
+        快速模式下若已有同高度的高质量结果，则直接复用。
+        """
+        if not self._render_frames:
+            return []
+        for key in ((img_h, True), (img_h, high_quality)):
+            cached = self._image_cache.get(key)
+            if cached is not None:
+                self._image_cache.move_to_end(key)
+                return cached
+
+        first = self._render_frames[0]
+        img_w = int(first.width * img_h / first.height)
+        if img_w <= 0:
+            return []
+        from PIL import Image, ImageTk
+        resample = Image.Resampling.LANCZOS if high_quality else Image.Resampling.NEAREST
+        photos = [ImageTk.PhotoImage(frame.resize((img_w, img_h), resample)) for frame in self._render_frames]
+
+        key = (img_h, high_quality)
+        self._image_cache[key] = photos
+        if high_quality:
+            # 高质量结果已就绪，同高度的快速版本不再需要
+            self._image_cache.pop((img_h, False), None)
+        while len(self._image_cache) > IMAGE_CACHE_SIZE:
+            self._image_cache.popitem(last=False)
+        return photos
+
+    def _show_frame(self, index: int):
+        """由动画调度器调用，切换到指定帧"""
+        if not self._frames_tk:
+            return
+        self.image_tk = self._frames_tk[index % len(self._frames_tk)]
+        for item in self.display_widgets:
+            if item['type'] == 'img':
+                self._set_item(item, image=self.image_tk)
+
+    def _update_font_size(self, high_quality: bool = True):
         """
         [核心修改]
         动态调整字体大小，并为不同类型的文本设置不同字体：
@@ -118,67 +247,140 @@ class FloatingWindow:
         # 为其他文本（包括Emoji）使用默认字体，只改变大小
         text_font = ("TkDefaultFont", new_size)
 
-        if self.image_original and "{img}" in self.display_format:
+        frames_tk: list['ImageTk.PhotoImage'] = []
+        if self._render_frames and any(kind == 'img' for kind, _ in self.render_plan):
             try:
                 img_h = int(height * 0.5)
                 if img_h > 0:
-                    ratio = img_h / self.image_original.height
-                    img_w = int(self.image_original.width * ratio)
-                    if img_w > 0:
-                        resized_img = self.image_original.resize((img_w, img_h), Image.Resampling.LANCZOS)
-                        self.image_tk = ImageTk.PhotoImage(resized_img)
+                    frames_tk = self._get_scaled_frames(img_h, high_quality)
             except Exception as e:
-                self.image_tk = None
                 self.heart_rate_monitor.log_message(f"图片缩放失败: {e}")
-        else:
-            self.image_tk = None
+        if frames_tk is not self._frames_tk:
+            restart = len(frames_tk) != len(self._frames_tk)
+            self._frames_tk = frames_tk
+            if self._animator and restart:
+                self._configure_animator()
+        index = self._animator.current_index() if self._animator else 0
+        self.image_tk = frames_tk[index % len(frames_tk)] if frames_tk else None
 
-        # 遍历所有组件，应用新的字体大小和图片
+        # 遍历所有组件，应用新的字体大小和图片（值未变化的组件不会触发 Tk 调用）
         for item in self.display_widgets:
             widget_type = item['type']
-            widget = item['widget']
             if widget_type == 'img':
-                widget.config(image=self.image_tk)
-            elif widget_type == 'bpm':
+                self._set_item(item, image=self.image_tk or "")
+            elif widget_type in ('bpm', 'stat'):
                 # 只对心率数字应用特殊字体
-                widget.config(font=bpm_font)
+                self._set_item(item, font=bpm_font)
             elif widget_type == 'text':
                 # 对普通文本和Emoji应用默认字体
-                widget.config(font=text_font)
+                self._set_item(item, font=text_font)
 
     def set_image(self, path: Optional[str]):
-        """设置并加载图片"""
+        """设置并加载图片，所有帧在此一次性解码"""
         self.image_path = path
+        self._decoded_frames = []
+        self._frame_durations = []
         if path:
             try:
-                self.image_original = Image.open(path)
+                from PIL import Image
+                with Image.open(path) as img:
+                    self._decoded_frames, self._frame_durations = decode_frames(img)
+                self.image_original = self._decoded_frames[0]
+                if len(self._decoded_frames) > 1:
+                    self.heart_rate_monitor.log_message(f"已解码动图，共 {len(self._decoded_frames)} 帧")
             except Exception as e:
                 self.image_original = None
                 self.heart_rate_monitor.log_message(f"加载图片失败: {e}")
         else:
             self.image_original = None
-        
+        self._prepare_render_frames()
+
+        # 图片变化不影响布局，只需刷新图片组件
         if self.is_open():
-            self.rebuild_display()
+            self._update_font_size()
+
+    def set_animation(self, mode: str, beat_source: str):
+        """设置动画模式（auto/pulse/off）及脉冲节拍来源（bpm/rr）"""
+        if (mode, beat_source) == (self.animation_mode, self.beat_source):
+            return
+        pulse_changed = (mode == ANIMATION_PULSE) != (self.animation_mode == ANIMATION_PULSE)
+        self.animation_mode = mode
+        self.beat_source = beat_source
+        if pulse_changed:
+            self._prepare_render_frames()
+            if self.is_open():
+                self._update_font_size()
+        elif self._animator:
+            self._configure_animator()
+
+    def _prepare_render_frames(self):
+        """根据当前模式准备待缩放的帧，并使缩放缓存失效"""
+        self._image_cache.clear()
+        self._frames_tk = []
+        if not self._decoded_frames:
+            self._render_frames = []
+        elif self.animation_mode == ANIMATION_PULSE:
+            self._render_frames = build_pulse_frames(self._decoded_frames)
+        else:
+            self._render_frames = self._decoded_frames
+        if self._animator:
+            self._configure_animator()
+
+    def _configure_animator(self):
+        """把当前帧数、帧时长和模式交给调度器"""
+        if not self._animator:
+            return
+        durations = self._frame_durations if self._render_frames is self._decoded_frames else []
+        self._animator.configure(len(self._frames_tk), durations, self.animation_mode, self.beat_source)
 
     def update_format(self, new_format: str):
         """更新显示格式"""
+        if new_format == self.display_format and self.display_widgets:
+            return
         self.display_format = new_format
+        self.render_plan = compile_format(new_format)
         if self.is_open():
             self.rebuild_display()
 
-    def update_heart_rate(self, heart_rate):
-        """只更新心率数字Label的文本"""
-        if self.is_open() and self.bpm_label:
-            text = str(heart_rate) if heart_rate > 0 else "--"
-            self.bpm_label.config(text=text)
+    def update_heart_rate(self, heart_rate, rr_intervals: Optional[list[float]] = None):
+        """只更新心率数字Label的文本，文本未变化时不调用 Tk"""
+        if self._animator:
+            self._animator.set_heart_rate(heart_rate, rr_intervals)
+        text = str(heart_rate) if heart_rate > 0 else "--"
+        if text == self._bpm_text:
+            return
+        self._bpm_text = text
+        if self.is_open():
+            for item in self.display_widgets:
+                if item['type'] == 'bpm':
+                    self._set_item(item, text=text)
+
+    def update_stats(self, texts: dict[str, str]):
+        """更新统计占位符的文本（见 SessionStats.format_values），文本未变化的 Label 不调用 Tk"""
+        self._stat_texts = texts
+        if not self.is_open():
+            return
+        for item, (kind, text) in zip(self.display_widgets, self.render_plan):
+            if kind == 'stat':
+                self._set_item(item, text=texts.get(text[1:-1], "--"))
             
     def close_window(self):
         """关闭悬浮窗"""
         if self.window:
             self.last_geometry = self.window.geometry()
+            if self._settle_after_id:
+                self.window.after_cancel(self._settle_after_id)
+                self._settle_after_id = None
+            self._last_size = None
+            if self._animator:
+                self._animator.stop()
+                self._animator = None
+            self._frames_tk = []
             self.window.destroy()
             self.window = None
+            self.content_frame = None
+            self.display_widgets = []
+            self.bpm_label = None
             self.heart_rate_monitor.floating_window_closed()
             
     def is_open(self):
@@ -211,8 +413,8 @@ class FloatingWindow:
         for item in self.display_widgets:
             widget = item['widget']
             widget.config(bg="black")
-            if item['type'] in ['text', 'bpm']:
-                if item['type'] == 'bpm':
+            if item['type'] in ['text', 'bpm', 'stat']:
+                if item['type'] in ['bpm', 'stat']:
                     widget.config(fg=color)
                 else:
                     widget.config(fg=self.unlocked_color)
@@ -1,14 +1,56 @@
 # heart_rate_tool.py
 
-import asyncio
-from bleak import BleakClient, BleakScanner
-from bleak.backends.characteristic import BleakGATTCharacteristic
+from typing import Optional, TYPE_CHECKING
+
+# asyncio 和 bleak 只在真正扫描或连接时才导入，GUI 启动时只需要解析函数
+if TYPE_CHECKING:
+    from bleak import BleakClient
+    from bleak.backends.characteristic import BleakGATTCharacteristic
 
 # 心率值全局变量
 heart_rate = 0
 
+# 解析 Heart Rate Measurement (0x2A37) 特征值
+def parse_heart_rate_measurement(data: bytes) -> tuple[int, list[float]]:
+    """
+    按蓝牙心率规范解析通知数据。
+
+    Returns:
+        tuple[int, list[float]]: 心率值，以及本次通知携带的 RR 间期列表（秒）。
+    """
+    if len(data) < 2:
+        hex_data = data.hex()
+        value = int(hex_data.split('06')[1], 16) if '06' in hex_data else 0
+        return value, []
+
+    flags = data[0]
+    if flags & 0x01:
+        value = int.from_bytes(data[1:3], byteorder='little')
+        offset = 3
+    else:
+        value = data[1]
+        offset = 2
+    # Energy Expended 字段（2字节）
+    if flags & 0x08:
+        offset += 2
+    rr_intervals = []
+    if flags & 0x10:
+        while offset + 1 < len(data):
+            rr_intervals.append(int.from_bytes(data[offset:offset + 2], byteorder='little') / 1024.0)
+            offset += 2
+    return value, rr_intervals
+
+def parse_sensor_contact(data: bytes) -> Optional[bool]:
+    """
+    读取标志位中的皮肤接触状态（bit2: 支持接触检测，bit1: 已接触）。
+    设备不支持接触检测时返回 None。
+    """
+    if len(data) < 2 or not data[0] & 0x04:
+        return None
+    return bool(data[0] & 0x02)
+
 # 通知回调处理函数
-def notification_handler(characteristic: BleakGATTCharacteristic, data: bytearray):
+def notification_handler(characteristic: 'BleakGATTCharacteristic', data: bytearray):
     global heart_rate
     try:
         heart_rate = int(data.hex().split('06')[1], 16)
@@ -17,7 +59,7 @@ def notification_handler(characteristic: BleakGATTCharacteristic, data: bytearra
         print(f"解析心率失败: {e}")
 
 # 查找“Heart Rate Measurement”特征 UUID
-async def find_heart_rate_measurement_uuid(client: BleakClient):
+async def find_heart_rate_measurement_uuid(client: 'BleakClient'):
     for service in client.services:
         for characteristic in service.characteristics:
             if "Heart Rate Measurement" in characteristic.description:
@@ -26,6 +68,7 @@ async def find_heart_rate_measurement_uuid(client: BleakClient):
 
 # 扫描蓝牙设备，供用户选择，返回 MAC 地址
 async def scan_and_select_device() -> str:
+    from bleak import BleakScanner
     print("正在扫描附近的蓝牙设备，请稍候...")
     devices = await BleakScanner.discover()
     if not devices:
@@ -44,6 +87,8 @@ async def scan_and_select_device() -> str:
 
 # 主函数：连接设备并获取心率
 async def get_heart_rate(mac: str):
+    import asyncio
+    from bleak import BleakClient
     if not mac:
         print("MAC地址无效。")
         return
@@ -0,0 +1,188 @@
+# heart_animation.py
+
+import time
+from collections import deque
+from typing import Callable, Optional, TYPE_CHECKING
+
+# PIL 只在真正解码图片时才导入
+if TYPE_CHECKING:
+    from PIL import Image
+
+# 动画模式
+ANIMATION_AUTO = "auto"    # 动图按自身帧率循环播放，静态图不动
+ANIMATION_PULSE = "pulse"  # 随心跳脉冲
+ANIMATION_OFF = "off"      # 始终显示第一帧
+
+# 脉冲的节拍来源
+BEAT_SOURCE_BPM = "bpm"    # 按当前心率推算节拍
+BEAT_SOURCE_RR = "rr"      # 使用设备上报的真实 RR 间期
+
+# 静态图片脉冲时各帧的缩放比例，第 0 帧为静息状态
+PULSE_SCALES = (1.0, 1.08, 1.15, 1.08)
+# 一次脉冲动画的最长持续时间（秒），其余时间保持静息帧
+PULSE_MAX_DURATION = 0.25
+# 动图单帧的最短显示时间（秒），防止异常的 0ms 帧把 CPU 跑满
+MIN_FRAME_DURATION = 0.02
+
+
+def decode_frames(image: 'Image.Image') -> tuple[list['Image.Image'], list[float]]:
+    """
+    一次性解码图片的所有帧（支持 GIF/APNG/WebP 动图）。
+
+    Returns:
+        tuple[list[Image.Image], list[float]]: RGBA 帧列表及每帧显示时长（秒）。
+    """
+    from PIL import ImageSequence
+    frames = []
+    durations = []
+    for frame in ImageSequence.Iterator(image):
+        frames.append(frame.convert("RGBA"))
+        duration = frame.info.get("duration") or 100
+        durations.append(max(MIN_FRAME_DURATION, duration / 1000.0))
+    if not frames:
+        frames.append(image.convert("RGBA"))
+        durations.append(0.1)
+    return frames, durations
+
+
+def build_pulse_frames(frames: list['Image.Image']) -> list['Image.Image']:
+    """
+    生成一次心跳的脉冲帧。
+    - 动图：直接使用其帧序列，在一次脉冲内播放完毕。
+    - 静态图：按 PULSE_SCALES 生成放大帧，并居中放到同一尺寸的透明画布上，避免布局抖动。
+    """
+    from PIL import Image
+    if len(frames) > 1:
+        return frames
+    base = frames[0]
+    canvas_w = int(base.width * max(PULSE_SCALES))
+    canvas_h = int(base.height * max(PULSE_SCALES))
+    pulse_frames = []
+    for scale in PULSE_SCALES:
+        w = max(1, int(base.width * scale))
+        h = max(1, int(base.height * scale))
+        canvas = Image.new("RGBA", (canvas_w, canvas_h), (0, 0, 0, 0))
+        canvas.paste(base.resize((w, h), Image.Resampling.LANCZOS), ((canvas_w - w) // 2, (canvas_h - h) // 2))
+        pulse_frames.append(canvas)
+    return pulse_frames
+
+
+class HeartAnimator:
+    """
+    悬浮窗图片动画的唯一调度器。
+    所有帧都由调用方预先解码并缩放好，这里只负责决定"何时显示第几帧"。
+    调度器每次只挂起一个 after 定时器，并按下一次画面变化的时间动态调整间隔；
+    脉冲模式在两次心跳之间只保留一个定时器，无心率时完全停止。
+    """
+    def __init__(self, tk_widget, show_frame: Callable[[int], None]):
+        self.tk_widget = tk_widget
+        self.show_frame = show_frame
+        self.mode = ANIMATION_AUTO
+        self.beat_source = BEAT_SOURCE_BPM
+
+        self._frame_count = 1
+        self._durations: list[float] = [0.1]
+        self._index = 0
+        self._after_id: Optional[str] = None
+
+        self._bpm = 0
+        self._rr_pending: deque[float] = deque(maxlen=8)
+        self._pulse_step = 0
+        self._beat_at = 0.0
+        self._period = 0.0
+
+    def configure(self, frame_count: int, durations: list[float], mode: str, beat_source: str):
+        """设置帧数、帧时长和动画模式，必要时重启调度"""
+        self._frame_count = max(1, frame_count)
+        self._durations = durations or [0.1] * self._frame_count
+        self.mode = mode
+        self.beat_source = beat_source
+        self.stop()
+        self._index = 0
+        self._pulse_step = 0
+        self.show_frame(0)
+        self._kick()
+
+    def set_heart_rate(self, bpm: int, rr_intervals: Optional[list[float]] = None):
+        """更新节拍信息；若脉冲调度处于空闲状态则立即恢复"""
+        self._bpm = bpm
+        if rr_intervals:
+            self._rr_pending.extend(rr_intervals)
+        if bpm <= 0:
+            self._rr_pending.clear()
+        self._kick()
+
+    def current_index(self) -> int:
+        """当前应显示的帧序号"""
+        return self._index if self._effective_mode() == ANIMATION_AUTO else self._pulse_step
+
+    def stop(self):
+        """取消挂起的定时器"""
+        if self._after_id:
+            try:
+                self.tk_widget.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _effective_mode(self) -> str:
+        if self.mode == ANIMATION_PULSE:
+            return ANIMATION_PULSE
+        if self.mode == ANIMATION_AUTO and self._frame_count > 1:
+            return ANIMATION_AUTO
+        return ANIMATION_OFF
+
+    def _kick(self):
+        """调度器空闲且有事可做时，安排下一次 tick"""
+        if self._after_id:
+            return
+        mode = self._effective_mode()
+        if mode == ANIMATION_AUTO:
+            self._schedule(self._durations[self._index])
+        elif mode == ANIMATION_PULSE and self._bpm > 0 and self._frame_count > 1:
+            self._schedule(0)
+
+    def _schedule(self, delay: float):
+        self._after_id = self.tk_widget.after(max(1, int(delay * 1000)), self._tick)
+
+    def _next_period(self) -> Optional[float]:
+        """下一次心跳的间隔（秒）"""
+        if self.beat_source == BEAT_SOURCE_RR and self._rr_pending:
+            return self._rr_pending.popleft()
+        if self._bpm > 0:
+            return 60.0 / self._bpm
+        return None
+
+    def _tick(self):
+        self._after_id = None
+        mode = self._effective_mode()
+        now = time.monotonic()
+
+        if mode == ANIMATION_AUTO:
+            self._index = (self._index + 1) % self._frame_count
+            self.show_frame(self._index)
+            self._schedule(self._durations[self._index])
+            return
+
+        if mode != ANIMATION_PULSE or self._frame_count < 2:
+            return
+
+        if self._pulse_step == 0:
+            # 新的一拍开始
+            period = self._next_period()
+            if period is None:
+                self.show_frame(0)
+                return
+            self._beat_at = now
+            self._period = period
+
+        self._pulse_step += 1
+        if self._pulse_step < self._frame_count:
+            self.show_frame(self._pulse_step)
+            pulse_duration = min(PULSE_MAX_DURATION, self._period * 0.5)
+            self._schedule(pulse_duration / self._frame_count)
+        else:
+            # 脉冲结束，回到静息帧并一直等到下一拍
+            self._pulse_step = 0
+            self.show_frame(0)
+            self._schedule(self._beat_at + self._period - now)
@@ -1,34 +1,66 @@
 # heart_rate_display_ui.py
 
-import asyncio
-import threading
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, colorchooser, filedialog
 import sys
+import os
 import queue
+import time
 from datetime import datetime
-import json
-from urllib import request, error
+from typing import TYPE_CHECKING
 
-from get_heart_rate.heart_rate_tool import get_heart_rate, scan_and_select_device
-from config import save_config, load_config
+# 只导入启动时必需的模块；bleak、PIL、websockets、各服务器和 Webhook 界面
+# 都在对应功能第一次被启用时才导入
+from get_heart_rate.heart_rate_tool import parse_heart_rate_measurement, parse_sensor_contact
+from config import save_config, load_config, flush_config
 from floating_window import FloatingWindow
+import metrics
+from profiling import PROFILER
+from runtime import AsyncRuntime, TkBridge
+from heart_animation import ANIMATION_AUTO, ANIMATION_PULSE, ANIMATION_OFF, BEAT_SOURCE_BPM, BEAT_SOURCE_RR
 from vrc_osc import VrcOscClient
-from api_server import ApiServer
-from websocket_server import WebSocketServer # [新增] 导入WebSocket服务器
 from webhook_manager import WebhookManager
-from webhook_ui import WebhookWindow
+from hr_filter import HeartRateFilter
+from alerts import AlertEngine, ALERT_TRIGGERS
+from session_stats import SessionStats
+from snapshot import Snapshot, SnapshotHolder
+from sinks import (
+    SinkManager, WebhookSink, OscSink, WebSocketSink,
+    EVENT_CONNECTED, EVENT_DISCONNECTED, capture_sample, status_event,
+)
+
+if TYPE_CHECKING:
+    import concurrent.futures
+
+
+# 悬浮窗动画选项: 显示文本 -> (动画模式, 节拍来源)
+ANIMATION_OPTIONS = {
+    "自动播放动图": (ANIMATION_AUTO, BEAT_SOURCE_BPM),
+    "随心跳脉冲 (心率)": (ANIMATION_PULSE, BEAT_SOURCE_BPM),
+    "随心跳脉冲 (RR间期)": (ANIMATION_PULSE, BEAT_SOURCE_RR),
+    "关闭动画": (ANIMATION_OFF, BEAT_SOURCE_BPM),
+}
+
+
+# 设置为 1 时，主窗口显示后立即打印启动耗时并退出（供 benchmarks/bench_startup.py 使用）
+STARTUP_BENCH_ENV = "HRM_STARTUP_BENCH"
 
 
 class HeartRateMonitor:
-    def __init__(self):
+    def __init__(self, started_at: float = None):
+        # 进程启动时间（perf_counter），由 main.py 在导入任何模块之前记录
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.window_shown_after = None
+        self.first_sample_after = None
         self.heart_rate = 0
+        # 当前状态的只读快照（心率、连接状态、最近样本、统计），供 API/WebSocket 等其他线程无锁读取
+        self.state = SnapshotHolder()
         self.connected = False
         self.current_mac = ""
-        self.ble_task = None
-        self.ble_loop = None
-        self.ble_thread = None
         self.should_stop = False
+        # 唯一的后台事件循环：BLE、WebSocket、API、OSC 都是其中的任务，阻塞操作交给它的线程池。
+        # 第一次扫描、连接、开启服务器或 OSC 时才启动（见 runtime.py），不使用这些功能时不导入 asyncio
+        self.runtime = AsyncRuntime(self.log_message)
         
         self.api_server = None
         self.websocket_server = None # [新增] WebSocket服务器实例
@@ -36,15 +68,37 @@ class HeartRateMonitor:
         self.floating_window = FloatingWindow(self)
         
         self.log_queue = queue.Queue()
-        self.vrc_osc_client = VrcOscClient(self.log_message)
+        self.vrc_osc_client = VrcOscClient(self.log_message, self.runtime)
         self.vrc_connected = False
+        # 额外的 OSC 目标（如本地 OSC 路由、灯光控制），仅通过 config.json 配置
+        self.vrc_extra_targets = []
         
         self.heart_rate_queue = queue.Queue()
+        # 解析与分发之间的滤波（剔除尖峰、平滑），参数来自 config.json 的 "filter"
+        self.hr_filter = HeartRateFilter()
+        metrics.HEART_RATE_QUEUE_DEPTH.set_function(self.heart_rate_queue.qsize)
+        metrics.LOG_QUEUE_DEPTH.set_function(self.log_queue.qsize)
         
         self.webhook_manager = WebhookManager(self.log_message)
+        self.webhook_manager.executor = self.runtime.executor
         self.webhook_window = None
+
+        # 各输出端有独立的队列，BLE 回调只负责入队；OSC/WebSocket/Webhook 在事件循环中处理，其余在各自的线程中
+        self.sinks = SinkManager(self.log_message, self.runtime)
+        # 1 分钟 / 10 分钟 / 会话的平均、最小、最大心率，随样本增量更新
+        self.session_stats = SessionStats()
+        self.sinks.add(WebhookSink(self.webhook_manager, self.session_stats))
+        # 历史记录（可选，config.json 的 "history"），见 history.py
+        self.history = None
+        # 提醒规则（config.json 的 "alerts"），随样本增量计算
+        self.alert_engine = AlertEngine(self.log_message)
+        self.sinks.add(OscSink(self.vrc_osc_client, self.alert_engine))
         
         self.setup_ui()
+        # 其他线程只能通过 bridge 在 Tk 主线程中执行回调
+        self.bridge = TkBridge(self.root)
+        # 供性能分析在 Tk 主线程中开启/关闭 cProfile
+        PROFILER.register_thread_hook("tk", self.bridge.post)
         
         self.update_logs()
         self.update_heart_rate_display()
@@ -61,13 +115,18 @@ class HeartRateMonitor:
         # [新增] WebSocket UI变量
         self.websocket_server_enabled = tk.BooleanVar(value=False)
         self.websocket_port_var = tk.StringVar(value="8001")
+        # 与 API 服务器共用一个端口（同一个监听 socket 处理 HTTP 和 WebSocket 升级）
+        self.websocket_shared_var = tk.BooleanVar(value=False)
         
         self.api_server_enabled = tk.BooleanVar(value=False)
         self.api_port_var = tk.StringVar(value="8000")
         self.vrc_ip_var = tk.StringVar(value="127.0.0.1")
         self.vrc_port_var = tk.StringVar(value="9000")
+        self.vrc_chatbox_var = tk.BooleanVar(value=True)
+        self.vrc_avatar_params_var = tk.BooleanVar(value=True)
         self.format_var = tk.StringVar(value="❤️{bpm}")
         self.image_path_var = tk.StringVar(value="未选择图片")
+        self.animation_var = tk.StringVar(value="自动播放动图")
         
         main_frame = ttk.Frame(self.root, padding="10")
         main_frame.grid(row=0, column=0, sticky="nsew")
@@ -121,10 +180,14 @@ class HeartRateMonitor:
         ttk.Entry(vrc_frame, textvariable=self.vrc_ip_var).grid(row=0, column=1, sticky="ew", padx=5)
         ttk.Label(vrc_frame, text="端口:").grid(row=1, column=0, sticky=tk.W, pady=(5,0))
         ttk.Entry(vrc_frame, textvariable=self.vrc_port_var).grid(row=1, column=1, sticky="ew", padx=5, pady=(5,0))
+        vrc_options_frame = ttk.Frame(vrc_frame)
+        vrc_options_frame.grid(row=2, column=0, columnspan=2, sticky="ew", pady=(5,0))
+        ttk.Checkbutton(vrc_options_frame, text="聊天框", variable=self.vrc_chatbox_var, command=self.apply_vrc_options).pack(side=tk.LEFT)
+        ttk.Checkbutton(vrc_options_frame, text="Avatar 参数", variable=self.vrc_avatar_params_var, command=self.apply_vrc_options).pack(side=tk.LEFT, padx=(10,0))
         self.vrc_connect_button = ttk.Button(vrc_frame, text="连接 OSC", command=self.toggle_vrc_connection)
-        self.vrc_connect_button.grid(row=2, column=0, columnspan=2, sticky="ew", pady=(10,0))
+        self.vrc_connect_button.grid(row=3, column=0, columnspan=2, sticky="ew", pady=(10,0))
         self.vrc_status_label = ttk.Label(vrc_frame, text="状态: 未连接", font=("Arial", 10), foreground="gray")
-        self.vrc_status_label.grid(row=3, column=0, columnspan=2, sticky="w", pady=(5,0))
+        self.vrc_status_label.grid(row=4, column=0, columnspan=2, sticky="w", pady=(5,0))
         
         # [新增] WebSocket 服务器 UI
         websocket_frame = ttk.LabelFrame(middle_column_frame, text="WebSocket服务器 (实时推送)", padding="10")
@@ -134,8 +197,10 @@ class HeartRateMonitor:
         ttk.Checkbutton(websocket_frame, text="启用WebSocket服务器", variable=self.websocket_server_enabled).grid(row=0, column=0, sticky=tk.W, columnspan=2)
         ttk.Label(websocket_frame, text="端口:").grid(row=1, column=0, sticky=tk.W, pady=(5,0))
         ttk.Entry(websocket_frame, textvariable=self.websocket_port_var, width=10).grid(row=1, column=1, sticky="ew", padx=5, pady=(5,0))
+        self.websocket_shared_var.trace_add("write", self._restart_websocket_server)
+        ttk.Checkbutton(websocket_frame, text="与API服务器共用端口", variable=self.websocket_shared_var).grid(row=2, column=0, sticky=tk.W, columnspan=2, pady=(5,0))
         self.websocket_status_label = ttk.Label(websocket_frame, text="状态: 已禁用", font=("Arial", 10), foreground="gray")
-        self.websocket_status_label.grid(row=2, column=0, columnspan=2, sticky="w", pady=(5,0))
+        self.websocket_status_label.grid(row=3, column=0, columnspan=2, sticky="w", pady=(5,0))
 
         api_frame = ttk.LabelFrame(middle_column_frame, text="心率API服务器 (被动获取)", padding="10")
         api_frame.pack(fill="x", pady=PAD_Y)
@@ -182,8 +247,12 @@ class HeartRateMonitor:
         ttk.Label(format_frame, text="{bpm}: 心率, {img}: 图片", foreground="gray").grid(row=1, column=1, sticky="w", pady=(5,0))
         ttk.Label(format_frame, text="图片:").grid(row=2, column=0, sticky=tk.W, pady=(5,0), padx=(0,5))
         ttk.Label(format_frame, textvariable=self.image_path_var, wraplength=160, justify=tk.LEFT, foreground="blue").grid(row=2, column=1, sticky="ew", pady=(5,0))
+        ttk.Label(format_frame, text="动画:").grid(row=3, column=0, sticky=tk.W, pady=(5,0), padx=(0,5))
+        animation_combo = ttk.Combobox(format_frame, textvariable=self.animation_var, values=list(ANIMATION_OPTIONS), state="readonly")
+        animation_combo.grid(row=3, column=1, sticky="ew", pady=(5,0))
+        animation_combo.bind("<<ComboboxSelected>>", self.apply_animation)
         btn_subframe = ttk.Frame(format_frame)
-        btn_subframe.grid(row=3, column=0, columnspan=2, pady=(10,0), sticky="ew")
+        btn_subframe.grid(row=4, column=0, columnspan=2, pady=(10,0), sticky="ew")
         btn_subframe.columnconfigure((0,1,2), weight=1)
         ttk.Button(btn_subframe, text="选择图片...", command=self.choose_image).grid(row=0, column=0, sticky='ew', padx=(0,5))
         ttk.Button(btn_subframe, text="清除图片", command=self.clear_image).grid(row=0, column=1, sticky='ew', padx=5)
@@ -201,16 +270,16 @@ class HeartRateMonitor:
         if self.webhook_window and self.webhook_window.winfo_exists():
             self.webhook_window.focus()
             return
+        from webhook_ui import WebhookWindow
         self.webhook_window = WebhookWindow(self.root, self.webhook_manager)
 
     def choose_image(self):
         filepath = filedialog.askopenfilename(
             title="选择一张图片",
-            filetypes=[("图片文件", "*.png *.gif *.jpg *.jpeg"), ("所有文件", "*.*")]
+            filetypes=[("图片文件", "*.png *.apng *.gif *.webp *.jpg *.jpeg"), ("所有文件", "*.*")]
         )
         if filepath:
             self.floating_window.set_image(filepath)
-            import os
             self.image_path_var.set(os.path.basename(filepath))
             self.log_message(f"已选择图片: {filepath}")
 
@@ -224,6 +293,11 @@ class HeartRateMonitor:
         self.floating_window.update_format(new_format)
         self.log_message(f"已应用新格式: {new_format}")
 
+    def apply_animation(self, event=None):
+        mode, beat_source = ANIMATION_OPTIONS.get(self.animation_var.get(), (ANIMATION_AUTO, BEAT_SOURCE_BPM))
+        self.floating_window.set_animation(mode, beat_source)
+        self.log_message(f"悬浮窗动画: {self.animation_var.get()}")
+
     def choose_unlocked_color(self):
         color_code = colorchooser.askcolor(title="选择解锁时的字体颜色", initialcolor=self.floating_window.unlocked_color)
         if color_code and color_code[1]:
@@ -259,29 +333,33 @@ class HeartRateMonitor:
         self.root.after(100, self.update_logs)
 
     def update_heart_rate_display(self):
+        received = False
         try:
             while True:
-                heart_rate = self.heart_rate_queue.get_nowait()
+                sample = self.heart_rate_queue.get_nowait()
+                received = True
+                heart_rate, rr_intervals = sample.heart_rate, sample.rr_intervals
                 self.heart_rate = heart_rate
+                if heart_rate > 0 and self.first_sample_after is None:
+                    self._mark_first_sample()
                 self.heart_rate_label.config(text=f"心率: {heart_rate}")
 
-                if heart_rate > 0:
-                    self.webhook_manager.trigger_event("heart_rate_updated", heart_rate)
-                
-                # [修改] 增加WebSocket广播
-                if self.websocket_server:
-                    self.websocket_server.broadcast()
-
+                # Webhook、WebSocket、OSC 等输出端已由 BLE 回调直接发布，这里只更新界面
                 if heart_rate > 0:
                     self.heart_rate_label.config(fg="green")
-                    if self.vrc_connected:
-                        self.vrc_osc_client.send_heart_rate(heart_rate)
                 else:
                     self.heart_rate_label.config(fg="red")
                 if self.floating_window.is_open():
-                    self.floating_window.update_heart_rate(heart_rate)
+                    self.floating_window.update_heart_rate(heart_rate, rr_intervals)
         except queue.Empty:
             pass
+        if received:
+            self.floating_window.update_stats(self.session_stats.format_values())
+        # 与时间相关的提醒（无数据、持续过高）需要在没有新样本时也能触发
+        if self.connected and self.alert_engine.has_rules():
+            for alert in self.alert_engine.tick(time.monotonic()):
+                event = status_event(alert.kind, self.heart_rate, True, self._last_seq(), self.current_mac)
+                self._publish_alert(event._replace(detail=alert.detail))
         self.root.after(500, self.update_heart_rate_display)
 
     def clear_logs(self):
@@ -290,11 +368,18 @@ class HeartRateMonitor:
     # [新增] 启动/停止 WebSocket 服务器
     def toggle_websocket_server(self, *args):
         if self.websocket_server_enabled.get():
+            self._stop_websocket_server()
             try:
-                port = int(self.websocket_port_var.get())
-                self.websocket_server = WebSocketServer(self, port, self.log_message)
+                shared = self.websocket_shared_var.get()
+                port = int(self.api_port_var.get() if shared else self.websocket_port_var.get())
+                from websocket_server import WebSocketServer
+                self.websocket_server = WebSocketServer(self, port, self.log_message, shared=shared)
                 self.websocket_server.start()
-                self.websocket_status_label.config(text=f"状态: 运行于 ws://127.0.0.1:{port}", foreground="green")
+                self.sinks.add(WebSocketSink(self.websocket_server))
+                if shared:
+                    self._attach_shared_websocket()
+                else:
+                    self.websocket_status_label.config(text=f"状态: 运行于 ws://127.0.0.1:{port}", foreground="green")
             except ValueError:
                 self.log_message("WebSocket服务器启动失败：端口号必须是有效的数字。")
                 self.websocket_status_label.config(text="状态: 端口号无效", foreground="red")
@@ -305,19 +390,44 @@ class HeartRateMonitor:
                 self.websocket_server_enabled.set(False)
 
         else:
-            if self.websocket_server:
-                self.websocket_server.stop()
-                self.websocket_server = None
+            self._stop_websocket_server()
             self.websocket_status_label.config(text="状态: 已禁用", foreground="gray")
+
+    def _stop_websocket_server(self):
+        if self.websocket_server:
+            if self.api_server and self.api_server.websocket is self.websocket_server:
+                self.api_server.websocket = None
+            self.sinks.remove(WebSocketSink.name)
+            self.websocket_server.stop()
+            self.websocket_server = None
+
+    def _restart_websocket_server(self, *args):
+        """切换是否共用端口后，按新的方式重新启动已开启的 WebSocket 服务器"""
+        if self.websocket_server_enabled.get():
+            self.toggle_websocket_server()
+
+    def _attach_shared_websocket(self):
+        """共用端口时把 WebSocket 服务器交给正在运行的 API 服务器，并刷新状态显示"""
+        server = self.websocket_server
+        if not server or not server.shared:
+            return
+        if self.api_server and self.api_server.httpd:
+            self.api_server.websocket = server
+            server.port = self.api_server.port
+            self.websocket_status_label.config(text=f"状态: 运行于 ws://127.0.0.1:{server.port} (与API共用)", foreground="green")
+        else:
+            self.websocket_status_label.config(text="状态: 等待API服务器启动", foreground="orange")
             
     def toggle_api_server(self, *args):
         if self.api_server_enabled.get():
             try:
                 port = int(self.api_port_var.get())
+                from api_server import ApiServer
                 self.api_server = ApiServer(self, port)
                 self.api_server.start()
                 if self.api_server and self.api_server.httpd:
                     self.api_status_label.config(text=f"状态: 运行于 http://127.0.0.1:{port}", foreground="green")
+                    self._attach_shared_websocket()
                 else:
                     self.api_status_label.config(text="状态: 启动失败", foreground="red")
                     self.api_server_enabled.set(False)
@@ -330,6 +440,7 @@ class HeartRateMonitor:
                 self.api_server.stop()
                 self.api_server = None
             self.api_status_label.config(text="状态: 已禁用", foreground="gray")
+            self._attach_shared_websocket()
 
     def save_settings(self):
         self.webhook_manager.save_webhooks() 
@@ -348,10 +459,15 @@ class HeartRateMonitor:
                 "locked_color": self.floating_window.locked_color,
                 "format": self.format_var.get(),
                 "image_path": self.floating_window.image_path,
+                "animation_mode": self.floating_window.animation_mode,
+                "beat_source": self.floating_window.beat_source,
             },
             "vrc_osc": {
                 "ip": self.vrc_ip_var.get(),
-                "port": self.vrc_port_var.get()
+                "port": self.vrc_port_var.get(),
+                "chatbox": self.vrc_chatbox_var.get(),
+                "avatar_params": self.vrc_avatar_params_var.get(),
+                "targets": self.vrc_extra_targets
             },
             "api_server": {
                 "enabled": self.api_server_enabled.get(),
@@ -360,9 +476,13 @@ class HeartRateMonitor:
             # [新增] 保存 WebSocket 设置
             "websocket_server": {
                 "enabled": self.websocket_server_enabled.get(),
-                "port": self.websocket_port_var.get()
+                "port": self.websocket_port_var.get(),
+                "shared_port": self.websocket_shared_var.get()
             }
         }
+        # 保留只能在 config.json 中手动配置的部分（如 "filter"、"sinks"）
+        for key, value in load_config().items():
+            config.setdefault(key, value)
         save_config(config)
         self.log_message("设置已保存到 config.json")
 
@@ -392,8 +512,12 @@ class HeartRateMonitor:
             image_path = window_settings.get("image_path")
             self.format_var.set(format_str)
             self.floating_window.update_format(format_str)
+            animation = (window_settings.get("animation_mode", ANIMATION_AUTO), window_settings.get("beat_source", BEAT_SOURCE_BPM))
+            for label, option in ANIMATION_OPTIONS.items():
+                if option == animation:
+                    self.animation_var.set(label)
+                    self.floating_window.set_animation(*option)
             if image_path:
-                import os
                 if os.path.exists(image_path):
                     self.floating_window.set_image(image_path)
                     self.image_path_var.set(os.path.basename(image_path))
@@ -407,10 +531,51 @@ class HeartRateMonitor:
                 if window_settings.get("locked", False):
                     self.root.after(100, self.toggle_floating_lock)
         
+        # 第三方输出端，见 sinks.py
+        self.sinks.load_from_config(config.get("sinks", []))
+        history_settings = config.get("history") or {}
+        if history_settings.get("enabled"):
+            from history import HistoryStore, HistorySink, DEFAULT_HISTORY_PATH
+            self.history = HistoryStore(history_settings.get("path") or DEFAULT_HISTORY_PATH)
+            self.sinks.add(HistorySink(self.history))
+            self.log_message(f"历史记录已开启: {self.history.path}")
+        feed_settings = config.get("local_feed") or {}
+        if feed_settings.get("enabled"):
+            from local_feed import LocalFeedSink, DEFAULT_NAME, DEFAULT_SOCKET_PATH
+            self.sinks.add(LocalFeedSink(feed_settings.get("name") or DEFAULT_NAME,
+                                         feed_settings.get("socket", DEFAULT_SOCKET_PATH)))
+            # 共享内存在事件循环中创建；立即启动，读取方在连接设备之前就可以附加
+            self.runtime.start()
+        multicast_settings = config.get("multicast") or {}
+        if multicast_settings.get("enabled"):
+            from multicast import MulticastSink, DEFAULT_GROUP, DEFAULT_PORT
+            self.sinks.add(MulticastSink(multicast_settings.get("group") or DEFAULT_GROUP,
+                                         multicast_settings.get("port") or DEFAULT_PORT,
+                                         multicast_settings.get("ttl", 1), multicast_settings.get("interface", "")))
+        mqtt_settings = config.get("mqtt") or {}
+        if mqtt_settings.get("enabled"):
+            from mqtt_client import MqttSink, DEFAULT_PORT as MQTT_DEFAULT_PORT, DEFAULT_PREFIX
+            try:
+                self.sinks.add(MqttSink(self.runtime, mqtt_settings.get("host") or "127.0.0.1",
+                                        mqtt_settings.get("port") or MQTT_DEFAULT_PORT,
+                                        mqtt_settings.get("username", ""), mqtt_settings.get("password", ""),
+                                        mqtt_settings.get("prefix") or DEFAULT_PREFIX, int(mqtt_settings.get("qos", 1)),
+                                        mqtt_settings.get("client_id", "")))
+            except ValueError as e:
+                self.log_message(f"MQTT 设置有误: {e}")
+        if "filter" in config:
+            self.hr_filter.configure(config["filter"])
+        self.alert_engine.configure(config.get("alerts", []))
+        self.session_stats.configure_zones(self.alert_engine.zones)
+
         vrc_settings = config.get("vrc_osc")
         if vrc_settings:
             self.vrc_ip_var.set(vrc_settings.get("ip", "127.0.0.1"))
             self.vrc_port_var.set(vrc_settings.get("port", "9000"))
+            self.vrc_chatbox_var.set(vrc_settings.get("chatbox", True))
+            self.vrc_avatar_params_var.set(vrc_settings.get("avatar_params", True))
+            self.vrc_extra_targets = vrc_settings.get("targets", [])
+            self.apply_vrc_options()
             self.log_message("已加载 VRChat OSC 设置")
 
         api_settings = config.get("api_server")
@@ -424,11 +589,16 @@ class HeartRateMonitor:
         websocket_settings = config.get("websocket_server")
         if websocket_settings:
             self.websocket_port_var.set(websocket_settings.get("port", "8001"))
+            self.websocket_shared_var.set(websocket_settings.get("shared_port", False))
             if websocket_settings.get("enabled", False):
                 # 延迟执行，确保UI完全加载
                 self.root.after(200, lambda: self.websocket_server_enabled.set(True))
             self.log_message("已加载 WebSocket 服务器设置")
         
+    def apply_vrc_options(self):
+        self.vrc_osc_client.send_chatbox = self.vrc_chatbox_var.get()
+        self.vrc_osc_client.send_avatar_params = self.vrc_avatar_params_var.get()
+
     def toggle_vrc_connection(self):
         if self.vrc_connected:
             self.vrc_osc_client.disconnect()
@@ -444,7 +614,7 @@ class HeartRateMonitor:
                 return
             try:
                 port = int(port_str)
-                success, message = self.vrc_osc_client.connect(ip, port)
+                success, message = self.vrc_osc_client.connect(ip, port, self.vrc_extra_targets)
                 if success:
                     self.vrc_connected = True
                     self.vrc_connect_button.config(text="断开 OSC")
@@ -485,6 +655,9 @@ class HeartRateMonitor:
     def on_closing(self):
         self.log_message("正在关闭程序...")
         self.save_settings()
+        # 退出前把防抖中的配置立即写盘
+        flush_config()
+        self.webhook_manager.flush()
         self.should_stop = True
         if self.connected:
             self.disconnect_device()
@@ -493,8 +666,12 @@ class HeartRateMonitor:
         # [修改] 增加停止服务器的逻辑
         if self.api_server:
             self.api_server.stop()
+        self.sinks.stop_all()
         if self.websocket_server:
             self.websocket_server.stop()
+        # 取消其余任务（包括正在连接/重连的 BLE）并等待结束，之后事件循环线程退出
+        self.runtime.stop()
+        self.bridge.close()
         if self.floating_window.is_open():
             self.floating_window.close_window()
         self.root.destroy()
@@ -502,17 +679,17 @@ class HeartRateMonitor:
     def scan_devices(self):
         self.scan_button.config(state=tk.DISABLED, text="扫描中...")
         self.log_message("开始扫描蓝牙设备...")
-        threading.Thread(target=self._scan_devices_thread, daemon=True).start()
+        self.runtime.submit(self._scan_bluetooth_devices()).add_done_callback(self._on_scan_done)
 
-    def _scan_devices_thread(self):
+    def _on_scan_done(self, future: 'concurrent.futures.Future'):
+        """在事件循环线程中调用，结果交给 Tk 主线程显示"""
+        import concurrent.futures
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            devices = loop.run_until_complete(self._scan_bluetooth_devices())
-            self.root.after(0, self._show_device_selection, devices)
-        except Exception as e:
+            devices = future.result()
+            self.bridge.post(self._show_device_selection, devices)
+        except (Exception, concurrent.futures.CancelledError) as e:
             self.log_message(f"扫描失败: {str(e)}")
-            self.root.after(0, lambda: self.scan_button.config(state=tk.NORMAL, text="扫描设备"))
+            self.bridge.post(lambda: self.scan_button.config(state=tk.NORMAL, text="扫描设备"))
 
     async def _scan_bluetooth_devices(self):
         from bleak import BleakScanner
@@ -577,42 +754,52 @@ class HeartRateMonitor:
         self.connect_button.config(state=tk.DISABLED)
         self.disconnect_button.config(state=tk.NORMAL)
         self.log_message(f"正在连接设备: {self.current_mac}")
-        self.ble_thread = threading.Thread(target=self._connect_ble_thread, daemon=True)
-        self.ble_thread.start()
-
-    def _connect_ble_thread(self):
-        try:
-            self.ble_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.ble_loop)
-            self.ble_loop.run_until_complete(self._run_heart_rate_monitor())
-        except Exception as e:
-            self.log_message(f"连接失败: {str(e)}")
-            self.root.after(0, self._on_disconnect)
+        # 连接失败或意外断开时由运行时退避后重连，直到手动断开
+        self.runtime.supervise("ble", self._run_heart_rate_monitor,
+                               on_crash=lambda e: self.bridge.post(self._on_ble_lost, e))
+
+    def _on_ble_lost(self, error: Exception):
+        """BLE 任务异常退出（连接失败或意外断开），运行时稍后会自动重连"""
+        self.log_message(f"连接失败: {error}")
+        if self.should_stop:
+            return
+        self._on_disconnect()
+        self.status_label.config(text="状态: 重连中...", fg="orange")
+        self.connect_button.config(state=tk.DISABLED)
+        self.disconnect_button.config(state=tk.NORMAL)
 
     async def _run_heart_rate_monitor(self):
         def heart_rate_callback(characteristic, data):
             if self.should_stop: return
+            metrics.NOTIFICATIONS.inc()
             try:
-                value = 0
-                if len(data) >= 2:
-                    if data[0] & 0x01: value = int.from_bytes(data[1:3], byteorder='little')
-                    else: value = data[1]
-                else:
-                    hex_data = data.hex()
-                    if '06' in hex_data: value = int(hex_data.split('06')[1], 16)
-                if value > 0:
-                    self.heart_rate_queue.put(value)
+                now = time.monotonic()
+                raw, rr_intervals = parse_heart_rate_measurement(data)
+                if raw > 0:
+                    value = self.hr_filter.process(raw, now, parse_sensor_contact(data))
+                    if value is None:
+                        return
+                    # 在收到通知的第一时间打上序号和时间戳，之后原样传递给界面和各输出端
+                    sample = capture_sample(value, rr_intervals, self.current_mac, raw, now)
+                    self.session_stats.update(value, now)
+                    self.state.publish(Snapshot.from_sample(sample, self.session_stats.current))
+                    metrics.mark_sample()
+                    self.heart_rate_queue.put(sample)
+                    self.sinks.publish(sample)
+                    for alert in self.alert_engine.process(value, now):
+                        self._publish_alert(sample._replace(kind=alert.kind, detail=alert.detail))
             except Exception as e:
+                metrics.DECODE_ERRORS.inc()
                 self.log_message(f"解析心率数据失败: {str(e)}")
         
-        self.root.after(0, self._on_connect)
-        try:
-            await self._run_custom_heart_rate_monitor(self.current_mac, heart_rate_callback)
-        finally:
-            if not self.should_stop:
-                self.root.after(0, self._on_disconnect)
+        await self._run_custom_heart_rate_monitor(self.current_mac, heart_rate_callback)
 
     async def _run_custom_heart_rate_monitor(self, mac, callback):
+        """
+        连接并接收通知，直到设备断开（抛出 ConnectionError，由运行时重连）
+        或任务被取消（手动断开、程序退出，退出 async with 时断开连接）。
+        """
+        import asyncio
         from bleak import BleakClient
         disconnected_event = asyncio.Event()
         def disconnected_callback(client):
@@ -623,12 +810,19 @@ class HeartRateMonitor:
             hr_uuid = await self._find_heart_rate_characteristics(client)
             if hr_uuid:
                 self.log_message(f"找到心率特征: {hr_uuid}")
+                # 滤波器和提醒只在事件循环线程中使用（通知回调），在开始接收通知前于本线程重置
+                self.hr_filter.reset()
+                self.alert_engine.reset(time.monotonic())
+                self.bridge.post(self._on_connect)
                 await client.start_notify(hr_uuid, callback)
                 self.log_message("开始接收心率数据")
-                while not self.should_stop and not disconnected_event.is_set():
-                    await asyncio.sleep(0.1)
-                try: await client.stop_notify(hr_uuid)
-                except: pass
+                try:
+                    await disconnected_event.wait()
+                finally:
+                    if client.is_connected:
+                        try: await client.stop_notify(hr_uuid)
+                        except Exception: pass
+                raise ConnectionError("设备连接断开")
             else:
                 self.log_message("未找到心率特征")
                 raise Exception("未找到心率特征")
@@ -646,41 +840,71 @@ class HeartRateMonitor:
 
     def _on_connect(self):
         self.connected = True
+        self.state.update(connected=True, device=self.current_mac or "")
+        if metrics.BLE_CONNECTS.value > 0:
+            metrics.BLE_RECONNECTS.inc()
+        metrics.BLE_CONNECTS.inc()
         self.status_label.config(text="状态: 已连接", fg="green")
         self.log_message("设备连接成功，开始监控心率")
-        self.webhook_manager.trigger_event("connected", self.heart_rate)
-        # [新增] 连接时广播状态
-        if self.websocket_server:
-            self.websocket_server.broadcast()
+        self.sinks.publish(status_event(EVENT_CONNECTED, self.heart_rate, True, self._last_seq(), self.current_mac))
 
 
     def _on_disconnect(self):
-        if self.connected: 
-            self.webhook_manager.trigger_event("disconnected", self.heart_rate)
+        was_connected = self.connected
+        if was_connected:
+            metrics.BLE_DISCONNECTS.inc()
+        self.runtime.call_soon(self.alert_engine.reset, None)
         
         self.connected = False
+        self.state.update(connected=False, heart_rate=0)
         self.status_label.config(text="状态: 未连接", fg="gray")
         if self.current_mac:
             self.connect_button.config(state=tk.NORMAL)
         self.disconnect_button.config(state=tk.DISABLED)
         self.heart_rate_label.config(text="心率: --", fg="red")
-        self.heart_rate_queue.put(0) 
+        event = status_event(EVENT_DISCONNECTED, self.heart_rate, False, self._last_seq(), self.current_mac)
+        self.heart_rate_queue.put(event._replace(heart_rate=0))
         self.log_message("设备已断开连接")
-        # [新增] 断开时广播状态
-        if self.websocket_server:
-            self.websocket_server.broadcast()
+        if was_connected:
+            # 各输出端据此发送断开状态（OSC 发送 0、WebSocket 广播、Webhook 触发）
+            self.sinks.publish(event)
+
+    def _publish_alert(self, event):
+        """发布提醒事件（可在事件循环线程或 Tk 线程中调用）"""
+        self.log_message(f"提醒: {ALERT_TRIGGERS.get(event.kind, event.kind)} - {event.detail} ({event.heart_rate} bpm)")
+        self.sinks.publish(event)
+
+    def _last_seq(self) -> int:
+        return self.state.current.seq
 
     def disconnect_device(self):
         self.should_stop = True
-        if self.ble_loop and not self.ble_loop.is_closed() and self.ble_loop.is_running():
-            pass
+        # 取消 BLE 任务（包括等待重连中的任务），退出时断开与设备的连接
+        self.runtime.cancel("ble")
         self._on_disconnect()
         self.log_message("手动断开连接")
 
+    def _on_window_shown(self):
+        """主循环开始处理事件后调用，此时窗口已经显示"""
+        self.window_shown_after = time.perf_counter() - self.started_at
+        metrics.STARTUP_WINDOW_SECONDS.set(self.window_shown_after)
+        self.log_message(f"启动耗时: {self.window_shown_after * 1000:.0f} ms")
+        if os.environ.get(STARTUP_BENCH_ENV, "") not in ("", "0"):
+            print(f"time_to_window_ms={self.window_shown_after * 1000:.1f}", flush=True)
+            self.root.after(0, self.root.destroy)
+
+    def _mark_first_sample(self):
+        self.first_sample_after = time.perf_counter() - self.started_at
+        metrics.STARTUP_FIRST_SAMPLE_SECONDS.set(self.first_sample_after)
+        self.log_message(f"从启动到收到第一个心率样本: {self.first_sample_after:.2f} s")
+
     def run(self):
         self.log_message("心率监控器启动")
+        if PROFILER.enabled:
+            self.log_message("性能分析已开启，可通过 API 服务器的 /debug/ 接口使用")
         self.log_message("游戏悬浮显示工具 - 支持透明悬浮窗和点击穿透")
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.root.after(0, self._on_window_shown)
         self.root.mainloop()
 
 def main():
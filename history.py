@@ -0,0 +1,307 @@
+# history.py
+
+"""
+心率历史记录（可选），保存在 SQLite 数据库中。
+
+- 写入：HistorySink 作为一个输出端运行在自己的线程中，样本先在内存中攒批，
+  每 BATCH_SIZE 条或每 FLUSH_INTERVAL 秒在一个事务中写入，而不是每个心跳一个事务；
+  数据库使用 WAL 模式，读取（API 查询）不会阻塞写入。
+- 汇总：写入样本的同一个事务中更新按分钟、按小时预先汇总的表，
+  查询"最近 30 天、每分钟一个点"时只读汇总表，不扫描原始样本。
+- 会话：每次连接设备开始一个会话，断开时结束，供导出等功能按会话读取原始样本。
+
+在 config.json 中开启：
+
+    "history": {"enabled": true, "path": "history.db"}
+"""
+
+import math
+import os
+import sqlite3
+import time
+from typing import Optional
+
+import metrics
+from sinks import Sink, SinkEvent, EVENT_HEART_RATE, EVENT_CONNECTED, EVENT_DISCONNECTED
+
+DEFAULT_HISTORY_PATH = "history.db"
+
+# 攒够这么多条样本，或距离上次写入超过这么多秒，就写入一次
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 5.0
+
+# 一次查询最多返回的点数
+MAX_HISTORY_POINTS = 100_000
+
+# 汇总表: 表名 -> 每个桶的秒数
+ROLLUP_TABLES = {"rollup_minute": 60, "rollup_hour": 3600}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    session_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    bpm INTEGER NOT NULL,
+    raw_bpm INTEGER NOT NULL,
+    rr TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS samples_session_ts ON samples (session_id, ts);
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    bucket INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    sum INTEGER NOT NULL,
+    min INTEGER NOT NULL,
+    max INTEGER NOT NULL,
+    PRIMARY KEY (bucket, device)
+) WITHOUT ROWID;
+""" for table in ROLLUP_TABLES)
+
+_INSERT_SAMPLE = "INSERT INTO samples (session_id, ts, seq, bpm, raw_bpm, rr) VALUES (?, ?, ?, ?, ?, ?)"
+_UPSERT_ROLLUP = """
+INSERT INTO {table} (bucket, device, count, sum, min, max) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (bucket, device) DO UPDATE SET
+    count = count + excluded.count,
+    sum = sum + excluded.sum,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max)
+"""
+
+_ROWS = metrics.REGISTRY.counter("hr_history_rows_total", "写入历史数据库的样本数")
+_SENDS = metrics.SINK_SENDS.labels("history")
+_ERRORS = metrics.SINK_ERRORS.labels("history")
+_LATENCY = metrics.SINK_LATENCY.labels("history")
+
+
+class HistoryStore:
+    """
+    数据库的读写。写入方法只在 HistorySink 的线程中调用，并共用一个连接；
+    查询方法可以在任意线程中调用，每次使用独立的只读连接。
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # --- 写入（HistorySink 线程） ---
+
+    def open_writer(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 足以保证数据库不会损坏，断电时最多丢失最后几批
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        with conn:
+            # 上次异常退出时未结束的会话，以最后一个样本的时间作为结束时间
+            conn.execute("""
+                UPDATE sessions SET ended_at = COALESCE(
+                    (SELECT MAX(ts) FROM samples WHERE session_id = sessions.id), started_at)
+                WHERE ended_at IS NULL
+            """)
+        self._conn = conn
+
+    def close_writer(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def start_session(self, device: str, started_at: float) -> int:
+        with self._conn:
+            cursor = self._conn.execute("INSERT INTO sessions (device, started_at) VALUES (?, ?)",
+                                        (device, started_at))
+        return cursor.lastrowid
+
+    def end_session(self, session_id: int, ended_at: float):
+        with self._conn:
+            self._conn.execute("UPDATE sessions SET ended_at = ? WHERE id = ?", (ended_at, session_id))
+
+    def write_batch(self, device: str, rows: list[tuple]):
+        """
+        在一个事务中写入一批样本并更新汇总表。
+        rows 为 (session_id, ts, seq, bpm, raw_bpm, rr) 元组。
+        """
+        rollups = []
+        for table, seconds in ROLLUP_TABLES.items():
+            buckets: dict[int, list[int]] = {}
+            for row in rows:
+                bucket = int(row[1] // seconds)
+                bpm = row[3]
+                stats = buckets.get(bucket)
+                if stats is None:
+                    buckets[bucket] = [1, bpm, bpm, bpm]
+                else:
+                    stats[0] += 1
+                    stats[1] += bpm
+                    if bpm < stats[2]:
+                        stats[2] = bpm
+                    if bpm > stats[3]:
+                        stats[3] = bpm
+            rollups.append((_UPSERT_ROLLUP.format(table=table),
+                            [(bucket, device, *stats) for bucket, stats in buckets.items()]))
+        with self._conn:
+            self._conn.executemany(_INSERT_SAMPLE, rows)
+            for sql, params in rollups:
+                self._conn.executemany(sql, params)
+
+    # --- 查询（任意线程） ---
+
+    def _connect_reader(self, check_same_thread: bool = True) -> Optional[sqlite3.Connection]:
+        """数据库尚未创建时返回 None"""
+        if not os.path.exists(self.path):
+            return None
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=check_same_thread)
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    def query(self, since: float, until: float, resolution: int = 60, device: Optional[str] = None) -> list[tuple]:
+        """
+        按 resolution 秒（60 的整数倍）汇总 [since, until) 内的心率，只读取汇总表。
+        返回 (时间, 平均, 最低, 最高, 样本数) 元组，时间为桶的起始 Unix 秒，没有数据的桶不返回。
+        """
+        resolution = int(resolution)
+        if resolution <= 0 or resolution % 60:
+            raise ValueError("resolution 必须是 60 的正整数倍")
+        if until <= since:
+            raise ValueError("until 必须大于 since")
+        if (until - since) / resolution > MAX_HISTORY_POINTS:
+            raise ValueError(f"单次最多查询 {MAX_HISTORY_POINTS} 个点，请增大 resolution 或缩小时间范围")
+
+        table, unit = ("rollup_hour", 3600) if resolution % 3600 == 0 else ("rollup_minute", 60)
+        step = resolution // unit
+        # 分辨率与汇总表一致时直接按主键分组，不需要临时排序
+        group = "bucket" if step == 1 else f"bucket / {step}"
+        sql = (f"SELECT ({group}) * {resolution}, ROUND(CAST(SUM(sum) AS REAL) / SUM(count), 1), "
+               f"MIN(min), MAX(max), SUM(count) FROM {table} WHERE bucket >= ? AND bucket < ?")
+        params: list = [math.floor(since / unit), math.ceil(until / unit)]
+        if device:
+            sql += " AND device = ?"
+            params.append(device)
+        sql += f" GROUP BY {group} ORDER BY {group}"
+
+        conn = self._connect_reader()
+        if conn is None:
+            return []
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            # 数据库已创建但写入线程尚未建表
+            return []
+        finally:
+            conn.close()
+        return rows
+
+    def sessions(self, limit: int = 100) -> list[dict]:
+        """最近的会话，新的在前"""
+        conn = self._connect_reader()
+        if conn is None:
+            return []
+        try:
+            rows = conn.execute("SELECT id, device, started_at, ended_at FROM sessions ORDER BY id DESC LIMIT ?",
+                                (int(limit),)).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        finally:
+            conn.close()
+        return [{"id": id_, "device": device, "started_at": started_at, "ended_at": ended_at}
+                for id_, device, started_at, ended_at in rows]
+
+    def session(self, session_id: int) -> Optional[dict]:
+        conn = self._connect_reader()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute("SELECT id, device, started_at, ended_at FROM sessions WHERE id = ?",
+                               (int(session_id),)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {"id": row[0], "device": row[1], "started_at": row[2], "ended_at": row[3]}
+
+    def iter_samples(self, session_id: int):
+        """
+        逐行读取一个会话的原始样本 (ts, seq, bpm, raw_bpm, rr)，按时间排序。
+        结果由 SQLite 游标流式返回，不会一次性载入内存；生成器关闭时释放连接。
+        生成器可以依次在不同线程中推进（API 服务器在线程池中逐块生成导出内容），但不能并发推进。
+        """
+        conn = self._connect_reader(check_same_thread=False)
+        if conn is None:
+            return
+        try:
+            yield from conn.execute("SELECT ts, seq, bpm, raw_bpm, rr FROM samples WHERE session_id = ? ORDER BY ts",
+                                    (int(session_id),))
+        finally:
+            conn.close()
+
+
+class HistorySink(Sink):
+    """把心率样本写入 HistoryStore；攒批写入，连接/断开时开始/结束会话"""
+    name = "history"
+    # 写盘偶尔较慢（例如磁盘繁忙），留出足够的队列避免丢样本
+    queue_size = 4096
+
+    def __init__(self, store: HistoryStore):
+        self.store = store
+        self._session_id: Optional[int] = None
+        self._device = ""
+        self._rows: list[tuple] = []
+        self._last_flush = 0.0
+
+    def open(self):
+        self.store.open_writer()
+        self._last_flush = time.monotonic()
+
+    def handle(self, event: SinkEvent):
+        if event.kind == EVENT_CONNECTED:
+            self._end_session(event.timestamp)
+            self._start_session(event.device, event.timestamp)
+        elif event.kind == EVENT_DISCONNECTED:
+            self._end_session(event.timestamp)
+        elif event.kind == EVENT_HEART_RATE and event.heart_rate > 0:
+            if self._session_id is None or event.device != self._device:
+                # 记录功能在连接之后才开启时，以第一个样本作为会话开始
+                self._end_session(event.timestamp)
+                self._start_session(event.device, event.timestamp)
+            rr = ",".join(f"{r:.4f}" for r in event.rr_intervals)
+            self._rows.append((self._session_id, event.timestamp, event.seq, event.heart_rate,
+                               event.raw_heart_rate or event.heart_rate, rr))
+            if len(self._rows) >= BATCH_SIZE or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                self.flush()
+
+    def close(self):
+        self._end_session(time.time())
+        self.store.close_writer()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        start = time.perf_counter()
+        try:
+            self.store.write_batch(self._device, rows)
+        except sqlite3.Error:
+            _ERRORS.inc()
+            raise
+        _SENDS.inc()
+        _LATENCY.observe(time.perf_counter() - start)
+        _ROWS.inc(len(rows))
+
+    def _start_session(self, device: str, started_at: float):
+        self._device = device
+        self._session_id = self.store.start_session(device, started_at)
+
+    def _end_session(self, ended_at: float):
+        self.flush()
+        if self._session_id is not None:
+            self.store.end_session(self._session_id, ended_at)
+            self._session_id = None
@@ -0,0 +1,195 @@
+# hr_filter.py
+
+"""
+心率信号的流式滤波，位于 BLE 解析之后、分发给各输出端之前。
+
+依次经过（每一级都可以单独关闭）：
+1. 传感器接触判断：设备报告"未接触皮肤"时丢弃样本；
+2. 范围检查：超出 [min_bpm, max_bpm] 的值视为无效；
+3. 滚动中位数：窗口 median_window 个样本，剔除 40 → 190 → 70 这类单点尖峰；
+4. 最大变化率：每秒最多变化 max_slew bpm；
+5. EMA 平滑：时间常数 ema_tau 秒，与样本频率无关。
+
+每个样本的开销：滚动中位数为摊还 O(log w)（两个堆 + 延迟删除），其余各级为 O(1)。
+"""
+
+import heapq
+import math
+from collections import deque
+from typing import Optional
+
+import metrics
+
+DEFAULT_FILTER_CONFIG = {
+    "enabled": True,
+    "contact_gating": True,
+    "min_bpm": 25,
+    "max_bpm": 250,
+    "median_window": 3,
+    "max_slew": 0,     # bpm/秒，0 表示不限制
+    "ema_tau": 0,      # 秒，0 表示不平滑
+}
+
+# 被丢弃的样本原因
+REJECT_NO_CONTACT = "no_contact"
+REJECT_OUT_OF_RANGE = "out_of_range"
+
+# 两个样本之间按最长这么久计算变化率/EMA，避免断档后一次性跳变被过度限制
+MAX_DT = 5.0
+
+_REJECTED_NO_CONTACT = metrics.FILTER_REJECTED.labels(REJECT_NO_CONTACT)
+_REJECTED_OUT_OF_RANGE = metrics.FILTER_REJECTED.labels(REJECT_OUT_OF_RANGE)
+
+
+class RollingMedian:
+    """
+    固定窗口的滚动中位数，每个样本摊还 O(log w)。
+    _low（取负值的大顶堆）保存较小的一半，_high（小顶堆）保存较大的一半，_low 的有效元素与 _high 一样多或多一个；
+    移出窗口的值先记入 _delayed，到达堆顶时才真正弹出（延迟删除）。
+    过期的值在堆底累积到超过一个窗口时，按 deque 中的到达顺序重建两个堆（每 w 个样本至多一次）。
+    """
+
+    def __init__(self, window: int):
+        self.window = max(1, int(window))
+        self._order: deque[float] = deque()
+        self.reset()
+
+    def push(self, value: float) -> float:
+        if len(self._order) == self.window:
+            self._remove(self._order.popleft())
+        self._order.append(value)
+        if self._low and value > -self._low[0]:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+        else:
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        self._balance()
+        if len(self._low) + len(self._high) > 2 * self.window:
+            self._rebuild()
+        if self._low_size > self._high_size:
+            return -self._low[0]
+        return (-self._low[0] + self._high[0]) / 2
+
+    def reset(self):
+        self._order.clear()
+        self._low: list[float] = []
+        self._high: list[float] = []
+        self._low_size = 0
+        self._high_size = 0
+        self._delayed: dict[float, int] = {}
+
+    def _remove(self, value: float):
+        self._delayed[value] = self._delayed.get(value, 0) + 1
+        if value <= -self._low[0]:
+            self._low_size -= 1
+            if value == -self._low[0]:
+                self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            if value == self._high[0]:
+                self._prune(self._high, 1)
+        self._balance()
+
+    def _prune(self, heap: list[float], sign: int):
+        """弹出堆顶已移出窗口的值"""
+        delayed = self._delayed
+        while heap:
+            value = sign * heap[0]
+            count = delayed.get(value)
+            if not count:
+                return
+            if count == 1:
+                del delayed[value]
+            else:
+                delayed[value] = count - 1
+            heapq.heappop(heap)
+
+    def _balance(self):
+        if self._low_size > self._high_size + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._low_size += 1
+            self._high_size -= 1
+            self._prune(self._high, 1)
+
+    def _rebuild(self):
+        values = sorted(self._order)
+        half = (len(values) + 1) // 2
+        self._low = [-v for v in reversed(values[:half])]
+        self._high = values[half:]
+        self._low_size = half
+        self._high_size = len(values) - half
+        self._delayed.clear()
+
+
+class HeartRateFilter:
+    """
+    有状态的心率滤波器。process() 在 BLE 回调（运行时的事件循环线程）中按样本顺序调用，
+    返回滤波后的整数心率，样本被丢弃时返回 None。
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        self.configure(config)
+
+    def configure(self, config: Optional[dict] = None):
+        """应用配置（缺省项使用 DEFAULT_FILTER_CONFIG），并清空状态"""
+        cfg = dict(DEFAULT_FILTER_CONFIG)
+        cfg.update(config or {})
+        self.enabled = bool(cfg["enabled"])
+        self.contact_gating = bool(cfg["contact_gating"])
+        self.min_bpm = float(cfg["min_bpm"])
+        self.max_bpm = float(cfg["max_bpm"])
+        self.max_slew = max(0.0, float(cfg["max_slew"]))
+        self.ema_tau = max(0.0, float(cfg["ema_tau"]))
+        window = int(cfg["median_window"])
+        self._median = RollingMedian(window) if window > 1 else None
+        self.reset()
+
+    def reset(self):
+        """设备重新连接时调用，丢弃之前的状态"""
+        if self._median:
+            self._median.reset()
+        # 变化率限制和 EMA 各自保留上一次的输出，互不影响
+        self._slew_value: Optional[float] = None
+        self._ema_value: Optional[float] = None
+        self._last_time: Optional[float] = None
+
+    def process(self, bpm: int, now: float, contact: Optional[bool] = None) -> Optional[int]:
+        """
+        Args:
+            bpm: 设备上报的原始心率。
+            now: 采集时间（time.monotonic()）。
+            contact: 设备报告的皮肤接触状态，不支持该功能的设备为 None。
+        """
+        if not self.enabled:
+            return bpm
+        if self.contact_gating and contact is False:
+            _REJECTED_NO_CONTACT.inc()
+            return None
+        if not self.min_bpm <= bpm <= self.max_bpm:
+            _REJECTED_OUT_OF_RANGE.inc()
+            return None
+
+        value = float(bpm)
+        if self._median:
+            value = self._median.push(value)
+
+        dt = min(MAX_DT, max(0.0, now - self._last_time)) if self._last_time is not None else 0.0
+        self._last_time = now
+        if self.max_slew:
+            last = self._slew_value
+            if last is not None:
+                limit = self.max_slew * dt
+                value = min(last + limit, max(last - limit, value))
+            self._slew_value = value
+        if self.ema_tau:
+            last = self._ema_value
+            if last is not None:
+                value = last + (1.0 - math.exp(-dt / self.ema_tau)) * (value - last)
+            self._ema_value = value
+        return int(round(value))
@@ -0,0 +1,212 @@
+# http_async.py
+
+"""
+运行在 asyncio 上的最小 HTTP/1.1 服务端，供 API 服务器使用。
+开启共用端口时，WebSocket 升级请求也由同一个监听端口接收（见 serve_connection 的 upgrade）。
+
+- 每个连接是事件循环中的一个协程，而不是一个线程；支持 keep-alive，
+  悬浮窗页面等高频轮询的客户端可以复用同一个连接；
+- 响应体可以是 bytes，也可以是逐块生成的迭代器（例如导出会话），
+  后者在线程池中逐块生成，不阻塞事件循环，发送完毕后关闭连接。
+"""
+
+import asyncio
+import json
+from http import HTTPStatus
+from typing import Awaitable, Callable, Iterable, Iterator, NamedTuple, Optional, Union
+from urllib.parse import urlsplit, parse_qs
+
+# 空闲的 keep-alive 连接保留多久（秒）
+KEEPALIVE_TIMEOUT = 30.0
+# 请求头和请求体的大小上限
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+
+class Request(NamedTuple):
+    method: str
+    target: str                  # 原始的请求路径（含查询字符串）
+    path: str
+    query: dict[str, list[str]]
+    version: str
+    headers: dict[str, str]      # 名称均为小写
+    body: bytes
+    client: str                  # 客户端 IP
+    head: bytes = b""            # 原始的请求行和请求头，WebSocket 升级时交给握手解析
+
+    def param(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @property
+    def is_websocket_upgrade(self) -> bool:
+        return (self.headers.get("upgrade", "").lower() == "websocket"
+                and "upgrade" in self.headers.get("connection", "").lower())
+
+
+class Response:
+    """body 为 bytes 时设置 Content-Length；为迭代器时边生成边发送，结束后关闭连接"""
+
+    def __init__(self, status: int = 200, body: Union[bytes, Iterable[bytes]] = b"",
+                 content_type: Optional[str] = None, headers: Optional[dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.headers = dict(headers or {})
+        if content_type:
+            self.headers["Content-Type"] = content_type
+
+    @classmethod
+    def json(cls, status: int, payload, headers: Optional[dict[str, str]] = None) -> 'Response':
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return cls(status, body, "application/json; charset=utf-8", headers)
+
+    @classmethod
+    def text(cls, status: int, text: str) -> 'Response':
+        return cls(status, text.encode("utf-8"), "text/plain; charset=utf-8")
+
+
+async def read_request(reader: asyncio.StreamReader, client: str) -> Optional[Request]:
+    """读取一个请求；连接在请求开始前被关闭时返回 None"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HttpError(400, "请求不完整")
+    except asyncio.LimitOverrunError:
+        raise HttpError(431)
+    if len(head) > MAX_HEADER_BYTES:
+        raise HttpError(431)
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "无效的请求行")
+    if not version.startswith("HTTP/1."):
+        raise HttpError(505)
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise HttpError(400, "无效的请求头")
+        headers[name.strip().lower()] = value.strip()
+
+    body = b""
+    length = headers.get("content-length")
+    if length:
+        try:
+            size = int(length)
+        except ValueError:
+            raise HttpError(400, "无效的 Content-Length")
+        if size > MAX_BODY_BYTES:
+            raise HttpError(413)
+        body = await reader.readexactly(size)
+    elif "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(411)
+
+    url = urlsplit(target)
+    return Request(method.upper(), target, url.path, parse_qs(url.query), version, headers, body, client, head)
+
+
+def _head(status: int, headers: dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def write_response(writer: asyncio.StreamWriter, request: Optional[Request], response: Response,
+                         run_blocking: Callable[..., Awaitable]) -> bool:
+    """发送响应，返回连接是否可以继续复用"""
+    headers = {"Server": "HeartRateMonitor"}
+    headers.update(response.headers)
+    body = response.body
+    keep_alive = bool(request and request.keep_alive)
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        headers["Content-Length"] = str(len(body))
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        writer.write(_head(response.status, headers))
+        if request is None or request.method != "HEAD":
+            writer.write(body)
+        await writer.drain()
+        return keep_alive
+
+    # 流式响应：不知道总长度，以关闭连接表示结束
+    headers["Connection"] = "close"
+    writer.write(_head(response.status, headers))
+    iterator: Iterator[bytes] = iter(body)
+    try:
+        while True:
+            chunk = await run_blocking(next, iterator, None)
+            if chunk is None:
+                break
+            writer.write(chunk)
+            await writer.drain()
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+    return False
+
+
+async def serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                           handle: Callable[[Request], Awaitable[Response]],
+                           run_blocking: Callable[..., Awaitable],
+                           upgrade: Optional[Callable[[Request, asyncio.StreamReader, asyncio.StreamWriter],
+                                                      Awaitable[None]]] = None,
+                           logger: Callable[[str], None] = print):
+    """
+    处理一个连接上的所有请求。
+    upgrade 不为空时，WebSocket 升级请求交给它处理，之后连接归它所有；
+    它在握手前抛出 HttpError 时回复对应的错误并关闭连接。
+    handle 抛出 HttpError 以外的异常时记录日志并回复 500，连接可以继续使用。
+    """
+    peer = writer.get_extra_info("peername")
+    client = peer[0] if peer else ""
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_request(reader, client), KEEPALIVE_TIMEOUT)
+            except HttpError as e:
+                await write_response(writer, None, Response.text(e.status, str(e)), run_blocking)
+                return
+            if request is None:
+                return
+            if upgrade and request.is_websocket_upgrade:
+                try:
+                    await upgrade(request, reader, writer)
+                except HttpError as e:
+                    await write_response(writer, None, Response.text(e.status, str(e)), run_blocking)
+                return
+            try:
+                response = await handle(request)
+            except HttpError as e:
+                response = Response.text(e.status, str(e))
+            except Exception as e:
+                logger(f"[HTTP] 处理 {request.method} {request.path} 出错: {e!r}")
+                response = Response.text(500, "服务器内部错误")
+            if not await write_response(writer, request, response, run_blocking):
+                return
+    except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
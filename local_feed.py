@@ -0,0 +1,298 @@
+# local_feed.py
+
+"""
+供本机其他进程（悬浮窗、游戏 Mod、录制工具等）读取的心率数据源（可选），不经过 TCP/HTTP：
+
+- 共享内存：一块固定布局的内存（multiprocessing.shared_memory，默认名称 hrm_feed），
+  只保存最新的样本，用序列锁（seqlock）保护。读取方直接读内存，不需要系统调用，
+  以 kHz 的频率轮询也不会占用本程序的资源；
+- 数据报通知（仅限支持 Unix 域套接字的系统）：读取方从自己绑定的地址向 hrm_feed.sock 发送
+  b"subscribe"，之后每次更新都会收到一个数据报，内容与共享内存中的记录相同，不需要轮询。
+  发送 b"unsubscribe" 或删除自己的套接字文件即取消订阅。
+
+LocalFeedSink 与 WebSocket 一样作为输出端注册，收到的是同一批事件。在 config.json 中开启：
+
+    "local_feed": {"enabled": true, "name": "hrm_feed", "socket": "/tmp/hrm_feed.sock"}
+
+共享内存布局（小端序，共 BLOCK_SIZE 字节）：
+
+    偏移  类型   说明
+    0     4s     魔数 b"HRMF"
+    4     u16    布局版本，当前为 1
+    6     u16    记录长度（字节）
+    8     u64    序列计数，每次写入加 2；写入过程中为奇数，0 表示尚无数据
+    16    记录   u32 样本序号、u16 心率、u16 原始心率、f64 采集时间（Unix 秒）、
+                 f64 单调时钟（秒）、u8 标志位（bit0 已连接；bit1 连接状态变化事件）、
+                 u8 RR 个数 n、8 × u16 RR 间期（1/1024 秒，只有前 n 个有效）
+
+读取：读计数 c1（为奇数则重试）→ 复制记录 → 再读计数 c2，c1 == c2 时记录完整，否则重试。
+LocalFeedReader 实现了这一过程，其他语言可以照此实现。
+"""
+
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional
+
+import metrics
+from sinks import Sink, SinkEvent, EVENT_HEART_RATE, EVENT_CONNECTED, EVENT_DISCONNECTED
+
+DEFAULT_NAME = "hrm_feed"
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "hrm_feed.sock")
+
+MAGIC = b"HRMF"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+COUNTER = struct.Struct("<Q")
+COUNTER_OFFSET = HEADER.size
+RECORD = struct.Struct("<IHHddBB8H")
+RECORD_OFFSET = COUNTER_OFFSET + COUNTER.size
+BLOCK_SIZE = 64
+MAX_RR = 8
+
+FLAG_CONNECTED = 0x01
+FLAG_STATUS = 0x02
+
+SUBSCRIBE = b"subscribe"
+UNSUBSCRIBE = b"unsubscribe"
+MAX_SUBSCRIBERS = 64
+
+# 序列计数连续变化时最多重试的次数；写入只有几十字节，正常情况下一两次就能读到
+READ_RETRIES = 1000
+
+
+class FeedSample(NamedTuple):
+    """共享内存 / 数据报中的一条记录"""
+    seq: int
+    heart_rate: int
+    raw_heart_rate: int
+    timestamp: float
+    monotonic: float
+    connected: bool
+    status_change: bool          # 连接/断开事件，而不是新样本
+    rr_intervals: tuple          # 秒
+
+
+def encode(event: SinkEvent) -> bytes:
+    flags = FLAG_CONNECTED if event.connected else 0
+    if event.kind != EVENT_HEART_RATE:
+        flags |= FLAG_STATUS
+    rr = [min(0xFFFF, int(round(r * 1024))) for r in event.rr_intervals[:MAX_RR]]
+    return RECORD.pack(event.seq & 0xFFFFFFFF, max(0, event.heart_rate) & 0xFFFF,
+                       max(0, event.raw_heart_rate or event.heart_rate) & 0xFFFF,
+                       event.timestamp, event.monotonic, flags, len(rr), *rr, *([0] * (MAX_RR - len(rr))))
+
+
+def decode(data: bytes) -> FeedSample:
+    seq, hr, raw, timestamp, mono, flags, rr_count, *rr = RECORD.unpack_from(data)
+    return FeedSample(seq, hr, raw, timestamp, mono, bool(flags & FLAG_CONNECTED), bool(flags & FLAG_STATUS),
+                      tuple(r / 1024 for r in rr[:rr_count]))
+
+
+class LocalFeedSink(Sink):
+    """
+    把事件写入共享内存，并向订阅的进程发送数据报。
+    两者都不会阻塞（数据报套接字为非阻塞，读取方的缓冲区满时丢弃这一条），因此在事件循环中处理。
+    新的订阅请求在每次发布时顺带接收，不需要额外的线程或循环回调。
+    """
+    name = "local_feed"
+    # 共享内存只保存最新值，但每个事件都要通知订阅者：小队列用于吸收突发（例如连接事件紧跟第一个样本）
+    queue_size = 16
+    runs_on_loop = True
+
+    def __init__(self, name: str = DEFAULT_NAME, socket_path: Optional[str] = DEFAULT_SOCKET_PATH):
+        self.shm_name = name
+        self.socket_path = socket_path
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._counter = 0
+        self._socket: Optional[socket.socket] = None
+        self._subscribers: set = set()
+
+    def open(self):
+        try:
+            self._shm = shared_memory.SharedMemory(self.shm_name, create=True, size=BLOCK_SIZE)
+        except FileExistsError:
+            # 上次异常退出时残留的共享内存（POSIX），直接沿用
+            self._shm = shared_memory.SharedMemory(self.shm_name)
+            if self._shm.size < BLOCK_SIZE:
+                self._shm.close()
+                self._shm = None
+                raise ValueError(f"共享内存 {self.shm_name} 已存在且大小不足")
+        buf = self._shm.buf
+        buf[:BLOCK_SIZE] = bytes(BLOCK_SIZE)
+        HEADER.pack_into(buf, 0, MAGIC, VERSION, RECORD.size)
+        self._counter = 0
+        self.logger(f"本机数据源已开启: 共享内存 {self.shm_name}")
+        if self.socket_path:
+            self._open_socket()
+
+    def _open_socket(self):
+        if not hasattr(socket, "AF_UNIX"):
+            self.logger("当前系统不支持 Unix 域套接字，本机数据源只提供共享内存")
+            return
+        try:
+            if os.path.exists(self.socket_path):
+                if not stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+                    raise OSError(f"{self.socket_path} 已存在且不是套接字")
+                os.unlink(self.socket_path)  # 上次运行残留的套接字文件
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.bind(self.socket_path)
+        except OSError as e:
+            self.logger(f"本机数据源的通知套接字创建失败，只提供共享内存: {e}")
+            return
+        self._socket = sock
+        self.logger(f"本机数据源通知套接字: {self.socket_path}")
+
+    def handle(self, event: SinkEvent):
+        if event.kind not in (EVENT_HEART_RATE, EVENT_CONNECTED, EVENT_DISCONNECTED):
+            return
+        if event.kind == EVENT_DISCONNECTED:
+            event = event._replace(heart_rate=0)
+        record = encode(event)
+        if self._shm is not None:
+            buf = self._shm.buf
+            # 先把计数改为奇数，写完记录后再改为下一个偶数；读取方据此判断记录是否完整
+            self._counter += 1
+            COUNTER.pack_into(buf, COUNTER_OFFSET, self._counter)
+            buf[RECORD_OFFSET:RECORD_OFFSET + RECORD.size] = record
+            self._counter += 1
+            COUNTER.pack_into(buf, COUNTER_OFFSET, self._counter)
+        if self._socket is not None:
+            self._accept_subscriptions()
+            for address in list(self._subscribers):
+                self._send(address, record)
+
+    def _accept_subscriptions(self):
+        while True:
+            try:
+                data, address = self._socket.recvfrom(64)
+            except OSError:
+                break  # 没有更多的订阅请求（BlockingIOError）
+            if not address:
+                continue  # 未绑定地址的发送方无法接收通知
+            command = data.strip()
+            if command == SUBSCRIBE and (address in self._subscribers or len(self._subscribers) < MAX_SUBSCRIBERS):
+                self._subscribers.add(address)
+            elif command == UNSUBSCRIBE:
+                self._subscribers.discard(address)
+        metrics.LOCAL_FEED_SUBSCRIBERS.set(len(self._subscribers))
+
+    def _send(self, address, record: bytes):
+        try:
+            self._socket.sendto(record, address)
+        except BlockingIOError:
+            pass  # 读取方的接收缓冲区已满，丢弃这一条
+        except OSError:
+            # 读取方已退出（套接字文件不存在或无人接收）
+            self._subscribers.discard(address)
+            metrics.LOCAL_FEED_SUBSCRIBERS.set(len(self._subscribers))
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        self._subscribers.clear()
+        metrics.LOCAL_FEED_SUBSCRIBERS.set(0)
+        if self._shm is not None:
+            shm, self._shm = self._shm, None
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class LocalFeedReader:
+    """
+    读取共享内存中的最新样本（供其他进程使用）。
+    poll() 只比较序列计数，没有新数据时几乎没有开销，适合高频轮询。
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME):
+        # 在 POSIX 系统上，附加到已有的共享内存默认也会被 resource_tracker 记录，读取方退出时会把它删除。
+        # Python 3.13 起用 track=False 关闭记录；之前的版本只能附加后再取消登记
+        if sys.version_info >= (3, 13):
+            self._shm = shared_memory.SharedMemory(name, track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(name)
+            if os.name == "posix":
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+        magic, version, record_size = HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self._shm.close()
+            raise ValueError(f"共享内存 {name} 不是本程序的数据源，或版本不兼容")
+        self.last_counter = 0
+
+    def read(self) -> Optional[FeedSample]:
+        """最新的记录，尚无数据时为 None"""
+        buf = self._shm.buf
+        for _ in range(READ_RETRIES):
+            before = COUNTER.unpack_from(buf, COUNTER_OFFSET)[0]
+            if before & 1:
+                continue
+            data = bytes(buf[RECORD_OFFSET:RECORD_OFFSET + RECORD.size])
+            if COUNTER.unpack_from(buf, COUNTER_OFFSET)[0] == before:
+                self.last_counter = before
+                return decode(data) if before else None
+        raise TimeoutError("共享内存持续处于写入状态")
+
+    def poll(self) -> Optional[FeedSample]:
+        """自上次读取后有新记录时返回它，否则返回 None"""
+        if COUNTER.unpack_from(self._shm.buf, COUNTER_OFFSET)[0] == self.last_counter:
+            return None
+        return self.read()
+
+    def close(self):
+        self._shm.close()
+
+
+class LocalFeedSubscriber:
+    """
+    通过数据报接收更新（供其他进程使用，仅限支持 Unix 域套接字的系统）。
+    recv() 超时时会重新发送订阅请求，本程序重启后可以自动恢复。
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, reply_path: Optional[str] = None):
+        self.socket_path = socket_path
+        self.reply_path = reply_path or os.path.join(tempfile.gettempdir(), f"hrm_feed.{os.getpid()}.sock")
+        if os.path.exists(self.reply_path):
+            os.unlink(self.reply_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.reply_path)
+        self.subscribe()
+
+    def subscribe(self):
+        try:
+            self._socket.sendto(SUBSCRIBE, self.socket_path)
+        except OSError:
+            pass  # 本程序尚未启动，之后重试
+
+    def recv(self, timeout: float = 2.0) -> Optional[FeedSample]:
+        """等待下一条记录，超时返回 None"""
+        self._socket.settimeout(timeout)
+        try:
+            return decode(self._socket.recv(RECORD.size))
+        except socket.timeout:
+            self.subscribe()
+            return None
+
+    def close(self):
+        try:
+            self._socket.sendto(UNSUBSCRIBE, self.socket_path)
+        except OSError:
+            pass
+        self._socket.close()
+        try:
+            os.unlink(self.reply_path)
+        except OSError:
+            pass
@@ -5,30 +5,108 @@
 支持GUI界面和命令行模式
 """
 
+import time
+
+# 尽量早地记录启动时间，用于统计启动耗时（见 benchmarks/bench_startup.py）
+_STARTED_AT = time.perf_counter()
+
 import sys
 import argparse
-import asyncio
+
 def main():
     parser = argparse.ArgumentParser(description='心率监控器')
     parser.add_argument('--scan', action='store_true', help='仅扫描设备')
+    parser.add_argument('--sessions', action='store_true', help='列出历史记录中的会话')
+    parser.add_argument('--export', metavar='SESSION', help='导出历史记录中的会话（会话编号或 latest）')
+    parser.add_argument('--format', default='csv', choices=('csv', 'jsonl', 'tcx'), help='导出格式')
+    parser.add_argument('--interval', type=float, default=0, help='导出时每 N 秒合并为一个点，0 表示不合并')
+    parser.add_argument('--output', '-o', help='导出文件路径，默认按会话开始时间命名')
+    parser.add_argument('--feed', action='store_true', help='打印本机数据源（共享内存/数据报）中的心率，需在 config.json 中开启 local_feed')
     
     args = parser.parse_args()
     
     if args.scan:
         # 仅扫描设备
+        import asyncio
         from get_heart_rate.heart_rate_tool import scan_and_select_device
         asyncio.run(scan_and_select_device())
+
+    elif args.sessions or args.export:
+        sys.exit(run_history_command(args))
+
+    elif args.feed:
+        sys.exit(run_feed_command())
         
     else:
         # GUI模式（默认）
         try:
             from heart_rate_display_ui import HeartRateMonitor
-            app = HeartRateMonitor()
+            app = HeartRateMonitor(started_at=_STARTED_AT)
             app.run()
         except ImportError as e:
             print(f"GUI模式启动失败: {e}")
             print("请确保安装了tkinter库，或使用 --cli 参数运行命令行模式")
             sys.exit(1)
 
+def run_history_command(args) -> int:
+    """--sessions / --export：直接读取历史数据库，不启动界面"""
+    from datetime import datetime
+    from config import load_config
+    from history import HistoryStore, DEFAULT_HISTORY_PATH
+    from export import export_to_file, default_filename, latest_session_id
+
+    store = HistoryStore((load_config().get("history") or {}).get("path") or DEFAULT_HISTORY_PATH)
+    if args.sessions:
+        for session in store.sessions():
+            started = datetime.fromtimestamp(session["started_at"]).strftime("%Y-%m-%d %H:%M:%S")
+            duration = (session["ended_at"] or session["started_at"]) - session["started_at"]
+            print(f"{session['id']:>6}  {started}  {duration / 60:8.1f} 分钟  {session['device']}")
+        return 0
+
+    session_id = latest_session_id(store) if args.export == 'latest' else int(args.export)
+    session = store.session(session_id) if session_id is not None else None
+    if session is None:
+        print(f"会话 {args.export} 不存在")
+        return 1
+    path = args.output or default_filename(session, args.format)
+    try:
+        written = export_to_file(store, session_id, args.format, path, args.interval)
+    except ValueError as e:
+        print(f"导出失败: {e}")
+        return 1
+    print(f"已导出会话 {session_id} 到 {path}（{written / 1024:.1f} KB）")
+    return 0
+
+def run_feed_command() -> int:
+    """--feed：作为另一个进程读取本机数据源，有 Unix 域套接字时等待通知，否则轮询共享内存"""
+    import socket
+    from config import load_config
+    from local_feed import LocalFeedReader, LocalFeedSubscriber, DEFAULT_NAME, DEFAULT_SOCKET_PATH
+
+    settings = load_config().get("local_feed") or {}
+    try:
+        reader = LocalFeedReader(settings.get("name") or DEFAULT_NAME)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"无法打开本机数据源（程序是否在运行、local_feed 是否开启？）: {e}")
+        return 1
+    socket_path = settings.get("socket", DEFAULT_SOCKET_PATH)
+    subscriber = LocalFeedSubscriber(socket_path) if socket_path and hasattr(socket, "AF_UNIX") else None
+    try:
+        while True:
+            if subscriber:
+                sample = subscriber.recv()
+            else:
+                time.sleep(0.05)
+                sample = reader.poll()
+            if sample:
+                state = "已连接" if sample.connected else "未连接"
+                print(f"{sample.seq:>8}  {sample.heart_rate:>3} bpm  {state}  {sample.timestamp:.3f}", flush=True)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        reader.close()
+        if subscriber:
+            subscriber.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,271 @@
+# metrics.py
+
+"""
+轻量级运行指标，输出 Prometheus 文本格式 (text/plain; version=0.0.4)。
+
+热路径上的计数只做一次原子自增，不加锁：
+- Counter.inc() 基于 itertools.count，自增由 C 实现，在 GIL 下是原子的。
+- Histogram.observe() 只用一个几乎无竞争的锁保护 sum，桶计数同样是 itertools.count。
+读取（渲染 /metrics）时才把这些计数器的值取出来。
+"""
+
+import bisect
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+# 发送延迟直方图的默认桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _read_count(counter: itertools.count) -> int:
+    """在不推进计数器的情况下读取 itertools.count 的当前值（repr 形如 "count(42)"）"""
+    return int(repr(counter)[6:-1])
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """所有指标的基类，负责标签子指标的管理"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], '_Metric'] = {}
+        self._children_lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """获取（必要时创建）指定标签值的子指标。子指标会被缓存，热路径可直接持有其引用。"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self) -> '_Metric':
+        raise NotImplementedError
+
+    def _samples(self, label_values: tuple[str, ...]) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        if self.labelnames:
+            for key, child in list(self._children.items()):
+                lines.extend(child._samples(key))
+        else:
+            lines.extend(self._samples(()))
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), parent: Optional['Counter'] = None):
+        super().__init__(name, documentation, labelnames)
+        self._parent = parent
+        self._count = itertools.count()
+        # 非 1 的增量（例如字节数）比较少见，单独用锁累加
+        self._extra = 0
+        self._extra_lock = threading.Lock()
+
+    def _new_child(self) -> 'Counter':
+        return Counter(self.name, self.documentation, parent=self)
+
+    def inc(self, amount: int = 1):
+        if amount == 1:
+            next(self._count)
+        else:
+            with self._extra_lock:
+                self._extra += amount
+
+    @property
+    def value(self) -> int:
+        return _read_count(self._count) + self._extra
+
+    def _samples(self, label_values: tuple[str, ...]) -> list[str]:
+        names = self._parent.labelnames if self._parent else self.labelnames
+        return [f"{self.name}{_format_labels(names, label_values)} {self.value}"]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值；也可以绑定一个函数，在渲染时才取值"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), parent: Optional['Gauge'] = None):
+        super().__init__(name, documentation, labelnames)
+        self._parent = parent
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def _new_child(self) -> 'Gauge':
+        return Gauge(self.name, self.documentation, parent=self)
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """绑定取值函数，例如队列的 qsize；传入 None 取消绑定"""
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception:
+                return float("nan")
+        return self._value
+
+    def _samples(self, label_values: tuple[str, ...]) -> list[str]:
+        names = self._parent.labelnames if self._parent else self.labelnames
+        return [f"{self.name}{_format_labels(names, label_values)} {_format_value(self.value)}"]
+
+
+class Histogram(_Metric):
+    """固定桶的直方图"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS, parent: Optional['Histogram'] = None):
+        super().__init__(name, documentation, labelnames)
+        self._parent = parent
+        self.buckets = tuple(buckets)
+        self._bucket_counts = [itertools.count() for _ in range(len(self.buckets) + 1)]
+        self._sum = 0.0
+        self._sum_lock = threading.Lock()
+
+    def _new_child(self) -> 'Histogram':
+        return Histogram(self.name, self.documentation, buckets=self.buckets, parent=self)
+
+    def observe(self, value: float):
+        next(self._bucket_counts[bisect.bisect_left(self.buckets, value)])
+        with self._sum_lock:
+            self._sum += value
+
+    def time(self) -> '_Timer':
+        """用作上下文管理器，记录代码块的耗时"""
+        return _Timer(self)
+
+    def _samples(self, label_values: tuple[str, ...]) -> list[str]:
+        names = self._parent.labelnames if self._parent else self.labelnames
+        lines = []
+        cumulative = 0
+        for bound, counter in zip(self.buckets + (float("inf"),), self._bucket_counts):
+            cumulative += _read_count(counter)
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(names, label_values, le)} {cumulative}")
+        labels = _format_labels(names, label_values)
+        lines.append(f"{self.name}_sum{labels} {repr(self._sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Registry:
+    """指标注册表"""
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式输出全部指标"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- 整条数据链路的指标 ---
+NOTIFICATIONS = REGISTRY.counter("hr_ble_notifications_total", "收到的 BLE 心率通知数")
+DECODE_ERRORS = REGISTRY.counter("hr_ble_decode_errors_total", "解析失败的 BLE 心率通知数")
+BLE_CONNECTS = REGISTRY.counter("hr_ble_connects_total", "BLE 设备连接成功次数")
+BLE_RECONNECTS = REGISTRY.counter("hr_ble_reconnects_total", "本次运行中第一次之后的 BLE 连接次数")
+BLE_DISCONNECTS = REGISTRY.counter("hr_ble_disconnects_total", "BLE 设备断开次数")
+HEART_RATE_QUEUE_DEPTH = REGISTRY.gauge("hr_heart_rate_queue_depth", "heart_rate_queue 中等待 UI 处理的样本数")
+LOG_QUEUE_DEPTH = REGISTRY.gauge("hr_log_queue_depth", "log_queue 中等待显示的日志条数")
+SECONDS_SINCE_LAST_SAMPLE = REGISTRY.gauge("hr_seconds_since_last_sample", "距离最近一次收到心率样本的秒数，尚无样本时为 -1")
+WEBSOCKET_CLIENTS = REGISTRY.gauge("hr_websocket_clients", "当前连接的 WebSocket 客户端数")
+SINK_SENDS = REGISTRY.counter("hr_sink_sends_total", "各输出端成功发送的次数", ("sink",))
+SINK_ERRORS = REGISTRY.counter("hr_sink_errors_total", "各输出端发送失败的次数", ("sink",))
+SINK_LATENCY = REGISTRY.histogram("hr_sink_send_seconds", "各输出端单次发送耗时（秒）", ("sink",))
+SINK_DROPS = REGISTRY.counter("hr_sink_dropped_total", "各输出端因队列已满丢弃的事件数", ("sink",))
+SINK_HANDLER_ERRORS = REGISTRY.counter("hr_sink_handler_errors_total", "各输出端处理事件时抛出的异常数", ("sink",))
+SINK_QUEUE_DEPTH = REGISTRY.gauge("hr_sink_queue_depth", "各输出端队列中等待处理的事件数", ("sink",))
+FILTER_REJECTED = REGISTRY.counter("hr_filter_rejected_total", "被滤波器丢弃的样本数", ("reason",))
+STARTUP_WINDOW_SECONDS = REGISTRY.gauge("hr_startup_window_seconds", "从进程启动到主窗口显示的秒数")
+STARTUP_FIRST_SAMPLE_SECONDS = REGISTRY.gauge("hr_startup_first_sample_seconds", "从进程启动到收到第一个心率样本的秒数，尚无样本时为 -1")
+RUNTIME_TASK_RESTARTS = REGISTRY.counter("hr_runtime_task_restarts_total", "后台任务异常退出后被重启的次数", ("task",))
+THREADS = REGISTRY.gauge("hr_threads", "进程中的线程数")
+LOCAL_FEED_SUBSCRIBERS = REGISTRY.gauge("hr_local_feed_subscribers", "订阅本机数据报通知的进程数")
+MQTT_INFLIGHT = REGISTRY.gauge("hr_mqtt_inflight", "已发送、等待 MQTT 服务器确认的消息数")
+MQTT_CONNECTED = REGISTRY.gauge("hr_mqtt_connected", "是否已连接 MQTT 服务器（1/0）")
+STARTUP_FIRST_SAMPLE_SECONDS.set(-1)
+
+_last_sample_time: Optional[float] = None
+
+
+def mark_sample():
+    """记录收到样本的时间（BLE 回调中调用）"""
+    global _last_sample_time
+    _last_sample_time = time.monotonic()
+
+
+SECONDS_SINCE_LAST_SAMPLE.set_function(
+    lambda: time.monotonic() - _last_sample_time if _last_sample_time is not None else -1
+)
+THREADS.set_function(threading.active_count)
@@ -0,0 +1,375 @@
+# mqtt_client.py
+
+"""
+MQTT 输出端（可选）：保持一个到 MQTT 服务器的持久连接，按设备发布心率和连接状态，
+供 Home Assistant、Node-RED、Telegraf 等基于 MQTT 的系统使用，不必再经 Webhook 每个心跳发一个 HTTP 请求。
+
+主题（prefix 默认为 heart_rate，设备为去掉冒号的 MAC 地址）：
+
+    {prefix}/status                "online" / "offline"，保留消息；异常断线时由服务器发布遗嘱 "offline"
+    {prefix}/{device}/heart_rate   {"heart_rate": 72, "raw_heart_rate": 73, "seq": 1024, "timestamp": ..., "rr": [...]}，保留消息
+    {prefix}/{device}/connected    "true" / "false"，保留消息
+
+MqttClient 是一个只发布、不订阅的最小 MQTT 3.1.1 客户端，运行在后台运行时的事件循环中：
+- publish() 只把消息放入有界队列（满时丢弃最旧的），从不阻塞样本的处理；
+- QoS 1/2 的消息最多有 max_inflight 条在等待确认，窗口满时新消息留在队列中，收到确认后继续发送；
+- 队列中积压的消息合并为一次写入（批量发送）；
+- 断线后由运行时退避重连，未确认的消息带 DUP 标志重新发送。
+
+在 config.json 中开启：
+
+    "mqtt": {"enabled": true, "host": "192.168.1.2", "port": 1883, "username": "", "password": "",
+             "prefix": "heart_rate", "qos": 1}
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+from collections import OrderedDict, deque
+from typing import Callable, NamedTuple, Optional, TYPE_CHECKING
+
+import metrics
+from sinks import Sink, SinkEvent, EVENT_HEART_RATE, EVENT_CONNECTED, EVENT_DISCONNECTED
+
+if TYPE_CHECKING:
+    from runtime import AsyncRuntime
+
+DEFAULT_PORT = 1883
+DEFAULT_PREFIX = "heart_rate"
+# 心跳间隔（秒）：这么久没有发送任何数据时发送 PINGREQ
+KEEPALIVE = 30
+# 等待确认的 QoS 1/2 消息的最大条数
+MAX_INFLIGHT = 20
+# 等待发送的消息的最大条数，超过时丢弃最旧的
+QUEUE_SIZE = 1000
+# 建立连接、等待 CONNACK 的超时（秒）
+CONNECT_TIMEOUT = 10.0
+
+# 控制报文类型
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+CONNACK_ERRORS = {
+    1: "不支持的协议版本",
+    2: "客户端标识不合法",
+    3: "服务不可用",
+    4: "用户名或密码错误",
+    5: "未授权",
+}
+
+_SENDS = metrics.SINK_SENDS.labels("mqtt")
+_ERRORS = metrics.SINK_ERRORS.labels("mqtt")
+_LATENCY = metrics.SINK_LATENCY.labels("mqtt")
+_DROPS = metrics.SINK_DROPS.labels("mqtt")
+
+
+class MqttError(Exception):
+    pass
+
+
+class MqttMessage(NamedTuple):
+    topic: str
+    payload: bytes
+    qos: int = 0
+    retain: bool = False
+
+
+def _remaining_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        encoded.append(digit | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _string(value) -> bytes:
+    data = value.encode("utf-8") if isinstance(value, str) else value
+    return struct.pack("!H", len(data)) + data
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([packet_type << 4 | flags]) + _remaining_length(len(body)) + body
+
+
+def publish_packet(message: MqttMessage, packet_id: Optional[int] = None, dup: bool = False) -> bytes:
+    flags = (0x08 if dup else 0) | message.qos << 1 | (0x01 if message.retain else 0)
+    body = _string(message.topic)
+    if message.qos:
+        body += struct.pack("!H", packet_id)
+    return _packet(PUBLISH, flags, body + message.payload)
+
+
+async def read_packet(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+    """读取一个控制报文，返回 (类型, 标志位, 报文体)"""
+    first = (await reader.readexactly(1))[0]
+    length = 0
+    for shift in range(0, 28, 7):
+        digit = (await reader.readexactly(1))[0]
+        length |= (digit & 0x7F) << shift
+        if not digit & 0x80:
+            break
+    else:
+        raise MqttError("剩余长度字段不合法")
+    return first >> 4, first & 0x0F, await reader.readexactly(length)
+
+
+class _InFlight:
+    """已发送、等待确认的 QoS 1/2 消息"""
+    __slots__ = ("message", "sent_at", "released")
+
+    def __init__(self, message: MqttMessage):
+        self.message = message
+        self.sent_at = time.perf_counter()
+        self.released = False  # QoS 2：已收到 PUBREC、发送了 PUBREL，等待 PUBCOMP
+
+
+class MqttClient:
+    """
+    只发布的 MQTT 3.1.1 客户端。连接作为受看管的任务 name 运行在运行时中；
+    publish() 可以在任意线程中调用，其余方法只在事件循环中使用。
+    """
+
+    def __init__(self, runtime: 'AsyncRuntime', host: str, port: int = DEFAULT_PORT, client_id: str = "",
+                 username: str = "", password: str = "", keepalive: int = KEEPALIVE,
+                 max_inflight: int = MAX_INFLIGHT, queue_size: int = QUEUE_SIZE,
+                 will: Optional[MqttMessage] = None, birth: Optional[MqttMessage] = None,
+                 logger: Callable[[str], None] = print, name: str = "mqtt"):
+        self.runtime = runtime
+        self.host = host
+        self.port = int(port)
+        self.client_id = client_id or f"heart_rate_display-{os.getpid()}"
+        self.username = username
+        self.password = password
+        self.keepalive = int(keepalive)
+        self.max_inflight = max(1, int(max_inflight))
+        self.queue_size = max(1, int(queue_size))
+        # 遗嘱：异常断线时由服务器发布；正常断开前由客户端自己发布
+        self.will = will
+        # 每次连接成功后首先发布的消息（例如 "online"）
+        self.birth = birth
+        self.logger = logger
+        self.name = name
+        self.connected = False
+        self._queue: deque[MqttMessage] = deque()
+        self._inflight: OrderedDict[int, _InFlight] = OrderedDict()
+        self._last_id = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        # 需要尽快发送的控制报文（PUBREL、PINGREQ），与消息一起批量写入
+        self._control: list[bytes] = []
+        self._last_sent = 0.0
+        self._last_received = 0.0
+
+    def start(self):
+        self.runtime.supervise(self.name, self._run)
+
+    def stop(self, timeout: Optional[float] = None):
+        """断开连接；在事件循环线程中调用时不等待"""
+        self.runtime.cancel(self.name, timeout)
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False):
+        """把消息放入发送队列，立即返回"""
+        self.runtime.call_soon(self._enqueue, MqttMessage(topic, payload, qos, retain))
+
+    def _enqueue(self, message: MqttMessage):
+        if len(self._queue) >= self.queue_size:
+            self._queue.popleft()
+            _DROPS.inc()
+        self._queue.append(message)
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _connect_packet(self) -> bytes:
+        flags = 0x02  # clean session：未确认的消息由客户端自己重发
+        payload = _string(self.client_id)
+        if self.will:
+            flags |= 0x04 | self.will.qos << 3 | (0x20 if self.will.retain else 0)
+            payload += _string(self.will.topic) + _string(self.will.payload)
+        if self.username:
+            flags |= 0x80
+            payload += _string(self.username)
+            if self.password:
+                flags |= 0x40
+                payload += _string(self.password)
+        body = _string("MQTT") + bytes([4, flags]) + struct.pack("!H", self.keepalive) + payload
+        return _packet(CONNECT, 0, body)
+
+    def _next_id(self) -> int:
+        while True:
+            self._last_id = self._last_id % 0xFFFF + 1
+            if self._last_id not in self._inflight:
+                return self._last_id
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            _ERRORS.inc()
+            raise
+        try:
+            writer.write(self._connect_packet())
+            packet_type, _, body = await asyncio.wait_for(read_packet(reader), CONNECT_TIMEOUT)
+            if packet_type != CONNACK or len(body) < 2:
+                raise MqttError("服务器没有回复 CONNACK")
+            if body[1]:
+                raise MqttError(f"服务器拒绝连接: {CONNACK_ERRORS.get(body[1], body[1])}")
+            self.connected = True
+            metrics.MQTT_CONNECTED.set(1)
+            self.logger(f"已连接 MQTT 服务器 {self.host}:{self.port}")
+            self._last_sent = self._last_received = time.monotonic()
+            self._control = []
+            self._on_connect(writer)
+            self._wakeup.set()
+            tasks = [asyncio.create_task(self._read_loop(reader)),
+                     asyncio.create_task(self._write_loop(writer)),
+                     asyncio.create_task(self._keepalive_loop(writer))]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            for task in done:
+                task.result()
+            raise MqttError("连接已断开")
+        except asyncio.CancelledError:
+            if self.connected:
+                # 正常断开时服务器不会发布遗嘱，由客户端自己发布
+                if self.will:
+                    writer.write(publish_packet(self.will._replace(qos=0)))
+                writer.write(_packet(DISCONNECT, 0, b""))
+            raise
+        except Exception:
+            _ERRORS.inc()
+            raise
+        finally:
+            if self.connected:
+                self.logger("已断开 MQTT 服务器")
+            self.connected = False
+            metrics.MQTT_CONNECTED.set(0)
+            writer.close()
+
+    def _on_connect(self, writer: asyncio.StreamWriter):
+        """重发上次连接中未确认的消息，并把 birth 消息放到队列最前面"""
+        batch = []
+        for packet_id, entry in self._inflight.items():
+            entry.sent_at = time.perf_counter()
+            if entry.released:
+                batch.append(_packet(PUBREL, 0x02, struct.pack("!H", packet_id)))
+            else:
+                batch.append(publish_packet(entry.message, packet_id, dup=True))
+        writer.write(b"".join(batch))
+        if self.birth:
+            self._queue.appendleft(self.birth)
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                packet_type, _, body = await read_packet(reader)
+            except asyncio.IncompleteReadError:
+                raise MqttError("服务器关闭了连接") from None
+            self._last_received = time.monotonic()
+            if packet_type in (PUBACK, PUBREC, PUBCOMP) and len(body) >= 2:
+                packet_id = struct.unpack_from("!H", body)[0]
+                entry = self._inflight.get(packet_id)
+                if entry is None:
+                    continue
+                if packet_type == PUBREC:
+                    entry.released = True
+                    self._send_control(_packet(PUBREL, 0x02, struct.pack("!H", packet_id)))
+                    continue
+                del self._inflight[packet_id]
+                metrics.MQTT_INFLIGHT.set(len(self._inflight))
+                _SENDS.inc()
+                _LATENCY.observe(time.perf_counter() - entry.sent_at)
+                # 窗口有了空位，继续发送队列中的消息
+                self._wakeup.set()
+
+    def _send_control(self, data: bytes):
+        self._control.append(data)
+        self._wakeup.set()
+
+    async def _write_loop(self, writer: asyncio.StreamWriter):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._control = self._control, []
+            queue = self._queue
+            while queue and (queue[0].qos == 0 or len(self._inflight) < self.max_inflight):
+                message = queue.popleft()
+                if message.qos:
+                    packet_id = self._next_id()
+                    self._inflight[packet_id] = _InFlight(message)
+                    batch.append(publish_packet(message, packet_id))
+                else:
+                    batch.append(publish_packet(message))
+                    _SENDS.inc()
+            if batch:
+                metrics.MQTT_INFLIGHT.set(len(self._inflight))
+                writer.write(b"".join(batch))
+                self._last_sent = time.monotonic()
+                # 服务器接收得慢时在这里等待，队列继续积压，不影响样本的处理
+                await writer.drain()
+
+    async def _keepalive_loop(self, writer: asyncio.StreamWriter):
+        if not self.keepalive:
+            return await asyncio.Event().wait()
+        interval = self.keepalive / 2
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            if now - self._last_received > self.keepalive * 1.5:
+                raise MqttError("服务器无响应")
+            if now - self._last_sent >= interval:
+                self._send_control(_packet(PINGREQ, 0, b""))
+
+
+def topic_device(device: str) -> str:
+    """主题中的设备名：去掉 MAC 地址的冒号，并替换 MQTT 的通配符和层级分隔符"""
+    name = device.replace(":", "").upper() or "unknown"
+    for char in "/+#":
+        name = name.replace(char, "_")
+    return name
+
+
+class MqttSink(Sink):
+    """把心率和连接状态发布到 MQTT；只做编码和入队，在事件循环中处理"""
+    name = "mqtt"
+    runs_on_loop = True
+
+    def __init__(self, runtime: 'AsyncRuntime', host: str, port: int = DEFAULT_PORT, username: str = "",
+                 password: str = "", prefix: str = DEFAULT_PREFIX, qos: int = 1, client_id: str = "",
+                 keepalive: int = KEEPALIVE, max_inflight: int = MAX_INFLIGHT):
+        if qos not in (0, 1, 2):
+            raise ValueError(f"QoS 只能是 0、1 或 2，而不是 {qos!r}")
+        self.prefix = prefix.strip("/") or DEFAULT_PREFIX
+        self.qos = qos
+        status_topic = f"{self.prefix}/status"
+        self.client = MqttClient(runtime, host, port, client_id, username, password, keepalive, max_inflight,
+                                 will=MqttMessage(status_topic, b"offline", qos, True),
+                                 birth=MqttMessage(status_topic, b"online", qos, True))
+
+    def open(self):
+        self.client.logger = self.logger
+        self.client.start()
+
+    def handle(self, event: SinkEvent):
+        base = f"{self.prefix}/{topic_device(event.device)}"
+        if event.kind == EVENT_HEART_RATE:
+            if event.heart_rate <= 0:
+                return
+            payload = {
+                "heart_rate": event.heart_rate,
+                "raw_heart_rate": event.raw_heart_rate,
+                **event.timing(),
+                "rr": [round(r, 4) for r in event.rr_intervals],
+            }
+            self.client.publish(f"{base}/heart_rate", json.dumps(payload).encode("utf-8"), self.qos, True)
+        elif event.kind in (EVENT_CONNECTED, EVENT_DISCONNECTED):
+            self.client.publish(f"{base}/connected", b"true" if event.connected else b"false", self.qos, True)
+
+    def close(self):
+        self.client.stop()
@@ -0,0 +1,93 @@
+# multicast.py
+
+"""
+组播输出端（可选）：每个样本向局域网组播组发送一个定长的数据报，
+局域网内任意多的接收端都能收到，而本程序只发送一次，不需要它们各自轮询 API 或保持 WebSocket 连接。
+
+数据报格式和参考接收端见 multicast_listener.py。在 config.json 中开启：
+
+    "multicast": {"enabled": true, "group": "239.255.72.66", "port": 7266, "ttl": 1, "interface": ""}
+
+ttl 为 1 时数据报不会离开本网段；interface 为发送所用网卡的 IP 地址，留空由系统选择。
+UDP 不保证送达，接收端可以用样本序号发现丢失的数据报。
+"""
+
+import hashlib
+import socket
+import time
+
+import metrics
+from multicast_listener import DEFAULT_GROUP, DEFAULT_PORT, MAGIC, VERSION, PACKET, FLAG_CONNECTED, FLAG_STATUS
+from sinks import Sink, SinkEvent, EVENT_HEART_RATE, EVENT_CONNECTED, EVENT_DISCONNECTED
+
+_SENDS = metrics.SINK_SENDS.labels("multicast")
+_ERRORS = metrics.SINK_ERRORS.labels("multicast")
+_LATENCY = metrics.SINK_LATENCY.labels("multicast")
+
+
+def device_bytes(device: str) -> bytes:
+    """MAC 地址转为 6 个字节；其他标识（例如 macOS 上的 UUID）取 SHA-1 的前 6 个字节"""
+    digits = device.replace(":", "").replace("-", "")
+    if len(digits) == 12:
+        try:
+            return bytes.fromhex(digits)
+        except ValueError:
+            pass
+    if not device:
+        return bytes(6)
+    return hashlib.sha1(device.encode("utf-8")).digest()[:6]
+
+
+def encode(event: SinkEvent) -> bytes:
+    flags = FLAG_CONNECTED if event.connected else 0
+    if event.kind != EVENT_HEART_RATE:
+        flags |= FLAG_STATUS
+    heart_rate = 0 if event.kind == EVENT_DISCONNECTED else max(0, min(0xFFFF, event.heart_rate))
+    return PACKET.pack(MAGIC, VERSION, flags, event.seq & 0xFFFFFFFF, event.timestamp, heart_rate,
+                       device_bytes(event.device))
+
+
+class MulticastSink(Sink):
+    """非阻塞地发送组播数据报，因此在事件循环中处理；发送缓冲区满时丢弃这一条"""
+    name = "multicast"
+    queue_size = 16
+    runs_on_loop = True
+
+    def __init__(self, group: str = DEFAULT_GROUP, port: int = DEFAULT_PORT, ttl: int = 1, interface: str = ""):
+        self.address = (group, int(port))
+        self.ttl = int(ttl)
+        self.interface = interface
+        self._socket = None
+
+    def open(self):
+        if socket.inet_aton(self.address[0])[0] & 0xF0 != 0xE0:
+            raise ValueError(f"{self.address[0]} 不是 IPv4 组播地址（224.0.0.0/4）")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        # 同一台电脑上的接收端也能收到
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        if self.interface:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+        sock.setblocking(False)
+        self._socket = sock
+        self.logger(f"组播输出已开启: {self.address[0]}:{self.address[1]}（TTL {self.ttl}）")
+
+    def handle(self, event: SinkEvent):
+        if event.kind not in (EVENT_HEART_RATE, EVENT_CONNECTED, EVENT_DISCONNECTED) or self._socket is None:
+            return
+        start = time.perf_counter()
+        try:
+            self._socket.sendto(encode(event), self.address)
+        except BlockingIOError:
+            _ERRORS.inc()  # 发送缓冲区已满，丢弃这一条
+            return
+        except OSError:
+            _ERRORS.inc()
+            raise
+        _SENDS.inc()
+        _LATENCY.observe(time.perf_counter() - start)
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
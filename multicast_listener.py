@@ -0,0 +1,131 @@
+# multicast_listener.py
+
+"""
+组播心率数据的参考接收端。
+
+只依赖标准库，可以单独复制到局域网内的其他电脑（灯光控制、第二台推流电脑、记分板等）上运行。
+数据报格式也定义在这里，multicast.py 中的 MulticastSink 按同一格式发送。
+
+数据报（网络字节序，共 PACKET.size = 24 字节）：
+
+    偏移  类型  说明
+    0     2s    魔数 b"HR"
+    2     u8    格式版本，当前为 1
+    3     u8    标志位：bit0 已连接；bit1 连接状态变化事件（而不是新样本）
+    4     u32   样本序号
+    8     f64   采集时间（Unix 秒）
+    16    u16   心率（bpm），断开时为 0
+    18    6s    设备：MAC 地址的 6 个字节；不是 MAC 地址的标识为其 SHA-1 的前 6 个字节
+
+用法: python multicast_listener.py [--group 239.255.72.66] [--port 7266] [--interface 192.168.1.10] [--count N]
+"""
+
+import argparse
+import socket
+import struct
+import time
+from typing import Iterator, NamedTuple, Optional
+
+DEFAULT_GROUP = "239.255.72.66"
+DEFAULT_PORT = 7266
+
+MAGIC = b"HR"
+VERSION = 1
+PACKET = struct.Struct("!2sBBIdH6s")
+
+FLAG_CONNECTED = 0x01
+FLAG_STATUS = 0x02
+
+
+class HeartRatePacket(NamedTuple):
+    seq: int
+    timestamp: float
+    heart_rate: int
+    device: str                # AA:BB:CC:DD:EE:FF 形式
+    connected: bool
+    status_change: bool
+
+
+def decode(data: bytes) -> Optional[HeartRatePacket]:
+    """解析一个数据报，格式不符时返回 None"""
+    if len(data) < PACKET.size:
+        return None
+    magic, version, flags, seq, timestamp, heart_rate, device = PACKET.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return HeartRatePacket(seq, timestamp, heart_rate, ":".join(f"{b:02X}" for b in device),
+                           bool(flags & FLAG_CONNECTED), bool(flags & FLAG_STATUS))
+
+
+def open_socket(group: str = DEFAULT_GROUP, port: int = DEFAULT_PORT, interface: str = "0.0.0.0") -> socket.socket:
+    """加入组播组；同一台电脑上可以同时运行多个接收端"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except OSError:
+            pass
+    sock.bind(("", port))
+    membership = socket.inet_aton(group) + socket.inet_aton(interface)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    return sock
+
+
+def listen(sock: socket.socket, timeout: Optional[float] = None) -> Iterator[HeartRatePacket]:
+    """逐个产出收到的数据报，忽略格式不符的数据；timeout 秒内没有数据时结束"""
+    sock.settimeout(timeout)
+    while True:
+        try:
+            data = sock.recv(512)
+        except socket.timeout:
+            return
+        packet = decode(data)
+        if packet is not None:
+            yield packet
+
+
+def count_lost(last_seq: dict[str, int], packet: HeartRatePacket) -> int:
+    """
+    同一设备的样本序号不连续时说明有数据报丢失（UDP 不保证送达），返回丢失的个数。
+    连接状态变化事件携带的是上一个样本的序号，不参与计算，也不更新 last_seq。
+    """
+    if packet.status_change:
+        return 0
+    previous = last_seq.get(packet.device)
+    last_seq[packet.device] = packet.seq
+    return packet.seq - previous - 1 if previous is not None and packet.seq > previous else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接收组播的心率数据")
+    parser.add_argument("--group", default=DEFAULT_GROUP)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--interface", default="0.0.0.0", help="在哪个网卡（IP 地址）上加入组播组")
+    parser.add_argument("--count", type=int, default=0, help="收到 N 个数据报后退出，0 表示一直运行")
+    parser.add_argument("--timeout", type=float, help="超过这么多秒没有数据时退出")
+    args = parser.parse_args()
+
+    sock = open_socket(args.group, args.port, args.interface)
+    print(f"正在接收 {args.group}:{args.port} ...", flush=True)
+    last_seq: dict[str, int] = {}
+    received = 0
+    try:
+        for packet in listen(sock, args.timeout):
+            received += 1
+            lost = count_lost(last_seq, packet)
+            state = "已连接" if packet.connected else "未连接"
+            delay = (time.time() - packet.timestamp) * 1000
+            print(f"{packet.device}  #{packet.seq:<8} {packet.heart_rate:>3} bpm  {state}"
+                  f"{'  [状态变化]' if packet.status_change else ''}  延迟 {delay:.1f} ms"
+                  f"{f'  丢失 {lost} 个' if lost > 0 else ''}", flush=True)
+            if args.count and received >= args.count:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+# overlay.py
+
+"""
+内置的 OBS 浏览器源悬浮窗（API 服务器的 /overlay）。
+
+页面按悬浮窗的显示格式和颜色渲染，心率和统计来自 WebSocket，在 OBS 中添加浏览器源即可使用。
+
+所有资源都只生成一次并常驻内存，带强 ETag 和预先压缩好的 gzip 版本：
+- /overlay 页面本身每次都向服务器确认（no-cache），未变化时返回 304；
+- JS/CSS 的地址带内容哈希，可以被浏览器永久缓存（immutable）；
+- /overlay/config.json（显示格式、颜色等）只在设置变化时重新生成，页面定期以 ETag 确认；
+- 悬浮窗图片第一次请求时读入内存，之后不再读盘。
+几十个浏览器源同时刷新时，服务器只是比较 ETag 或写出内存中的字节。
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from functools import lru_cache
+from typing import NamedTuple, Optional, TYPE_CHECKING
+
+from floating_window import compile_format
+from http_async import Request, Response
+from session_stats import DEFAULT_WINDOW
+
+if TYPE_CHECKING:
+    from heart_rate_display_ui import HeartRateMonitor
+
+# 内容带哈希、永不变化的资源
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+# 每次使用前都要确认（通常得到 304）
+CACHE_REVALIDATE = "no-cache"
+# 超过这个大小的图片不提供给悬浮窗页面
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+
+OVERLAY_CSS = """\
+html, body { margin: 0; background: transparent; overflow: hidden; }
+#overlay {
+  display: inline-flex; align-items: center; white-space: pre;
+  font-size: var(--size, 64px); line-height: 1.2;
+  font-family: "Segoe UI Emoji", "Apple Color Emoji", "Noto Color Emoji", sans-serif;
+}
+#overlay .bpm, #overlay .stat { font-family: Arial, sans-serif; font-weight: bold; }
+#overlay .img { height: 1.25em; }
+#overlay.beating .img.pulse { animation: beat var(--beat, 1s) infinite; }
+@keyframes beat { 0% { transform: scale(1); } 15% { transform: scale(1.15); } 100% { transform: scale(1); } }
+"""
+
+OVERLAY_JS = """\
+"use strict";
+// 悬浮窗页面：按 /overlay/config.json 构建内容，通过 WebSocket 接收心率和统计
+const CONFIG_URL = "/overlay/config.json";
+const CONFIG_POLL_MS = 5000;
+const RETRY_MAX_MS = 30000;
+const root = document.getElementById("overlay");
+let config = null;
+let configText = "";
+let socketUrl = "";
+let socket = null;
+let retryMs = 1000;
+let bpm = 0;
+let stats = null;
+
+const params = new URLSearchParams(location.search);
+if (params.get("size")) root.style.setProperty("--size", params.get("size") + "px");
+
+function build() {
+  root.textContent = "";
+  for (const part of config.plan) {
+    let node;
+    if (part.type === "img") {
+      if (!config.image) continue;
+      node = document.createElement("img");
+      node.src = config.image;
+      node.className = config.animation === "pulse" ? "img pulse" : "img";
+    } else {
+      node = document.createElement("span");
+      node.className = part.type;
+      node.style.color = part.type === "text" ? config.text_color : config.bpm_color;
+      if (part.type === "text") node.textContent = part.text;
+      if (part.type === "stat") { node.dataset.window = part.window; node.dataset.key = part.key; }
+    }
+    root.appendChild(node);
+  }
+  render();
+}
+
+function render() {
+  if (!config) return;
+  const text = bpm > 0 ? String(bpm) : "--";
+  for (const node of root.querySelectorAll(".bpm")) node.textContent = text;
+  for (const node of root.querySelectorAll(".stat")) {
+    const value = stats && stats[node.dataset.window] ? stats[node.dataset.window][node.dataset.key] : null;
+    node.textContent = value == null ? "--" : String(Math.round(value));
+  }
+  root.classList.toggle("beating", bpm > 0);
+  if (bpm > 0) root.style.setProperty("--beat", (60 / bpm) + "s");
+}
+
+function connect() {
+  if (socket) { socket.onclose = null; socket.close(); socket = null; }
+  if (!socketUrl) return;
+  socket = new WebSocket(socketUrl);
+  socket.onopen = () => {
+    retryMs = 1000;
+    const fields = config.plan.some(part => part.type === "stat") ? ["bpm", "stats"] : ["bpm"];
+    socket.send(JSON.stringify({ type: "subscribe", fields: fields }));
+  };
+  socket.onmessage = (message) => {
+    const data = JSON.parse(message.data);
+    if (data.type) return;  // subscribed / error / alert
+    bpm = data.connected ? data.heart_rate : 0;
+    if ("stats" in data) stats = data.stats;
+    render();
+  };
+  socket.onclose = () => {
+    bpm = 0;
+    render();
+    setTimeout(connect, retryMs);
+    retryMs = Math.min(retryMs * 2, RETRY_MAX_MS);
+  };
+}
+
+function websocketUrl() {
+  if (!config.websocket) return "";
+  const port = config.websocket.shared ? location.port : config.websocket.port;
+  const scheme = location.protocol === "https:" ? "wss" : "ws";
+  return scheme + "://" + location.hostname + (port ? ":" + port : "") + "/";
+}
+
+async function loadConfig() {
+  try {
+    const response = await fetch(CONFIG_URL, { cache: "no-cache" });
+    const text = await response.text();
+    if (response.ok && text !== configText) {
+      configText = text;
+      config = JSON.parse(text);
+      build();
+      const url = websocketUrl();
+      if (url !== socketUrl) { socketUrl = url; connect(); }
+    }
+  } catch (e) {
+    // API 服务器暂时不可用，下次轮询时重试
+  }
+  setTimeout(loadConfig, CONFIG_POLL_MS);
+}
+
+loadConfig();
+"""
+
+OVERLAY_HTML = """\
+<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>心率悬浮窗</title>
+<link rel="stylesheet" href="{css}">
+</head>
+<body>
+<div id="overlay"></div>
+<script src="{js}"></script>
+</body>
+</html>
+"""
+
+
+class StaticAsset(NamedTuple):
+    """常驻内存的资源及其预先压缩的版本"""
+    content_type: str
+    body: bytes
+    etag: str
+    cache_control: str
+    gzip_body: Optional[bytes] = None   # 压缩后不更小时为 None
+    gzip_etag: str = ""                 # 压缩版本是另一种表示，使用不同的强 ETag
+
+    @classmethod
+    def build(cls, body: bytes, content_type: str, cache_control: str) -> 'StaticAsset':
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # mtime=0 使同样的内容总是得到同样的压缩结果
+        compressed = gzip.compress(body, 9, mtime=0)
+        if len(compressed) >= len(body):
+            return cls(content_type, body, f'"{digest}"', cache_control)
+        return cls(content_type, body, f'"{digest}"', cache_control, compressed, f'"{digest}-gz"')
+
+
+def _accepts_gzip(request: Request) -> bool:
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            q = params.strip().lower()
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:] or 0) > 0
+            except ValueError:
+                return False  # q 值不合法时按不接受 gzip 处理
+    return False
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 使用弱比较：忽略 W/ 前缀"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def respond(request: Request, asset: StaticAsset) -> Response:
+    """按 If-None-Match 和 Accept-Encoding 返回 304、压缩版本或原始版本"""
+    use_gzip = asset.gzip_body is not None and _accepts_gzip(request)
+    etag = asset.gzip_etag if use_gzip else asset.etag
+    headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+    if asset.gzip_body is not None:
+        headers["Vary"] = "Accept-Encoding"
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(304, b"", None, headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(200, asset.gzip_body, asset.content_type, headers)
+    return Response(200, asset.body, asset.content_type, headers)
+
+
+@lru_cache(maxsize=None)
+def static_assets() -> dict[str, StaticAsset]:
+    """页面、脚本和样式表；脚本和样式表的地址带内容哈希，页面在它们之后生成"""
+    css = StaticAsset.build(OVERLAY_CSS.encode("utf-8"), "text/css; charset=utf-8", CACHE_IMMUTABLE)
+    js = StaticAsset.build(OVERLAY_JS.encode("utf-8"), "text/javascript; charset=utf-8", CACHE_IMMUTABLE)
+    html = OVERLAY_HTML.format(css=f"/overlay/overlay.css?v={css.etag.strip(chr(34))}",
+                               js=f"/overlay/overlay.js?v={js.etag.strip(chr(34))}")
+    return {
+        "/overlay": StaticAsset.build(html.encode("utf-8"), "text/html; charset=utf-8", CACHE_REVALIDATE),
+        "/overlay/overlay.css": css,
+        "/overlay/overlay.js": js,
+    }
+
+
+def _plan(display_format: str) -> list[dict]:
+    """悬浮窗格式的渲染计划，统计占位符拆成 (窗口, 指标)，页面无需了解命名规则"""
+    plan = []
+    for kind, text in compile_format(display_format):
+        if kind == 'stat':
+            key, _, window = text[1:-1].partition("_")
+            plan.append({"type": "stat", "key": key, "window": window or DEFAULT_WINDOW})
+        elif kind == 'text':
+            plan.append({"type": "text", "text": text})
+        else:
+            plan.append({"type": kind})
+    return plan
+
+
+class Overlay:
+    """
+    /overlay 下的所有资源。config.json 和图片按当前设置缓存，设置不变时直接复用。
+    除 /overlay/image 第一次读取图片外，所有请求都不阻塞，可以直接在事件循环中处理。
+    """
+
+    def __init__(self, monitor_instance: 'HeartRateMonitor'):
+        self.monitor_instance = monitor_instance
+        self._config: Optional[tuple[tuple, StaticAsset]] = None
+        self._image: Optional[tuple[str, Optional[StaticAsset]]] = None
+
+    def needs_blocking(self, request: Request) -> bool:
+        image_path = self.monitor_instance.floating_window.image_path
+        return request.path == "/overlay/image" and (self._image is None or self._image[0] != image_path)
+
+    def handle(self, request: Request) -> Response:
+        path = request.path.rstrip("/") or "/"
+        asset = static_assets().get(path)
+        if asset is None:
+            if path == "/overlay/config.json":
+                asset = self.config_asset()
+            elif path == "/overlay/image":
+                asset = self.image_asset()
+        if asset is None:
+            return Response.text(404, "Not Found")
+        return respond(request, asset)
+
+    def config_asset(self) -> StaticAsset:
+        window = self.monitor_instance.floating_window
+        websocket = self.monitor_instance.websocket_server
+        key = (window.display_format, window.unlocked_color, window.locked_color, window.locked, window.image_path,
+               window.animation_mode, websocket.port if websocket else None, websocket.shared if websocket else False)
+        cached = self._config
+        if cached and cached[0] == key:
+            return cached[1]
+        config = {
+            "plan": _plan(window.display_format),
+            # 与悬浮窗一致：心率和统计数字使用当前（锁定/未锁定）颜色，其余文本使用未锁定颜色
+            "bpm_color": window.locked_color if window.locked else window.unlocked_color,
+            "text_color": window.unlocked_color,
+            "image": f"/overlay/image?v={hashlib.sha256(window.image_path.encode('utf-8')).hexdigest()[:12]}"
+                     if window.image_path else None,
+            "animation": window.animation_mode,
+            "websocket": {"port": websocket.port, "shared": websocket.shared} if websocket else None,
+        }
+        asset = StaticAsset.build(json.dumps(config, ensure_ascii=False).encode("utf-8"),
+                                  "application/json; charset=utf-8", CACHE_REVALIDATE)
+        self._config = (key, asset)
+        return asset
+
+    def image_asset(self) -> Optional[StaticAsset]:
+        """悬浮窗图片，按路径缓存；读取失败或文件过大时返回 None"""
+        path = self.monitor_instance.floating_window.image_path
+        cached = self._image
+        if cached and cached[0] == path:
+            return cached[1]
+        asset = None
+        if path:
+            try:
+                if os.path.getsize(path) <= MAX_IMAGE_BYTES:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                    asset = StaticAsset.build(data, content_type, CACHE_REVALIDATE)
+            except OSError as e:
+                self.monitor_instance.log_message(f"悬浮窗页面读取图片失败: {e}")
+        self._image = (path, asset)
+        return asset
@@ -0,0 +1,342 @@
+# profiling.py
+
+"""
+运行时性能分析（默认关闭）。
+
+通过环境变量 HRM_PROFILING=1 启动时开启，或在运行中通过 API 的 /debug/enable 开启。提供：
+- CPU 分析：在指定秒数内运行 cProfile，结果合并为一个 .prof 文件（可用 snakeviz 等查看）。
+  覆盖的线程见 Profiler 的说明。
+- 内存分析：tracemalloc 快照，与上一次快照做差异对比。
+- 线程栈采样：按固定频率采样所有线程的调用栈，输出 collapsed 格式（可直接生成火焰图）。
+所有结果都写入 PROFILE_DIR 目录。
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Optional, TYPE_CHECKING
+
+# cProfile/pstats/tracemalloc 只在真正开始分析时才导入，默认关闭时不增加启动开销
+if TYPE_CHECKING:
+    import cProfile
+    import tracemalloc
+
+PROFILE_DIR = "profiles"
+ENV_VAR = "HRM_PROFILING"
+
+# 线程栈采样的默认频率（Hz）
+STACK_SAMPLE_HZ = 100
+# 单次会话允许的最长时间（秒）
+MAX_SECONDS = 600
+
+# Python 3.12 起 cProfile 基于 sys.monitoring，整个进程只能有一个启用的 Profile，它覆盖所有线程
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+
+class ProfilingError(Exception):
+    """分析操作无法执行（未开启、已在运行等）"""
+
+
+class Profiler:
+    """
+    进程内分析器。
+
+    CPU 分析覆盖的线程：
+    - Python 3.12+：只创建一个 Profile，它通过 sys.monitoring 覆盖进程中的所有线程；
+    - 更早的版本：cProfile 只能分析调用 enable() 的线程，因此每个线程各有一个 Profile。
+      分析期间新建的线程通过 threading.setprofile 覆盖；已有的线程只有通过 register_thread_hook
+      注册过的才能覆盖（Tk 主线程、运行时的事件循环、运行时线程池的每个线程、各输出端的工作线程）。
+      其他已有的线程（例如第三方库自己创建的线程）不会被分析；
+      分析期间新建、停止时仍在运行且无法从外部关闭的线程会被跳过，并在结果中列出。
+    """
+
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self.enabled = os.environ.get(ENV_VAR, "") not in ("", "0")
+        self._lock = threading.Lock()
+        self._thread_hooks: dict[str, Callable[[Callable[[], None]], None]] = {}
+
+        self._cpu_profiles: dict[int, tuple['cProfile.Profile', threading.Thread]] = {}
+        self._cpu_disabled: set[int] = set()
+        self._cpu_running = False
+        self._cpu_timer: Optional[threading.Timer] = None
+        self._cpu_started_at = 0.0
+
+        self._last_snapshot: Optional['tracemalloc.Snapshot'] = None
+        self._sampling = False
+
+    # --- 线程钩子 ---
+
+    def register_thread_hook(self, name: str, schedule: Callable[[Callable[[], None]], None]):
+        """
+        注册一个长期运行的线程。schedule(fn) 必须让 fn 在该线程中执行，
+        例如 root.after(0, fn) 或 loop.call_soon_threadsafe(fn)。
+        """
+        self._thread_hooks[name] = schedule
+
+    def unregister_thread_hook(self, name: str):
+        self._thread_hooks.pop(name, None)
+
+    def _run_in_threads(self, fn: Callable[[], None]):
+        for name, schedule in list(self._thread_hooks.items()):
+            try:
+                schedule(fn)
+            except Exception:
+                # 线程或事件循环可能已经结束
+                self._thread_hooks.pop(name, None)
+
+    def _require_enabled(self):
+        if not self.enabled:
+            raise ProfilingError(f"性能分析未开启，请设置环境变量 {ENV_VAR}=1 或调用 /debug/enable")
+
+    def _output_path(self, prefix: str, suffix: str) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        return os.path.join(self.output_dir, f"{prefix}-{stamp}{suffix}")
+
+    # --- CPU 分析 ---
+
+    def start_cpu(self, seconds: float = 30) -> float:
+        """开始 CPU 分析，seconds 秒后自动停止。返回实际的分析时长。"""
+        self._require_enabled()
+        seconds = max(1.0, min(float(seconds), MAX_SECONDS))
+        with self._lock:
+            if self._cpu_running:
+                raise ProfilingError("CPU 分析已在进行中")
+            self._cpu_running = True
+            # 在开启分析前导入，避免各线程的第一次回调中才去导入
+            import cProfile  # noqa: F401
+            self._cpu_profiles = {}
+            self._cpu_disabled = set()
+            self._cpu_started_at = time.monotonic()
+
+        if PROCESS_WIDE_CPROFILE:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # 其他分析工具（例如调试器）已经占用了 sys.monitoring
+                with self._lock:
+                    self._cpu_running = False
+                raise ProfilingError(f"无法开启 CPU 分析: {e}")
+            with self._lock:
+                self._cpu_profiles[0] = (profile, threading.current_thread())
+        else:
+            threading.setprofile(self._bootstrap)
+            self._run_in_threads(lambda: sys.setprofile(self._bootstrap))
+
+        self._cpu_timer = threading.Timer(seconds, self._auto_stop)
+        self._cpu_timer.daemon = True
+        self._cpu_timer.start()
+        return seconds
+
+    def _bootstrap(self, frame, event, arg):
+        """
+        每个线程中第一次触发的 profile 回调（仅 Python 3.11 及更早的版本）：
+        为该线程创建独立的 Profile 并启用，enable() 会用 cProfile 的 C 回调替换掉本函数。
+        """
+        import cProfile
+        ident = threading.get_ident()
+        with self._lock:
+            if not self._cpu_running:
+                sys.setprofile(None)
+                return
+            entry = self._cpu_profiles.get(ident)
+            if entry is None:
+                entry = (cProfile.Profile(), threading.current_thread())
+                self._cpu_profiles[ident] = entry
+        entry[0].enable()
+
+    def _disable_current_thread(self):
+        ident = threading.get_ident()
+        sys.setprofile(None)
+        with self._lock:
+            self._cpu_disabled.add(ident)
+
+    def _auto_stop(self):
+        try:
+            self.stop_cpu()
+        except ProfilingError:
+            pass
+
+    def stop_cpu(self) -> str:
+        """停止 CPU 分析，合并各线程的结果并写入文件，返回 .prof 文件路径"""
+        import pstats
+        with self._lock:
+            if not self._cpu_running:
+                raise ProfilingError("CPU 分析未在进行")
+            self._cpu_running = False
+        if self._cpu_timer:
+            self._cpu_timer.cancel()
+            self._cpu_timer = None
+
+        if PROCESS_WIDE_CPROFILE:
+            with self._lock:
+                for profile, _ in self._cpu_profiles.values():
+                    profile.disable()
+            safe_to_read = None
+        else:
+            threading.setprofile(None)
+            # 调用 stop 的线程（API 线程或自动停止的定时器线程）本身也可能被分析
+            self._disable_current_thread()
+            self._run_in_threads(self._disable_current_thread)
+            # 给各线程一点时间执行关闭回调
+            time.sleep(0.2)
+            safe_to_read = self._cpu_disabled
+        duration = time.monotonic() - self._cpu_started_at
+
+        stats: Optional['pstats.Stats'] = None
+        skipped = []
+        with self._lock:
+            profiles = list(self._cpu_profiles.items())
+            self._cpu_profiles = {}
+        for ident, (profile, thread) in profiles:
+            # 旧版本 Python 上无法从外部关闭仍在运行的新线程中的分析器，跳过这些线程避免读写冲突
+            if safe_to_read is not None and ident not in safe_to_read and thread.is_alive():
+                skipped.append(thread.name)
+                continue
+            profile.create_stats()
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+        path = self._output_path("cpu", ".prof")
+        summary = io.StringIO()
+        if PROCESS_WIDE_CPROFILE:
+            summary.write(f"分析时长: {duration:.1f}s, 线程: 全部（进程级 Profile）\n")
+        else:
+            summary.write(f"分析时长: {duration:.1f}s, 线程数: {len(profiles) - len(skipped)}\n")
+        if skipped:
+            summary.write(f"未能收集的线程: {', '.join(skipped)}\n")
+        if stats is not None:
+            stats.dump_stats(path)
+            stats.stream = summary
+            stats.sort_stats("cumulative").print_stats(50)
+        else:
+            open(path, "wb").close()
+        with open(path[:-len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        return path
+
+    def cpu_running(self) -> bool:
+        return self._cpu_running
+
+    # --- 内存分析 ---
+
+    def tracemalloc_snapshot(self, limit: int = 50) -> str:
+        """
+        拍摄 tracemalloc 快照。第一次调用时开始追踪并作为基线；
+        之后每次调用都与上一次快照对比，把增长最多的分配位置写入文件。
+        """
+        self._require_enabled()
+        import tracemalloc
+        path = self._output_path("memory", ".txt")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"当前追踪内存: {current / 1024:.1f} KiB, 峰值: {peak / 1024:.1f} KiB\n\n")
+            if self._last_snapshot is None:
+                f.write("首次快照（基线），以下为当前占用最多的位置:\n")
+                for stat in snapshot.statistics("lineno")[:limit]:
+                    f.write(f"{stat}\n")
+            else:
+                f.write("与上一次快照相比增长最多的位置:\n")
+                for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:limit]:
+                    f.write(f"{stat}\n")
+        self._last_snapshot = snapshot
+        return path
+
+    def stop_tracemalloc(self):
+        """停止内存追踪并丢弃基线"""
+        import tracemalloc
+        tracemalloc.stop()
+        self._last_snapshot = None
+
+    # --- 线程栈 ---
+
+    def dump_stacks(self) -> str:
+        """立即输出所有线程当前的调用栈"""
+        self._require_enabled()
+        import traceback
+        path = self._output_path("stacks", ".txt")
+        names = {t.ident: t.name for t in threading.enumerate()}
+        with open(path, "w", encoding="utf-8") as f:
+            for ident, frame in sys._current_frames().items():
+                f.write(f"--- 线程 {names.get(ident, '?')} ({ident}) ---\n")
+                f.write("".join(traceback.format_stack(frame)))
+                f.write("\n")
+        return path
+
+    def sample_stacks(self, seconds: float = 10, hz: int = STACK_SAMPLE_HZ) -> str:
+        """
+        在后台线程中按 hz 频率采样 seconds 秒，结束后写入 collapsed 格式的文件
+        （每行 "线程;函数;函数... 次数"）。立即返回将要写入的文件路径。
+        """
+        self._require_enabled()
+        seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+        with self._lock:
+            if self._sampling:
+                raise ProfilingError("线程栈采样已在进行中")
+            self._sampling = True
+        path = self._output_path("samples", ".collapsed")
+        threading.Thread(target=self._sample_loop, args=(path, seconds, hz), daemon=True, name="stack-sampler").start()
+        return path
+
+    def _sample_loop(self, path: str, seconds: float, hz: int):
+        counts: Counter[str] = Counter()
+        own_ident = threading.get_ident()
+        interval = 1.0 / max(1, hz)
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    counts[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{stack} {count}\n")
+        finally:
+            with self._lock:
+                self._sampling = False
+
+    # --- 结果 ---
+
+    def list_results(self) -> list[dict]:
+        """列出输出目录中的结果文件"""
+        if not os.path.isdir(self.output_dir):
+            return []
+        results = []
+        for name in sorted(os.listdir(self.output_dir)):
+            full = os.path.join(self.output_dir, name)
+            if os.path.isfile(full):
+                results.append({"name": name, "size": os.path.getsize(full)})
+        return results
+
+    def result_path(self, name: str) -> Optional[str]:
+        """根据文件名返回结果文件路径；拒绝任何目录穿越"""
+        if not name or name != os.path.basename(name) or name.startswith("."):
+            return None
+        full = os.path.join(self.output_dir, name)
+        return full if os.path.isfile(full) else None
+
+
+PROFILER = Profiler()
@@ -0,0 +1,284 @@
+# runtime.py
+
+"""
+后台 asyncio 运行时。
+
+BLE、WebSocket 服务器、HTTP API、OSC 发送都作为任务运行在同一个事件循环（同一个线程）中；
+阻塞操作（Webhook 的 HTTP 请求、数据库查询等）交给一个有上限的线程池。
+与 Tk 主线程之间只通过 TkBridge 交互。
+
+用 supervise() 启动的任务由运行时看管：异常退出时记录日志并按退避时间重启，
+而不是悄无声息地停止；stop() 按启动的相反顺序取消所有任务并等待其结束。
+
+事件循环在第一次被使用时（supervise、submit 或显式调用 start）才启动，asyncio 也在那时才导入，
+不使用设备、服务器和 OSC 时程序启动不必为它们付出代价。启动前 call_soon 的回调会暂存，启动后依次执行。
+"""
+
+import queue
+import threading
+from typing import Any, Awaitable, Callable, Coroutine, Optional, TYPE_CHECKING
+
+import metrics
+from profiling import PROFILER
+
+if TYPE_CHECKING:
+    import asyncio
+    import concurrent.futures
+
+# 重启退避：首次等待 RESTART_DELAY 秒，之后每次翻倍，最长 RESTART_DELAY_MAX 秒
+RESTART_DELAY = 1.0
+RESTART_DELAY_MAX = 30.0
+# 任务连续运行超过这么久再崩溃时，退避时间从头计算
+RESTART_RESET_AFTER = 60.0
+# 阻塞操作线程池的大小
+BLOCKING_WORKERS = 4
+
+
+class AsyncRuntime:
+    """唯一的后台事件循环。除 supervise 的回调外，所有方法都可以在任意线程中调用。"""
+
+    def __init__(self, logger: Callable[[str], None]):
+        self.logger = logger
+        self.loop: Optional['asyncio.AbstractEventLoop'] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional['concurrent.futures.ThreadPoolExecutor'] = None
+        # 名称 -> 任务，按启动顺序排列；只在事件循环线程中修改
+        self._tasks: dict[str, 'asyncio.Task'] = {}
+        # 事件循环启动前提交的回调，启动后依次执行
+        self._pending: list[tuple[Callable, tuple]] = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """启动事件循环线程；已启动时什么也不做。可以在任意线程中调用"""
+        with self._start_lock:
+            if self._thread:
+                return
+            import asyncio
+            ready = threading.Event()
+            self.loop = asyncio.new_event_loop()
+            for fn, args in self._pending:
+                self.loop.call_soon(fn, *args)
+            self._pending = []
+            self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True, name="runtime")
+            self._thread.start()
+        # 在锁外等待：暂存的回调可能再次调用 start()
+        ready.wait()
+
+    def _run(self, ready: threading.Event):
+        import asyncio
+        asyncio.set_event_loop(self.loop)
+        # 事件循环内部的阻塞操作（如地址解析）也使用同一个线程池
+        self.loop.set_default_executor(self.executor)
+        PROFILER.register_thread_hook("runtime", self.call_soon)
+        PROFILER.register_thread_hook("blocking", self._call_in_workers)
+        self.loop.call_soon(ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            PROFILER.unregister_thread_hook("runtime")
+            PROFILER.unregister_thread_hook("blocking")
+            self.loop.close()
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def call_soon(self, fn: Callable, *args):
+        """在事件循环线程中调用 fn；已在该线程中时直接调用，事件循环尚未启动时暂存到启动后"""
+        if self.in_loop_thread():
+            fn(*args)
+            return
+        with self._start_lock:
+            if not self._thread:
+                self._pending.append((fn, args))
+                return
+        if self.loop and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(fn, *args)
+            except RuntimeError:
+                pass  # 事件循环正在关闭
+
+    def call(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        在事件循环线程中调用 fn 并等待其返回值，用于从其他线程安全地修改循环中使用的状态。
+        已在该线程中、或事件循环未运行时直接调用。
+        """
+        if self.in_loop_thread() or not self._thread:
+            return fn(*args)
+        import concurrent.futures
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        def run():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+
+        self.loop.call_soon_threadsafe(run)
+        return future.result(timeout)
+
+    def submit(self, coro: Coroutine) -> 'concurrent.futures.Future':
+        """在事件循环中运行协程（必要时先启动事件循环），返回可在其他线程中等待的 Future"""
+        import asyncio
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    @property
+    def executor(self) -> 'concurrent.futures.ThreadPoolExecutor':
+        """阻塞操作使用的线程池，线程按需创建，最多 BLOCKING_WORKERS 个"""
+        if self._executor is None:
+            import concurrent.futures
+            self._executor = concurrent.futures.ThreadPoolExecutor(BLOCKING_WORKERS, thread_name_prefix="blocking")
+        return self._executor
+
+    def _call_in_workers(self, fn: Callable[[], None]):
+        """
+        在线程池的每个线程中各执行一次 fn（性能分析开启/关闭时使用）。
+        各任务先在屏障处等待，保证分别落在不同的线程中；线程正忙时最多等待 1 秒，之后照常执行。
+        """
+        barrier = threading.Barrier(BLOCKING_WORKERS)
+
+        def run():
+            try:
+                barrier.wait(1.0)
+            except threading.BrokenBarrierError:
+                pass
+            fn()
+
+        for _ in range(BLOCKING_WORKERS):
+            self.executor.submit(run)
+
+    async def run_blocking(self, fn: Callable, *args) -> Any:
+        """在事件循环中等待一个阻塞调用（放到线程池中执行）"""
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # --- 受看管的任务 ---
+
+    def supervise(self, name: str, factory: Callable[[], Awaitable], restart: bool = True,
+                  on_crash: Optional[Callable[[Exception], None]] = None):
+        """
+        启动（或替换）名为 name 的任务。factory 每次调用返回一个新的协程。
+        协程正常返回时任务结束；抛出异常时若 restart 为 True 则退避后重启。
+        on_crash 在每次异常退出时于事件循环线程中调用。必要时先启动事件循环。
+        """
+        self.start()
+        self.call_soon(self._start_task, name, factory, restart, on_crash)
+
+    def _start_task(self, name, factory, restart, on_crash):
+        old = self._tasks.pop(name, None)
+        if old:
+            old.cancel()
+        task = self.loop.create_task(self._supervisor(name, factory, restart, on_crash), name=name)
+        self._tasks[name] = task
+        task.add_done_callback(lambda t: self._tasks.pop(name, None) if self._tasks.get(name) is t else None)
+
+    async def _supervisor(self, name, factory, restart, on_crash):
+        import asyncio
+        delay = RESTART_DELAY
+        while True:
+            started = self.loop.time()
+            try:
+                await factory()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if on_crash:
+                    try:
+                        on_crash(e)
+                    except Exception as callback_error:
+                        self.logger(f"[运行时] 任务 {name} 的 on_crash 回调出错: {callback_error}")
+                if not restart:
+                    self.logger(f"[运行时] 任务 {name} 异常退出: {e}")
+                    return
+                if self.loop.time() - started >= RESTART_RESET_AFTER:
+                    delay = RESTART_DELAY
+                self.logger(f"[运行时] 任务 {name} 异常退出: {e}，{delay:.0f} 秒后重启")
+                metrics.RUNTIME_TASK_RESTARTS.labels(name).inc()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RESTART_DELAY_MAX)
+
+    def cancel(self, name: str, timeout: Optional[float] = None):
+        """
+        取消名为 name 的任务。timeout 不为 None 时等待任务结束（不能在事件循环线程中等待）。
+        """
+        if not self.loop or self.loop.is_closed():
+            return
+        if self.in_loop_thread():
+            task = self._tasks.pop(name, None)
+            if task:
+                task.cancel()
+            return
+        import concurrent.futures
+        future = self.submit(self._cancel(name))
+        if timeout is not None:
+            try:
+                future.result(timeout)
+            except concurrent.futures.TimeoutError:
+                self.logger(f"[运行时] 等待任务 {name} 结束超时")
+
+    async def _cancel(self, name: str):
+        import asyncio
+        task = self._tasks.pop(name, None)
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def is_running(self, name: str) -> bool:
+        task = self._tasks.get(name)
+        return bool(task and not task.done())
+
+    def stop(self, timeout: float = 3.0):
+        """按启动的相反顺序取消所有任务，等待它们结束后停止事件循环"""
+        if not self._thread:
+            return
+        import concurrent.futures
+        try:
+            self.submit(self._shutdown()).result(timeout)
+        except concurrent.futures.TimeoutError:
+            self.logger("[运行时] 部分任务未能在规定时间内结束")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _shutdown(self):
+        for name in reversed(list(self._tasks)):
+            await self._cancel(name)
+
+
+class TkBridge:
+    """
+    其他线程向 Tk 主线程投递回调的唯一入口。
+    Tk 不是线程安全的，post() 只把回调放入队列，由主线程定时取出执行。
+    """
+
+    def __init__(self, root, interval_ms: int = 50):
+        self.root = root
+        self.interval_ms = interval_ms
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._closed = False
+        self.root.after(interval_ms, self._drain)
+
+    def post(self, fn: Callable, *args):
+        if not self._closed:
+            self._queue.put((fn, args))
+
+    def close(self):
+        self._closed = True
+
+    def _drain(self):
+        while True:
+            try:
+                fn, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[TkBridge] 回调出错: {e}")
+        if not self._closed:
+            self.root.after(self.interval_ms, self._drain)
@@ -0,0 +1,176 @@
+# session_stats.py
+
+"""
+滚动的心率统计：最近 1 分钟、最近 10 分钟和整个会话（程序启动以来）的
+平均值、最小值、最大值和各心率区间的停留时间。
+
+- 最小/最大值用单调队列维护，平均值和区间时间用累加和维护，每个样本的更新均摊 O(1)；
+- 每次更新后生成一份新的只读结果并整体替换引用，读取时不扫描历史数据、也不需要加锁。
+"""
+
+import bisect
+from collections import deque
+from typing import Optional
+
+# 统计窗口: 名称 -> 秒数，None 表示整个会话
+WINDOWS = {"1m": 60.0, "10m": 600.0, "session": None}
+# 占位符中省略窗口后缀时使用的窗口，即 {avg} 等同于 {avg_session}
+DEFAULT_WINDOW = "session"
+STAT_KEYS = ("avg", "max", "min")
+
+# 两个样本之间最多按这么长的时间计入区间停留时间，避免断线期间被算作停留
+MAX_SAMPLE_GAP = 5.0
+
+
+def placeholder_names() -> list[str]:
+    """所有统计占位符的名称（不含花括号），例如 avg、max_1m、min_10m"""
+    names = []
+    for key in STAT_KEYS:
+        names.append(key)
+        names.extend(f"{key}_{window}" for window in WINDOWS if window != DEFAULT_WINDOW)
+    return names
+
+
+class RollingWindow:
+    """单个时间窗口的统计"""
+
+    def __init__(self, seconds: Optional[float], zone_count: int):
+        self.seconds = seconds
+        # (时间, 心率, 区间, 计入区间的时长)；会话窗口不需要保留样本
+        self._samples: deque[tuple[float, int, int, float]] = deque()
+        # 单调队列：_max 中心率递减，_min 中心率递增，队首即为窗口内的最大/最小值
+        self._max: deque[tuple[float, int]] = deque()
+        self._min: deque[tuple[float, int]] = deque()
+        self._sum = 0
+        self._count = 0
+        self._session_max: Optional[int] = None
+        self._session_min: Optional[int] = None
+        self.zone_seconds = [0.0] * zone_count
+
+    def push(self, now: float, bpm: int, zone: int, dt: float):
+        """加入一个样本。dt 为上一个样本到这个样本之间的时长，计入上一个样本所在的区间 zone。"""
+        self._sum += bpm
+        self._count += 1
+        if zone >= 0:
+            self.zone_seconds[zone] += dt
+
+        if self.seconds is None:
+            if self._session_max is None or bpm > self._session_max:
+                self._session_max = bpm
+            if self._session_min is None or bpm < self._session_min:
+                self._session_min = bpm
+            return
+
+        self._samples.append((now, bpm, zone, dt))
+        while self._max and self._max[-1][1] <= bpm:
+            self._max.pop()
+        self._max.append((now, bpm))
+        while self._min and self._min[-1][1] >= bpm:
+            self._min.pop()
+        self._min.append((now, bpm))
+
+        cutoff = now - self.seconds
+        samples = self._samples
+        while samples and samples[0][0] < cutoff:
+            _, old_bpm, old_zone, old_dt = samples.popleft()
+            self._sum -= old_bpm
+            self._count -= 1
+            if old_zone >= 0:
+                self.zone_seconds[old_zone] -= old_dt
+        while self._max[0][0] < cutoff:
+            self._max.popleft()
+        while self._min[0][0] < cutoff:
+            self._min.popleft()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def average(self) -> Optional[float]:
+        return self._sum / self._count if self._count else None
+
+    @property
+    def maximum(self) -> Optional[int]:
+        if self.seconds is None:
+            return self._session_max
+        return self._max[0][1] if self._max else None
+
+    @property
+    def minimum(self) -> Optional[int]:
+        if self.seconds is None:
+            return self._session_min
+        return self._min[0][1] if self._min else None
+
+
+class SessionStats:
+    """
+    多个窗口的统计。update() 只在 BLE 回调（运行时的事件循环线程）中调用；
+    current / values 可以在任意线程中读取，拿到的总是某一次更新后的完整结果。
+    """
+
+    def __init__(self):
+        self._zone_names: list[str] = []
+        self._zone_lower: list[float] = []
+        self.reset()
+
+    def configure_zones(self, zones: list[tuple[str, float]]):
+        """设置区间（名称, 下限），按下限升序；会清空已有统计"""
+        zones = sorted(zones, key=lambda z: z[1])
+        self._zone_names = [name for name, _ in zones]
+        self._zone_lower = [lower for _, lower in zones]
+        self.reset()
+
+    def reset(self):
+        self._windows = {name: RollingWindow(seconds, len(self._zone_names)) for name, seconds in WINDOWS.items()}
+        self._last_time: Optional[float] = None
+        self._last_zone = -1
+        # 嵌套结果，用于 API / WebSocket
+        self.current: dict = {name: {"avg": None, "max": None, "min": None, "count": 0} for name in WINDOWS}
+        # 扁平结果，用于占位符: {"avg": 72.4, "max_1m": 90, ...}
+        self.values: dict = {name: None for name in placeholder_names()}
+
+    def _zone_of(self, bpm: int) -> int:
+        """区间序号（从 0 开始），低于所有区间时为 -1"""
+        return bisect.bisect_right(self._zone_lower, bpm) - 1
+
+    def update(self, bpm: int, now: float):
+        if bpm <= 0:
+            return
+        dt = 0.0
+        if self._last_time is not None:
+            dt = min(MAX_SAMPLE_GAP, max(0.0, now - self._last_time))
+        # 上一个样本到现在这段时间属于上一个样本所在的区间
+        zone = self._last_zone
+        for window in self._windows.values():
+            window.push(now, bpm, zone, dt)
+        self._last_time = now
+        self._last_zone = self._zone_of(bpm)
+        self._publish()
+
+    def _publish(self):
+        current = {}
+        values = {}
+        for name, window in self._windows.items():
+            average = window.average
+            stats = {
+                "avg": round(average, 1) if average is not None else None,
+                "max": window.maximum,
+                "min": window.minimum,
+                "count": window.count,
+            }
+            if self._zone_names:
+                stats["time_in_zone"] = {
+                    zone_name: round(seconds, 1) for zone_name, seconds in zip(self._zone_names, window.zone_seconds)
+                }
+            current[name] = stats
+            suffix = "" if name == DEFAULT_WINDOW else f"_{name}"
+            for key in STAT_KEYS:
+                values[key + suffix] = stats[key]
+        # 整体替换引用，读取方不会看到更新了一半的结果
+        self.current = current
+        self.values = values
+
+    def format_values(self) -> dict[str, str]:
+        """占位符的文本形式，平均值取整，尚无数据时为 "--" """
+        return {name: "--" if value is None else str(int(round(value))) for name, value in self.values.items()}
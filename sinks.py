@@ -0,0 +1,397 @@
+# sinks.py
+
+"""
+心率数据的输出端（sink）。
+
+每个输出端都拥有独立的有界队列：
+- 发布（publish）只做一次非阻塞入队，可以在 BLE 回调中直接调用；
+- 队列满时丢弃最旧的事件，慢的输出端只会丢失自己的旧数据，不会拖慢 BLE 回调或其他输出端；
+- 输出端抛出的异常会被记录并计数，不会影响其他输出端。
+
+默认每个输出端运行在自己的工作线程中，可以执行阻塞操作（写数据库、第三方输出端）。
+runs_on_loop 为 True 的输出端（OSC、WebSocket、Webhook）的 handle() 不会阻塞，
+它们在后台运行时的事件循环中处理事件，不再各占一个线程。
+
+第三方输出端可以写在独立的模块中，并通过 config.json 的 "sinks" 列表加载：
+
+    "sinks": [
+        {"type": "my_sink:CsvSink", "name": "csv", "queue_size": 256, "options": {"path": "hr.csv"}}
+    ]
+
+type 为 "模块:类名"，类需继承 Sink，options 作为关键字参数传给构造函数。
+"""
+
+import importlib
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Callable, NamedTuple, Optional, TYPE_CHECKING
+
+import metrics
+from alerts import ALERT_TRIGGERS
+from profiling import PROFILER
+
+if TYPE_CHECKING:
+    from alerts import AlertEngine
+    from runtime import AsyncRuntime
+    from session_stats import SessionStats
+    from vrc_osc import VrcOscClient
+    from webhook_manager import WebhookManager
+    from websocket_server import WebSocketServer
+
+# 事件类型，与 Webhook 的触发器名称一致
+EVENT_HEART_RATE = "heart_rate_updated"
+EVENT_CONNECTED = "connected"
+EVENT_DISCONNECTED = "disconnected"
+
+# 输出端队列的默认长度
+DEFAULT_QUEUE_SIZE = 64
+# 同一个输出端两次错误日志之间的最短间隔（秒），避免刷屏
+ERROR_LOG_INTERVAL = 10.0
+
+
+# 样本序号，从 1 开始，每个有效样本加 1；下游可据此发现丢失的样本
+_sample_seq = itertools.count(1)
+
+
+class SinkEvent(NamedTuple):
+    """
+    发布给所有输出端的事件。
+    心率样本在 BLE 回调中打上时间戳（见 capture_sample），之后原样传递给所有输出端，
+    下游可以据此计算自身的延迟、发现断档，或与游戏/视频的时间轴对齐。
+    """
+    kind: str                  # EVENT_*
+    heart_rate: int            # 心率；连接/断开事件中为当时最后一次的心率
+    connected: bool
+    rr_intervals: tuple = ()   # 本次通知携带的 RR 间期（秒）
+    seq: int = 0               # 样本序号；状态事件沿用最近一个样本的序号
+    timestamp: float = 0.0     # 采集时的系统时间（time.time()，Unix 秒）
+    monotonic: float = 0.0     # 采集时的单调时钟（time.monotonic()，秒），不受系统时间调整影响
+    device: str = ""           # 设备标识（MAC 地址）
+    raw_heart_rate: int = 0    # 滤波前设备上报的原始心率；heart_rate 为滤波后的值
+    detail: str = ""           # 提醒事件的规则/区间名称（见 alerts.py）
+
+    def timing(self) -> dict:
+        """时间相关字段，供 API、WebSocket 等输出使用"""
+        return {
+            "seq": self.seq,
+            "timestamp": round(self.timestamp, 3),
+            "monotonic": round(self.monotonic, 6),
+        }
+
+
+def capture_sample(heart_rate: int, rr_intervals, device: str = "", raw_heart_rate: int = 0,
+                   monotonic: Optional[float] = None) -> SinkEvent:
+    """
+    在 BLE 回调中调用：为新样本打上序号和采集时间。
+    monotonic 可传入解析时已经取得的时间，保证滤波与时间戳使用同一时刻。
+    """
+    return SinkEvent(EVENT_HEART_RATE, heart_rate, True, tuple(rr_intervals),
+                     next(_sample_seq), time.time(), monotonic if monotonic is not None else time.monotonic(),
+                     device, raw_heart_rate or heart_rate)
+
+
+def status_event(kind: str, heart_rate: int, connected: bool, last_seq: int = 0, device: str = "") -> SinkEvent:
+    """连接/断开事件，时间戳为事件发生的时间"""
+    return SinkEvent(kind, heart_rate, connected, (), last_seq, time.time(), time.monotonic(), device)
+
+
+class Sink:
+    """
+    输出端基类。子类实现 handle()，它总是在该输出端自己的工作线程中被调用，
+    因此可以放心地执行阻塞操作。
+    runs_on_loop 为 True 时改为在后台运行时的事件循环中调用，handle() 必须立即返回。
+    """
+    name = "sink"
+    queue_size = DEFAULT_QUEUE_SIZE
+    runs_on_loop = False
+    # 注册到 SinkManager 时会被替换为应用的日志函数
+    logger: Callable[[str], None] = print
+
+    def open(self):
+        """工作线程启动时调用"""
+
+    def handle(self, event: SinkEvent):
+        raise NotImplementedError
+
+    def close(self):
+        """工作线程退出前调用"""
+
+
+class _SinkWorker:
+    """为单个输出端维护队列和工作线程"""
+
+    def __init__(self, sink: Sink, logger: Callable[[str], None]):
+        self.sink = sink
+        self.logger = logger
+        self._queue: deque[SinkEvent] = deque()
+        self._maxlen = max(1, int(sink.queue_size))
+        # 需要在工作线程中执行的回调（性能分析开启/关闭）
+        self._calls: deque[Callable[[], None]] = deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._last_error_log = 0.0
+        self._drops = metrics.SINK_DROPS.labels(sink.name)
+        self._errors = metrics.SINK_HANDLER_ERRORS.labels(sink.name)
+        self._depth = metrics.SINK_QUEUE_DEPTH.labels(sink.name)
+        self._depth.set_function(lambda: len(self._queue))
+        self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"sink-{self.sink.name}")
+        self._thread.start()
+        PROFILER.register_thread_hook(self._thread.name, self.call_in_thread)
+
+    def call_in_thread(self, fn: Callable[[], None]):
+        with self._cond:
+            self._calls.append(fn)
+            self._cond.notify()
+
+    def put(self, event: SinkEvent):
+        with self._cond:
+            if len(self._queue) >= self._maxlen:
+                self._queue.popleft()
+                self._drops.inc()
+            self._queue.append(event)
+            self._cond.notify()
+
+    def stop(self, timeout: float):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout)
+        PROFILER.unregister_thread_hook(self._thread.name)
+        self._depth.set_function(None)
+        self._depth.set(0)
+
+    def _run(self):
+        if not self._open():
+            return
+        while True:
+            with self._cond:
+                while self._running and not self._queue and not self._calls:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                calls = list(self._calls)
+                self._calls.clear()
+                event = self._queue.popleft() if self._queue else None
+            for fn in calls:
+                fn()
+            if event is not None:
+                self._deliver(event)
+        self._close()
+
+    def _open(self) -> bool:
+        try:
+            self.sink.open()
+            return True
+        except Exception as e:
+            self.logger(f"[输出端 {self.sink.name}] 启动失败: {e}")
+            self._running = False
+            return False
+
+    def _deliver(self, event: SinkEvent):
+        try:
+            self.sink.handle(event)
+        except Exception as e:
+            self._errors.inc()
+            now = time.monotonic()
+            if now - self._last_error_log >= ERROR_LOG_INTERVAL:
+                self._last_error_log = now
+                self.logger(f"[输出端 {self.sink.name}] 处理失败: {e}")
+
+    def _close(self):
+        try:
+            self.sink.close()
+        except Exception as e:
+            self.logger(f"[输出端 {self.sink.name}] 关闭失败: {e}")
+
+
+class _LoopSinkWorker(_SinkWorker):
+    """
+    在运行时的事件循环中处理事件的输出端。
+    一批连续发布的事件只调度一次，由事件循环一次性取完队列。
+    """
+
+    def __init__(self, sink: Sink, logger: Callable[[str], None], runtime: 'AsyncRuntime'):
+        self.runtime = runtime
+        self._lock = threading.Lock()
+        self._scheduled = False
+        super().__init__(sink, logger)
+
+    def _start(self):
+        self.runtime.call_soon(self._open)
+
+    def put(self, event: SinkEvent):
+        with self._lock:
+            if not self._running:
+                return
+            if len(self._queue) >= self._maxlen:
+                self._queue.popleft()
+                self._drops.inc()
+            self._queue.append(event)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.runtime.call_soon(self._drain)
+
+    def _drain(self):
+        with self._lock:
+            self._scheduled = False
+        while True:
+            # 与 put() 在同一把锁下取出：put() 可能同时在其他线程中因队列已满而丢弃最旧的事件
+            with self._lock:
+                if not self._running or not self._queue:
+                    break
+                event = self._queue.popleft()
+            self._deliver(event)
+
+    def stop(self, timeout: float):
+        with self._lock:
+            self._running = False
+            self._queue.clear()
+        self.runtime.call_soon(self._close)
+        self._depth.set_function(None)
+        self._depth.set(0)
+
+
+class SinkManager:
+    """
+    输出端注册表。publish() 可以在任意线程中调用。
+    未指定 runtime 时，runs_on_loop 的输出端也使用独立的工作线程。
+    """
+
+    def __init__(self, logger: Callable[[str], None], runtime: Optional['AsyncRuntime'] = None):
+        self.logger = logger
+        self.runtime = runtime
+        self._workers: dict[str, _SinkWorker] = {}
+        self._lock = threading.Lock()
+
+    def add(self, sink: Sink):
+        """注册并启动一个输出端；同名的旧输出端会先被停止"""
+        if sink.logger is print:
+            sink.logger = self.logger
+        self.remove(sink.name)
+        if sink.runs_on_loop and self.runtime:
+            worker = _LoopSinkWorker(sink, self.logger, self.runtime)
+        else:
+            worker = _SinkWorker(sink, self.logger)
+        with self._lock:
+            workers = dict(self._workers)
+            workers[sink.name] = worker
+            # 发布时只读取字典引用，替换而不是原地修改，避免迭代中被改变
+            self._workers = workers
+
+    def remove(self, name: str, timeout: float = 2.0):
+        with self._lock:
+            workers = dict(self._workers)
+            worker = workers.pop(name, None)
+            self._workers = workers
+        if worker:
+            worker.stop(timeout)
+
+    def get(self, name: str) -> Optional[Sink]:
+        worker = self._workers.get(name)
+        return worker.sink if worker else None
+
+    def names(self) -> list[str]:
+        return list(self._workers)
+
+    def publish(self, event: SinkEvent):
+        for worker in self._workers.values():
+            worker.put(event)
+
+    def stop_all(self, timeout: float = 2.0):
+        for name in self.names():
+            self.remove(name, timeout)
+
+    def load_from_config(self, entries: list[dict]):
+        """按 config.json 中 "sinks" 列表加载第三方输出端，单个条目出错不影响其他条目"""
+        for entry in entries or []:
+            if not entry.get("enabled", True):
+                continue
+            spec = entry.get("type", "")
+            try:
+                sink = create_sink(spec, entry.get("options") or {})
+                if entry.get("name"):
+                    sink.name = entry["name"]
+                if entry.get("queue_size"):
+                    sink.queue_size = int(entry["queue_size"])
+                self.add(sink)
+                self.logger(f"已加载输出端 {sink.name} ({spec})")
+            except Exception as e:
+                self.logger(f"加载输出端 {spec or '?'} 失败: {e}")
+
+
+def create_sink(spec: str, options: dict) -> Sink:
+    """根据 "模块:类名" 创建输出端实例"""
+    module_name, _, class_name = spec.partition(":")
+    if not module_name or not class_name:
+        raise ValueError(f"type 应为 \"模块:类名\"，而不是 {spec!r}")
+    cls = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(cls, type) and issubclass(cls, Sink)):
+        raise TypeError(f"{spec} 不是 Sink 的子类")
+    return cls(**options)
+
+
+# --- 内置输出端 ---
+
+class WebhookSink(Sink):
+    name = "webhook"
+    # 请求由 WebhookManager 交给线程池发送，这里只做匹配和提交
+    runs_on_loop = True
+
+    def __init__(self, manager: 'WebhookManager', stats: Optional['SessionStats'] = None):
+        self.manager = manager
+        self.stats = stats
+
+    def handle(self, event: SinkEvent):
+        if event.kind == EVENT_HEART_RATE and event.heart_rate <= 0:
+            return
+        # 统计在发布前已随样本更新，这里读到的结果不会比事件更旧
+        stats = self.stats.values if self.stats else None
+        self.manager.trigger_event(event.kind, event.heart_rate, event.timestamp, event.seq, event.raw_heart_rate,
+                                   event.detail, stats)
+
+
+class OscSink(Sink):
+    name = "osc"
+    # 在事件循环中直接用非阻塞 socket 发送，队列只在事件循环繁忙时积压；
+    # Avatar 参数只关心最新值，积压的旧样本没有意义，因此队列很短，满时丢弃最旧的
+    queue_size = 4
+    runs_on_loop = True
+
+    def __init__(self, client: 'VrcOscClient', alert_engine: Optional['AlertEngine'] = None):
+        self.client = client
+        self.alert_engine = alert_engine
+
+    def handle(self, event: SinkEvent):
+        if not self.client.is_connected():
+            return
+        if event.kind == EVENT_HEART_RATE:
+            self.client.send_heart_rate(event.heart_rate)
+        elif event.kind == EVENT_DISCONNECTED:
+            # 断开时把 0 同步给 Avatar 参数
+            self.client.send_heart_rate(0)
+            if self.alert_engine and self.alert_engine.has_rules():
+                self.client.send_alert_state(0, False)
+        elif event.kind in ALERT_TRIGGERS and self.alert_engine:
+            # OSC 只同步当前状态（所在区间、是否处于提醒中），而不是逐条事件
+            self.client.send_alert_state(self.alert_engine.zone_index, self.alert_engine.alert_active)
+
+
+class WebSocketSink(Sink):
+    name = "websocket"
+    queue_size = 16
+    runs_on_loop = True
+
+    def __init__(self, server: 'WebSocketServer'):
+        self.server = server
+
+    def handle(self, event: SinkEvent):
+        # 断开时客户端看到的心率为 0
+        if event.kind == EVENT_DISCONNECTED:
+            event = event._replace(heart_rate=0)
+        self.server.broadcast(event)
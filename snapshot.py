@@ -0,0 +1,99 @@
+# snapshot.py
+
+"""
+当前状态的不可变快照。
+
+心率、连接状态、最近样本的时间信息和统计结果放在同一个只读对象中，
+写入方（BLE 回调所在的事件循环线程、Tk 线程）每次生成一个新对象并整体替换引用；
+API、WebSocket 等读取方只读取一次引用，无需加锁，也不会看到"已断开却还带着旧心率"这类拼凑出来的状态。
+
+同一个快照的序列化结果（例如 /heartrate 的 JSON）缓存在快照上，
+状态不变时多次请求只序列化一次。
+"""
+
+import itertools
+import threading
+from typing import Any, Callable, Optional
+
+from sinks import SinkEvent, EVENT_HEART_RATE, EVENT_CONNECTED, EVENT_DISCONNECTED
+
+# 快照版本号，每发布一次加 1，可用作 ETag 等
+_versions = itertools.count(1)
+
+
+class Snapshot:
+    """只读的状态快照，创建后不能修改（缓存的序列化结果除外，它只由快照本身决定）"""
+    __slots__ = ("version", "heart_rate", "connected", "seq", "timestamp", "monotonic", "device",
+                 "raw_heart_rate", "rr_intervals", "stats", "_cache")
+
+    def __init__(self, heart_rate: int = 0, connected: bool = False, seq: int = 0, timestamp: float = 0.0,
+                 monotonic: float = 0.0, device: str = "", raw_heart_rate: int = 0, rr_intervals: tuple = (),
+                 stats: Optional[dict] = None):
+        setattr_ = object.__setattr__
+        setattr_(self, "version", next(_versions))
+        setattr_(self, "heart_rate", heart_rate)
+        setattr_(self, "connected", connected)
+        setattr_(self, "seq", seq)                   # 最近一个样本的序号，尚无样本时为 0
+        setattr_(self, "timestamp", timestamp)       # 最近一个样本的采集时间（Unix 秒）
+        setattr_(self, "monotonic", monotonic)
+        setattr_(self, "device", device)
+        setattr_(self, "raw_heart_rate", raw_heart_rate)
+        setattr_(self, "rr_intervals", rr_intervals)
+        setattr_(self, "stats", stats)               # SessionStats.current
+        setattr_(self, "_cache", {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot 是只读的，请用 replace() 生成新的快照")
+
+    def __repr__(self):
+        return (f"Snapshot(version={self.version}, heart_rate={self.heart_rate}, connected={self.connected}, "
+                f"seq={self.seq})")
+
+    @classmethod
+    def from_sample(cls, event: SinkEvent, stats: Optional[dict] = None) -> 'Snapshot':
+        return cls(event.heart_rate, True, event.seq, event.timestamp, event.monotonic, event.device,
+                   event.raw_heart_rate or event.heart_rate, event.rr_intervals, stats)
+
+    def replace(self, **changes) -> 'Snapshot':
+        values = {name: getattr(self, name) for name in self.__slots__ if name not in ("version", "_cache")}
+        values.update(changes)
+        return Snapshot(**values)
+
+    def to_event(self) -> SinkEvent:
+        """以 SinkEvent 的形式表示当前状态，供按事件编码的输出（如 WebSocket）使用"""
+        if self.seq and self.connected:
+            kind = EVENT_HEART_RATE
+        else:
+            kind = EVENT_CONNECTED if self.connected else EVENT_DISCONNECTED
+        return SinkEvent(kind, self.heart_rate, self.connected, self.rr_intervals, self.seq, self.timestamp,
+                         self.monotonic, self.device, self.raw_heart_rate)
+
+    def cached(self, key: Any, build: Callable[['Snapshot'], Any]) -> Any:
+        """
+        返回该快照按 key 缓存的序列化结果，没有时调用 build(self) 生成。
+        多个线程同时生成时结果相同，后写入的覆盖先写入的即可，不需要加锁。
+        """
+        value = self._cache.get(key)
+        if value is None:
+            value = self._cache[key] = build(self)
+        return value
+
+
+class SnapshotHolder:
+    """
+    持有当前快照。current 可在任意线程中无锁读取；
+    写入方可能来自事件循环线程和 Tk 线程，基于当前快照修改时用锁串行化，避免互相覆盖。
+    """
+
+    def __init__(self):
+        self.current = Snapshot()
+        self._lock = threading.Lock()
+
+    def publish(self, snapshot: Snapshot):
+        with self._lock:
+            self.current = snapshot
+
+    def update(self, **changes) -> Snapshot:
+        with self._lock:
+            snapshot = self.current = self.current.replace(**changes)
+        return snapshot
@@ -0,0 +1,56 @@
+# test_config.py
+
+"""ConfigStore 读取失败时的处理：只有无法解析的文件才会被另存为 *.corrupt"""
+
+import json
+import os
+
+import config
+from config import ConfigStore
+
+
+def test_unparsable_file_is_quarantined(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text("{not json", encoding="utf-8")
+    store = ConfigStore(str(path), default={"a": 1})
+    assert store.load() == {"a": 1}
+    assert "无法解析" in store.last_error
+    assert not path.exists()
+    assert (tmp_path / "config.json.corrupt").read_text(encoding="utf-8") == "{not json"
+
+
+def test_read_error_retries_and_keeps_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "READ_RETRY_DELAY", 0)
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"a": 2}), encoding="utf-8")
+    store = ConfigStore(str(path))
+    assert store.load() == {"a": 2}
+
+    attempts = []
+    real_open = open
+
+    def failing_open(file, *args, **kwargs):
+        if os.fspath(file) == str(path):
+            attempts.append(file)
+            raise PermissionError("文件被占用")
+        return real_open(file, *args, **kwargs)
+
+    path.write_text(json.dumps({"a": 3, "b": 4}), encoding="utf-8")
+    monkeypatch.setattr("builtins.open", failing_open)
+    # 读取失败时返回上次成功读取的内容，文件保持原样
+    assert store.load() == {"a": 2}
+    assert len(attempts) == config.READ_RETRIES
+    assert "读取" in store.last_error
+    assert path.exists() and not (tmp_path / "config.json.corrupt").exists()
+
+    monkeypatch.setattr("builtins.open", real_open)
+    assert store.load() == {"a": 3, "b": 4}
+
+
+def test_read_error_without_cache_returns_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "READ_RETRY_DELAY", 0)
+    path = tmp_path / "config.json"
+    path.mkdir()  # 打开目录会抛出 OSError，而 stat 成功
+    store = ConfigStore(str(path), default={"default": True})
+    assert store.load() == {"default": True}
+    assert store.last_error and path.is_dir()
@@ -0,0 +1,45 @@
+# test_hr_filter.py
+
+"""滚动中位数与逐窗口排序的结果一致，且堆的大小不随样本数增长"""
+
+import random
+import statistics
+
+import pytest
+
+from hr_filter import HeartRateFilter, RollingMedian
+
+
+def brute_force(values, window):
+    return [statistics.median(values[max(0, i + 1 - window):i + 1]) for i in range(len(values))]
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 4, 5, 31])
+def test_matches_sorted_window(window):
+    rng = random.Random(window)
+    # 大量重复值，覆盖两个堆中有相同值时的延迟删除
+    values = [float(rng.randint(60, 70)) for _ in range(2000)]
+    median = RollingMedian(window)
+    assert [median.push(v) for v in values] == brute_force(values, window)
+
+
+def test_monotonic_input_keeps_heaps_bounded():
+    median = RollingMedian(5)
+    values = [float(v) for v in range(10000)] + [float(v) for v in range(10000, 0, -1)]
+    results = [median.push(v) for v in values]
+    assert results == brute_force(values, 5)
+    assert len(median._low) + len(median._high) <= 2 * median.window
+
+
+def test_reset_clears_window():
+    median = RollingMedian(3)
+    for v in (100.0, 100.0, 100.0):
+        median.push(v)
+    median.reset()
+    assert median.push(60.0) == 60.0
+
+
+def test_filter_rejects_single_spike():
+    hr_filter = HeartRateFilter({"median_window": 3})
+    outputs = [hr_filter.process(bpm, i * 1.0) for i, bpm in enumerate([70, 71, 190, 72, 40, 73])]
+    assert max(outputs) < 80 and min(outputs) > 60
@@ -0,0 +1,46 @@
+# test_http_async.py
+
+"""serve_connection 对处理函数异常的响应"""
+
+import asyncio
+
+from http_async import HttpError, Response, serve_connection
+
+
+async def handle(request):
+    if request.path == "/boom":
+        raise RuntimeError("database is locked")
+    if request.path == "/missing":
+        raise HttpError(404)
+    return Response.text(200, "ok")
+
+
+async def run_blocking(fn, *args):
+    return fn(*args)
+
+
+async def exchange(*paths: str) -> tuple[list[bytes], list[str]]:
+    """在同一个 keep-alive 连接上依次请求 paths，返回各响应的状态行和日志"""
+    logs = []
+    listener = await asyncio.start_server(
+        lambda r, w: serve_connection(r, w, handle, run_blocking, logger=logs.append), "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        status_lines = []
+        for path in paths:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            await reader.readexactly(length)
+            status_lines.append(head.split(b"\r\n")[0])
+        writer.close()
+        return status_lines, logs
+    finally:
+        listener.close()
+
+
+def test_handler_exception_answers_500_and_keeps_connection():
+    status_lines, logs = asyncio.run(exchange("/boom", "/missing", "/ok"))
+    assert status_lines == [b"HTTP/1.1 500 Internal Server Error", b"HTTP/1.1 404 Not Found", b"HTTP/1.1 200 OK"]
+    assert len(logs) == 1 and "/boom" in logs[0] and "database is locked" in logs[0]
@@ -0,0 +1,279 @@
+# test_mqtt_client.py
+
+"""MqttClient / MqttSink 对接进程内的 MQTT 服务器替身"""
+
+import asyncio
+import json
+import struct
+import time
+
+import pytest
+
+import runtime as runtime_module
+from mqtt_client import (
+    MqttClient, MqttMessage, MqttSink, read_packet, _packet,
+    CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP, PINGREQ, PINGRESP, DISCONNECT,
+)
+from runtime import AsyncRuntime
+from sinks import capture_sample, status_event, EVENT_CONNECTED
+
+STATUS = MqttMessage("hr/status", b"offline", 1, True)
+BIRTH = MqttMessage("hr/status", b"online", 1, True)
+
+
+class Publish:
+    def __init__(self, connection: int, flags: int, body: bytes):
+        self.connection = connection
+        self.qos = flags >> 1 & 0x03
+        self.retain = bool(flags & 0x01)
+        self.dup = bool(flags & 0x08)
+        topic_length = struct.unpack_from("!H", body)[0]
+        self.topic = body[2:2 + topic_length].decode()
+        offset = 2 + topic_length
+        self.packet_id = None
+        if self.qos:
+            self.packet_id = struct.unpack_from("!H", body, offset)[0]
+            offset += 2
+        self.payload = body[offset:]
+
+
+class BrokerStandIn:
+    """
+    最小的 MQTT 服务器替身，记录收到的报文。
+    - hold_acks 为 True 时不回复 PUBACK / PUBREC，用于检查在途窗口和重连后的重发；
+    - drop_after 为 N 时，第一个连接收到 N 条 PUBLISH 后直接断开（不发布遗嘱以外的任何东西）。
+    """
+
+    def __init__(self, hold_acks: bool = False, drop_after: int = 0):
+        self.hold_acks = hold_acks
+        self.drop_after = drop_after
+        self.connects: list[dict] = []
+        self.publishes: list[Publish] = []
+        self.pubrels: list[int] = []
+        self.retained: dict[str, bytes] = {}
+        self.disconnected_cleanly = False
+        self.wills: list[MqttMessage] = []
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._connection, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        for writer in self._writers:
+            writer.close()
+
+    def _parse_connect(self, body: bytes) -> dict:
+        offset = 0
+
+        def string():
+            nonlocal offset
+            length = struct.unpack_from("!H", body, offset)[0]
+            value = body[offset + 2:offset + 2 + length]
+            offset += 2 + length
+            return value
+
+        protocol = string()
+        level, flags = body[offset], body[offset + 1]
+        keepalive = struct.unpack_from("!H", body, offset + 2)[0]
+        offset += 4
+        info = {"protocol": protocol, "level": level, "clean": bool(flags & 0x02), "keepalive": keepalive,
+                "client_id": string().decode()}
+        if flags & 0x04:
+            info["will"] = MqttMessage(string().decode(), string(), flags >> 3 & 0x03, bool(flags & 0x20))
+        if flags & 0x80:
+            info["username"] = string().decode()
+        if flags & 0x40:
+            info["password"] = string().decode()
+        return info
+
+    async def _connection(self, reader, writer):
+        self._writers.append(writer)
+        connection = len(self.connects)
+        will = None
+        try:
+            packet_type, _, body = await read_packet(reader)
+            assert packet_type == CONNECT
+            info = self._parse_connect(body)
+            self.connects.append(info)
+            will = info.get("will")
+            writer.write(_packet(CONNACK, 0, b"\x00\x00"))
+            received = 0
+            while True:
+                packet_type, flags, body = await read_packet(reader)
+                if packet_type == PUBLISH:
+                    publish = Publish(connection, flags, body)
+                    self.publishes.append(publish)
+                    if publish.retain:
+                        self.retained[publish.topic] = publish.payload
+                    received += 1
+                    if self.drop_after and connection == 0 and received >= self.drop_after:
+                        writer.transport.abort()
+                        return
+                    if publish.qos and not self.hold_acks:
+                        ack = PUBACK if publish.qos == 1 else PUBREC
+                        writer.write(_packet(ack, 0, struct.pack("!H", publish.packet_id)))
+                elif packet_type == PUBREL:
+                    packet_id = struct.unpack_from("!H", body)[0]
+                    self.pubrels.append(packet_id)
+                    writer.write(_packet(PUBCOMP, 0, body[:2]))
+                elif packet_type == PINGREQ:
+                    writer.write(_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    self.disconnected_cleanly = True
+                    will = None
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # 异常断开时发布遗嘱
+            if will is not None:
+                self.wills.append(will)
+                self.retained[will.topic] = will.payload
+            writer.close()
+
+    def ack_all(self, writer_index: int = -1):
+        """补发所有收到的 QoS 1 消息的 PUBACK"""
+        writer = self._writers[writer_index]
+        for publish in self.publishes:
+            if publish.qos == 1:
+                writer.write(_packet(PUBACK, 0, struct.pack("!H", publish.packet_id)))
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def runtime(monkeypatch):
+    # 断线后尽快重连，测试不必等待默认的退避时间
+    monkeypatch.setattr(runtime_module, "RESTART_DELAY", 0.05)
+    rt = AsyncRuntime(lambda message: None)
+    rt.start()
+    yield rt
+    rt.stop()
+
+
+def start_broker(rt: AsyncRuntime, **options) -> tuple[BrokerStandIn, int]:
+    broker = BrokerStandIn(**options)
+    return broker, rt.submit(broker.start()).result(5)
+
+
+def make_client(rt, port, **options) -> MqttClient:
+    client = MqttClient(rt, "127.0.0.1", port, client_id="test", will=STATUS, birth=BIRTH,
+                        logger=lambda message: None, **options)
+    client.start()
+    wait_until(lambda: client.connected)
+    return client
+
+
+def test_connect_carries_will_and_credentials(runtime):
+    broker, port = start_broker(runtime)
+    client = MqttClient(runtime, "127.0.0.1", port, client_id="hr-1", username="user", password="secret",
+                        keepalive=15, will=STATUS, logger=lambda message: None)
+    client.start()
+    wait_until(lambda: client.connected)
+    info = broker.connects[0]
+    assert info["protocol"] == b"MQTT" and info["level"] == 4 and info["clean"]
+    assert info["client_id"] == "hr-1" and info["keepalive"] == 15
+    assert info["username"] == "user" and info["password"] == "secret"
+    assert info["will"] == STATUS
+    client.stop(timeout=2)
+
+
+def test_birth_retained_and_graceful_offline(runtime):
+    broker, port = start_broker(runtime)
+    client = make_client(runtime, port)
+    client.publish("hr/dev/connected", b"true", 1, True)
+    wait_until(lambda: len(broker.publishes) == 2 and not client._inflight)
+    birth, state = broker.publishes
+    assert (birth.topic, birth.payload, birth.retain) == ("hr/status", b"online", True)
+    assert (state.topic, state.payload, state.qos, state.retain) == ("hr/dev/connected", b"true", 1, True)
+
+    client.stop(timeout=2)
+    wait_until(lambda: broker.disconnected_cleanly)
+    # 正常断开时服务器不发布遗嘱，由客户端自己发布保留的 offline
+    last = broker.publishes[-1]
+    assert (last.topic, last.payload, last.retain) == ("hr/status", b"offline", True)
+    assert broker.retained["hr/status"] == b"offline" and not broker.wills
+
+
+def test_abnormal_disconnect_leaves_will_to_broker(runtime):
+    broker, port = start_broker(runtime)
+    client = make_client(runtime, port)
+    wait_until(lambda: broker.retained.get("hr/status") == b"online")
+    # 模拟网络中断：直接关闭客户端的连接
+    runtime.call(lambda: broker._writers[0].transport.abort())
+    wait_until(lambda: broker.wills)
+    assert broker.wills == [STATUS] and not broker.disconnected_cleanly
+    # 重连后 birth 再次把状态改为 online
+    wait_until(lambda: len(broker.connects) == 2 and broker.retained.get("hr/status") == b"online")
+    client.stop(timeout=2)
+
+
+def test_qos2_pubrec_pubrel_pubcomp(runtime):
+    broker, port = start_broker(runtime)
+    client = make_client(runtime, port)
+    for i in range(3):
+        client.publish("hr/dev/heart_rate", str(70 + i).encode(), 2, True)
+    wait_until(lambda: len(broker.pubrels) == 3 and not client._inflight)
+    qos2 = [p for p in broker.publishes if p.qos == 2 and p.topic == "hr/dev/heart_rate"]
+    assert [p.payload for p in qos2] == [b"70", b"71", b"72"]
+    # 每个 PUBREC 之后都发送了同一个报文标识的 PUBREL
+    assert sorted(broker.pubrels) == sorted(p.packet_id for p in qos2)
+    client.stop(timeout=2)
+
+
+def test_inflight_window_limits_unacked_messages(runtime):
+    broker, port = start_broker(runtime, hold_acks=True)
+    client = make_client(runtime, port, max_inflight=3)
+    for i in range(10):
+        client.publish("hr/dev/heart_rate", str(i).encode(), 1)
+    # birth 也是 QoS 1，占用窗口的一个位置
+    wait_until(lambda: len(broker.publishes) == 3)
+    time.sleep(0.2)
+    assert len(broker.publishes) == 3
+    assert len(client._inflight) == 3
+
+    runtime.call(broker.ack_all)
+    wait_until(lambda: len(broker.publishes) == 6)
+    runtime.call(broker.ack_all)
+    client.stop(timeout=2)
+
+
+def test_unacked_messages_resent_with_dup_after_reconnect(runtime):
+    broker, port = start_broker(runtime, hold_acks=True, drop_after=4)
+    client = make_client(runtime, port)
+    for i in range(3):
+        client.publish("hr/dev/heart_rate", str(i).encode(), 1)
+    wait_until(lambda: len(broker.connects) == 2)
+    wait_until(lambda: len([p for p in broker.publishes if p.connection == 1 and p.dup]) == 4)
+
+    first = [p for p in broker.publishes if p.connection == 0]
+    resent = [p for p in broker.publishes if p.connection == 1 and p.dup]
+    assert [(p.packet_id, p.payload) for p in resent] == [(p.packet_id, p.payload) for p in first]
+    # 重连后再次发布 birth（不是重发，不带 DUP）
+    assert any(p.connection == 1 and not p.dup and p.payload == b"online" for p in broker.publishes)
+    client.stop(timeout=2)
+
+
+def test_sink_publishes_retained_per_device_topics(runtime):
+    broker, port = start_broker(runtime)
+    sink = MqttSink(runtime, "127.0.0.1", port, prefix="hr", qos=1)
+    sink.logger = lambda message: None
+    sink.open()
+    wait_until(lambda: sink.client.connected)
+    device = "AA:BB:CC:DD:EE:FF"
+    sink.handle(status_event(EVENT_CONNECTED, 0, True, 0, device))
+    sink.handle(capture_sample(72, [0.8], device, 73))
+    wait_until(lambda: "hr/AABBCCDDEEFF/heart_rate" in broker.retained)
+    assert broker.retained["hr/status"] == b"online"
+    assert broker.retained["hr/AABBCCDDEEFF/connected"] == b"true"
+    payload = json.loads(broker.retained["hr/AABBCCDDEEFF/heart_rate"])
+    assert payload["heart_rate"] == 72 and payload["raw_heart_rate"] == 73 and payload["rr"] == [0.8]
+    sink.close()
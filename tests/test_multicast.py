@@ -0,0 +1,104 @@
+# test_multicast.py
+
+"""MulticastSink 在回环网卡上发送，由参考接收端 multicast_listener 接收和解析"""
+
+import hashlib
+import socket
+
+import pytest
+
+from multicast import MulticastSink, device_bytes, encode
+from multicast_listener import DEFAULT_GROUP, PACKET, count_lost, decode, listen, open_socket
+from sinks import capture_sample, status_event, EVENT_CONNECTED, EVENT_DISCONNECTED
+
+MAC = "AA:BB:CC:DD:EE:0F"
+UUID = "5C1F2A3B-0000-4000-8000-00805F9B34FB"
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def loopback():
+    """返回 (接收端套接字, 已打开的输出端)；系统不支持回环组播时跳过"""
+    port = free_port()
+    try:
+        listener = open_socket(DEFAULT_GROUP, port, "127.0.0.1")
+    except OSError as e:
+        pytest.skip(f"回环网卡不支持组播: {e}")
+    sink = MulticastSink(DEFAULT_GROUP, port, interface="127.0.0.1")
+    sink.logger = lambda message: None
+    sink.open()
+    yield listener, sink
+    sink.close()
+    listener.close()
+
+
+def receive(listener, count: int) -> list:
+    packets = []
+    for packet in listen(listener, timeout=2):
+        packets.append(packet)
+        if len(packets) == count:
+            break
+    return packets
+
+
+def test_sample_fields_round_trip(loopback):
+    listener, sink = loopback
+    event = capture_sample(72, [0.83], MAC)
+    sink.handle(event)
+    packet, = receive(listener, 1)
+    assert packet.seq == event.seq
+    assert packet.timestamp == event.timestamp
+    assert packet.heart_rate == 72
+    assert packet.device == MAC
+    assert packet.connected and not packet.status_change
+
+
+def test_status_events(loopback):
+    listener, sink = loopback
+    sink.handle(status_event(EVENT_CONNECTED, 0, True, 5, MAC))
+    sink.handle(status_event(EVENT_DISCONNECTED, 80, False, 9, MAC))
+    connected, disconnected = receive(listener, 2)
+    assert connected.status_change and connected.connected and connected.seq == 5
+    # 断开时心率固定为 0
+    assert disconnected.status_change and not disconnected.connected and disconnected.heart_rate == 0
+
+
+def test_device_encoding():
+    assert device_bytes(MAC) == bytes.fromhex("AABBCCDDEE0F")
+    assert device_bytes("aa-bb-cc-dd-ee-0f") == bytes.fromhex("AABBCCDDEE0F")
+    # 不是 MAC 地址的标识（macOS 上的 UUID）取 SHA-1 的前 6 个字节
+    assert device_bytes(UUID) == hashlib.sha1(UUID.encode()).digest()[:6]
+    assert device_bytes("") == bytes(6)
+    packet = decode(encode(capture_sample(60, [], UUID)))
+    assert packet.device == ":".join(f"{b:02X}" for b in hashlib.sha1(UUID.encode()).digest()[:6])
+
+
+def test_decode_rejects_foreign_datagrams():
+    data = encode(capture_sample(60, [], MAC))
+    assert decode(data[:-1]) is None
+    assert decode(b"XX" + data[2:]) is None
+    assert decode(data[:2] + b"\x02" + data[3:]) is None
+    assert len(data) == PACKET.size
+
+
+def test_loss_detection_ignores_status_packets():
+    first = capture_sample(70, [], MAC)
+    samples = [first._replace(seq=first.seq + i) for i in range(6)]
+    packets = [decode(encode(event)) for event in samples]
+    last_seq: dict[str, int] = {}
+    assert count_lost(last_seq, packets[0]) == 0
+    assert count_lost(last_seq, packets[1]) == 0
+    # 状态变化事件带的是上一个样本的序号，不算作丢失，也不影响之后的计算
+    status = decode(encode(status_event(EVENT_DISCONNECTED, 0, False, 0, MAC)))
+    assert count_lost(last_seq, status) == 0
+    assert count_lost(last_seq, packets[2]) == 0
+    # 丢失了 packets[3] 和 packets[4]
+    assert count_lost(last_seq, packets[5]) == 2
+    # 不同设备分别计算
+    other = decode(encode(samples[0]._replace(device=UUID, seq=1)))
+    assert count_lost(last_seq, other) == 0
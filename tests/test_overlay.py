@@ -0,0 +1,28 @@
+# test_overlay.py
+
+"""悬浮窗静态资源的 gzip 协商"""
+
+import pytest
+
+from http_async import Request
+from overlay import _accepts_gzip
+
+
+def request(accept_encoding: str) -> Request:
+    return Request("GET", "/overlay", "/overlay", {}, "HTTP/1.1", {"accept-encoding": accept_encoding}, b"", "127.0.0.1")
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", True),
+    ("br;q=1.0, gzip;q=0.8", True),
+    ("*", True),
+    ("gzip;q=0", False),
+    ("gzip;q=0.000", False),
+    ("identity", False),
+    ("", False),
+    # 不合法的 q 值按不接受处理，而不是抛出异常
+    ("gzip;q=abc", False),
+    ("gzip;q=", False),
+])
+def test_accepts_gzip(header, expected):
+    assert _accepts_gzip(request(header)) is expected
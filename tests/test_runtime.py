@@ -0,0 +1,46 @@
+# test_runtime.py
+
+"""AsyncRuntime 在第一次使用时才启动事件循环"""
+
+import os
+import subprocess
+import sys
+import threading
+
+from runtime import AsyncRuntime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_call_soon_before_start_runs_after_start():
+    runtime = AsyncRuntime(lambda message: None)
+    threads = []
+    done = threading.Event()
+    runtime.call_soon(lambda: threads.append(threading.current_thread().name))
+    runtime.call_soon(done.set)
+    assert runtime.loop is None and not threads
+    runtime.start()
+    try:
+        assert done.wait(2)
+        assert threads == ["runtime"]
+    finally:
+        runtime.stop()
+
+
+def test_submit_starts_runtime():
+    runtime = AsyncRuntime(lambda message: None)
+
+    async def answer():
+        return 42
+
+    try:
+        assert runtime.submit(answer()).result(2) == 42
+        assert runtime.in_loop_thread() is False and runtime.loop is not None
+    finally:
+        runtime.stop()
+
+
+def test_ui_module_does_not_import_asyncio():
+    code = "import sys, heart_rate_display_ui; print('asyncio' in sys.modules, 'ssl' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    assert result.stdout.split() == ["False", "False"], result.stderr
@@ -0,0 +1,127 @@
+# test_vrc_osc.py
+
+"""VrcOscClient 经运行时向本机的 UDP 接收端发送，解析收到的 OSC bundle 和聊天框消息"""
+
+import socket
+import struct
+import time
+
+import pytest
+
+from runtime import AsyncRuntime
+from vrc_osc import (
+    VrcOscClient, CHATBOX_ADDRESS, CHATBOX_MIN_INTERVAL, PARAM_HEART_RATE, PARAM_HEART_RATE_NORMALIZED,
+    PARAM_HEART_BEAT_TOGGLE, PARAM_HEART_RATE_CONNECTED, PARAM_HEART_RATE_ZONE, PARAM_HEART_RATE_ALERT,
+)
+
+
+def read_string(data: bytes, offset: int) -> tuple[str, int]:
+    end = data.index(b"\x00", offset)
+    return data[offset:end].decode("utf-8"), (end + 4) & ~3
+
+
+def decode_message(data: bytes) -> tuple[str, list]:
+    address, offset = read_string(data, 0)
+    tags, offset = read_string(data, offset)
+    assert tags.startswith(",")
+    args = []
+    for tag in tags[1:]:
+        if tag == "i":
+            args.append(struct.unpack_from(">i", data, offset)[0])
+            offset += 4
+        elif tag == "f":
+            args.append(struct.unpack_from(">f", data, offset)[0])
+            offset += 4
+        elif tag == "s":
+            value, offset = read_string(data, offset)
+            args.append(value)
+        else:
+            args.append({"T": True, "F": False}[tag])
+    assert offset == len(data)
+    return address, args
+
+
+def decode(datagram: bytes) -> list[tuple[str, list]]:
+    """bundle 返回其中的各条消息，单条消息返回只含它的列表"""
+    if not datagram.startswith(b"#bundle\x00"):
+        return [decode_message(datagram)]
+    assert struct.unpack_from(">Q", datagram, 8)[0] == 1  # 立即执行
+    messages, offset = [], 16
+    while offset < len(datagram):
+        size = struct.unpack_from(">i", datagram, offset)[0]
+        messages.append(decode_message(datagram[offset + 4:offset + 4 + size]))
+        offset += 4 + size
+    return messages
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(3)
+    yield sock
+    sock.close()
+
+
+@pytest.fixture
+def client(receiver):
+    runtime = AsyncRuntime(lambda message: None)
+    logs = []
+    osc = VrcOscClient(logs.append, runtime)
+    ok, _ = osc.connect("127.0.0.1", receiver.getsockname()[1])
+    assert ok
+    yield osc
+    osc.disconnect()
+    runtime.stop()
+    assert logs == []
+
+
+def receive(sock, count: int) -> list[tuple[float, list]]:
+    """收到 count 个数据报，返回各自的 (接收时间, 解析结果)"""
+    received = []
+    for _ in range(count):
+        datagram = sock.recv(2048)
+        received.append((time.monotonic(), decode(datagram)))
+    return received
+
+
+def test_sample_bundle_layout(client, receiver):
+    client.send_chatbox = False
+    client.send_heart_rate(120)
+    client.send_heart_rate(0)
+    (_, first), (_, second) = receive(receiver, 2)
+    assert first == [
+        (PARAM_HEART_RATE, [120]),
+        (PARAM_HEART_RATE_NORMALIZED, [pytest.approx((120 - 40) / 160)]),
+        (PARAM_HEART_BEAT_TOGGLE, [True]),
+        (PARAM_HEART_RATE_CONNECTED, [True]),
+    ]
+    # 断开：心率 0，翻转状态不变，离线
+    assert second == [
+        (PARAM_HEART_RATE, [0]),
+        (PARAM_HEART_RATE_NORMALIZED, [0.0]),
+        (PARAM_HEART_BEAT_TOGGLE, [True]),
+        (PARAM_HEART_RATE_CONNECTED, [False]),
+    ]
+
+
+def test_alert_state_bundle(client, receiver):
+    client.send_alert_state(3, True)
+    (_, messages), = receive(receiver, 1)
+    assert messages == [(PARAM_HEART_RATE_ZONE, [3]), (PARAM_HEART_RATE_ALERT, [True])]
+
+
+def test_chatbox_throttled(client, receiver):
+    client.send_avatar_params = False
+    started = time.monotonic()
+    for heart_rate in (70, 71, 72):
+        client.send_heart_rate(heart_rate)
+    first, second = receive(receiver, 2)
+    assert first[1] == [(CHATBOX_ADDRESS, ["❤️ 70", True])]
+    assert first[0] - started < 0.5
+    # 限速期间的样本只保留最新的文本，由定时器在限速结束时补发
+    assert second[1] == [(CHATBOX_ADDRESS, ["❤️ 72", True])]
+    assert second[0] - first[0] >= CHATBOX_MIN_INTERVAL - 0.05
+    receiver.settimeout(0.3)
+    with pytest.raises(socket.timeout):
+        receiver.recv(2048)
@@ -0,0 +1,89 @@
+# test_websocket_server.py
+
+"""共用端口时 API 服务器转交的 WebSocket 升级请求，以及向客户端的发送任务"""
+
+import asyncio
+
+from http_async import Response, serve_connection
+from websocket_server import WebSocketServer
+
+
+async def exchange(head: bytes) -> bytes:
+    """在本机端口上运行 serve_connection，发送 head 后读到连接关闭为止"""
+    server = WebSocketServer(None, 0, lambda message: None, runtime=object(), shared=True)
+
+    async def handle(request):
+        return Response.text(200, "ok")
+
+    async def run_blocking(fn, *args):
+        return fn(*args)
+
+    listener = await asyncio.start_server(
+        lambda r, w: serve_connection(r, w, handle, run_blocking, server.handle_upgrade), "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(head)
+        data = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return data
+    finally:
+        listener.close()
+
+
+def test_malformed_handshake_answers_400():
+    # 请求头名称中有空格：API 服务器能解析，握手解析失败
+    head = (b"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\nBad Header: x\r\n\r\n")
+    response = asyncio.run(exchange(head))
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response
+
+
+class FakeClient:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    async def send(self, message):
+        await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+        self.sent.append(message)
+
+
+def test_send_tasks_are_kept_until_done_and_errors_logged():
+    logs = []
+    server = WebSocketServer(None, 0, logs.append, runtime=object(), shared=True)
+    good, bad = FakeClient(), FakeClient(RuntimeError("boom"))
+
+    async def run():
+        server._start_send(good, "a")
+        server._start_send(bad, "b")
+        assert len(server._send_tasks) == 2
+        while server._send_tasks:
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert good.sent == ["a"]
+    assert len(logs) == 1 and "boom" in logs[0]
+
+
+def test_shared_stop_times_out_without_raising(monkeypatch):
+    from runtime import AsyncRuntime
+
+    logs = []
+    rt = AsyncRuntime(lambda message: None)
+    server = WebSocketServer(None, 0, logs.append, runtime=rt, shared=True)
+    server.start()
+
+    async def stuck():
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(server, "_close_upgraded", stuck)
+    try:
+        server.stop()
+    finally:
+        rt.stop()
+    assert server.loop is None
+    assert any("超时" in line for line in logs)
@@ -1,72 +1,380 @@
 # vrc_osc.py
 
-from pythonosc import udp_client
+import socket
+import struct
+import time
+from typing import Optional, TYPE_CHECKING
+
+import metrics
+
+if TYPE_CHECKING:
+    import asyncio
+    from runtime import AsyncRuntime
+
+# Avatar 参数地址
+PARAM_HEART_RATE = "/avatar/parameters/HeartRate"                     # int, 原始心率
+PARAM_HEART_RATE_NORMALIZED = "/avatar/parameters/HeartRateNormalized" # float, 0.0 ~ 1.0
+PARAM_HEART_BEAT_TOGGLE = "/avatar/parameters/HeartBeatToggle"         # bool, 每个样本翻转一次
+PARAM_HEART_RATE_CONNECTED = "/avatar/parameters/HeartRateConnected"   # bool, 设备是否在线
+PARAM_HEART_RATE_ZONE = "/avatar/parameters/HeartRateZone"             # int, 当前心率区间（见 alerts.py），0 表示无
+PARAM_HEART_RATE_ALERT = "/avatar/parameters/HeartRateAlert"           # bool, 是否有提醒规则处于触发状态
+CHATBOX_ADDRESS = "/chatbox/input"
+
+# 归一化心率时使用的区间
+NORMALIZE_MIN_BPM = 40
+NORMALIZE_MAX_BPM = 200
+# VRChat 对聊天框有频率限制，两次发送之间的最小间隔（秒）
+CHATBOX_MIN_INTERVAL = 1.5
+
+_SENDS = metrics.SINK_SENDS.labels("osc")
+_ERRORS = metrics.SINK_ERRORS.labels("osc")
+_LATENCY = metrics.SINK_LATENCY.labels("osc")
+
+# OSC bundle 的 "立即执行" 时间标签
+_BUNDLE_HEADER = b"#bundle\x00" + struct.pack(">Q", 1)
+
+
+def _osc_string(value: str) -> bytes:
+    """按 OSC 规则编码字符串：以 \\0 结尾并补齐到 4 字节边界"""
+    data = value.encode("utf-8") + b"\x00"
+    return data + b"\x00" * (-len(data) % 4)
+
+
+class OscMessageTemplate:
+    """
+    预先编码好地址和类型标签的 OSC 消息。
+    每次发送只需要打包参数值，不再重复编码地址字符串。
+    """
+    def __init__(self, address: str, type_tags: str):
+        self.address = address
+        self.type_tags = type_tags
+        self._prefix = _osc_string(address) + _osc_string("," + type_tags)
+
+    def encode(self, *args) -> bytes:
+        payload = [self._prefix]
+        for tag, value in zip(self.type_tags, args):
+            if tag == "i":
+                payload.append(struct.pack(">i", int(value)))
+            elif tag == "f":
+                payload.append(struct.pack(">f", float(value)))
+            elif tag == "s":
+                payload.append(_osc_string(value))
+            # T/F 布尔值只体现在类型标签中，没有数据部分
+        return b"".join(payload)
+
+
+def encode_bundle(messages: list[bytes]) -> bytes:
+    """把多条已编码的消息打包为一个 OSC bundle，接收端会原子地应用"""
+    parts = [_BUNDLE_HEADER]
+    for message in messages:
+        parts.append(struct.pack(">i", len(message)))
+        parts.append(message)
+    return b"".join(parts)
+
+
+# 默认的地址映射: 字段 -> OSC 地址；目标配置中可以覆盖，设为 None 表示不发送该字段
+DEFAULT_ADDRESSES = {
+    "heart_rate": PARAM_HEART_RATE,
+    "normalized": PARAM_HEART_RATE_NORMALIZED,
+    "beat_toggle": PARAM_HEART_BEAT_TOGGLE,
+    "connected": PARAM_HEART_RATE_CONNECTED,
+    "chatbox": CHATBOX_ADDRESS,
+    "zone": PARAM_HEART_RATE_ZONE,
+    "alert": PARAM_HEART_RATE_ALERT,
+}
+
+
+class OscAddressMap:
+    """
+    一组预编码的消息模板，对应一种地址映射。
+    使用相同映射的多个目标共享同一个实例，每个样本只编码一次。
+    """
+    def __init__(self, addresses: dict):
+        self.key = tuple(sorted(addresses.items(), key=lambda item: item[0]))
+        get = addresses.get
+        self.heart_rate = OscMessageTemplate(get("heart_rate"), "i") if get("heart_rate") else None
+        self.normalized = OscMessageTemplate(get("normalized"), "f") if get("normalized") else None
+        self.beat_toggle = {
+            flag: OscMessageTemplate(get("beat_toggle"), "T" if flag else "F").encode() for flag in (True, False)
+        } if get("beat_toggle") else None
+        self.connected = {
+            flag: OscMessageTemplate(get("connected"), "T" if flag else "F").encode() for flag in (True, False)
+        } if get("connected") else None
+        self.chatbox = OscMessageTemplate(get("chatbox"), "sT") if get("chatbox") else None
+        self.zone = OscMessageTemplate(get("zone"), "i") if get("zone") else None
+        self.alert = {
+            flag: OscMessageTemplate(get("alert"), "T" if flag else "F").encode() for flag in (True, False)
+        } if get("alert") else None
+
+    def encode_params(self, heart_rate: int, normalized: float, beat_toggle: bool) -> Optional[bytes]:
+        """把 Avatar 参数编码为一个 bundle；映射中没有任何参数地址时返回 None"""
+        connected = heart_rate > 0
+        messages = []
+        if self.heart_rate:
+            messages.append(self.heart_rate.encode(heart_rate))
+        if self.normalized:
+            messages.append(self.normalized.encode(normalized))
+        if self.beat_toggle:
+            messages.append(self.beat_toggle[beat_toggle])
+        if self.connected:
+            messages.append(self.connected[connected])
+        return encode_bundle(messages) if messages else None
+
+    def encode_alert_state(self, zone: int, alert: bool) -> Optional[bytes]:
+        """把提醒状态编码为一个 bundle；映射中没有对应地址时返回 None"""
+        messages = []
+        if self.zone:
+            messages.append(self.zone.encode(zone))
+        if self.alert:
+            messages.append(self.alert[alert])
+        return encode_bundle(messages) if messages else None
+
+
+class OscTarget:
+    """一个 OSC 接收端及其发送统计"""
+    def __init__(self, name: str, ip: str, port: int, addresses: Optional[dict] = None):
+        self.name = name
+        self.ip = ip
+        self.port = port
+        self.addresses = {**DEFAULT_ADDRESSES, **(addresses or {})}
+        self.sockaddr = None
+        self.family = socket.AF_INET
+        self.sent = 0
+        self.errors = 0
+        self.last_error = ""
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'OscTarget':
+        """从配置字典创建目标: {"name", "ip", "port", "addresses"}"""
+        return cls(config.get("name", ""), config.get("ip", "127.0.0.1"), int(config.get("port", 9000)), config.get("addresses"))
+
+    def resolve(self):
+        """提前解析地址，避免每次发送都做 DNS 查询"""
+        addr_info = socket.getaddrinfo(self.ip, self.port, type=socket.SOCK_DGRAM)[0]
+        self.family = addr_info[0]
+        self.sockaddr = addr_info[4]
+
+    def __str__(self):
+        return f"{self.name or '目标'}({self.ip}:{self.port})"
+
 
 class VrcOscClient:
-    """一个用于向VRChat发送OSC消息的客户端。"""
+    """
+    一个用于向VRChat（以及其他 OSC 接收端）发送OSC消息的客户端。
+    - 支持多个目标，每个目标可以有自己的地址映射；相同映射的目标共享同一份编码结果。
+    - 每个样本以一个 bundle 发送 Avatar 参数（心率、归一化心率、心跳翻转、在线状态）。
+    - 聊天框单独限速，且只在文本变化时发送。
+    - 所有发送都在后台运行时的事件循环中通过非阻塞 socket 完成，
+      调用方只是把样本交给事件循环，永不阻塞；被限速推迟的聊天框文本由定时器补发。
+    """
 
-    def __init__(self, logger_func):
+    def __init__(self, logger_func, runtime: 'AsyncRuntime'):
         """
         初始化 VrcOscClient。
 
         Args:
             logger_func (function): 用于记录日志消息的函数。
+            runtime (AsyncRuntime): 执行发送的后台运行时。
         """
-        self.client = None
         self.ip = "127.0.0.1"
         self.port = 9000
         self.logger = logger_func
+        self.runtime = runtime
+        self.send_chatbox = True
+        self.send_avatar_params = True
+
+        self.targets: list[OscTarget] = []
+        # 以下状态只在事件循环线程中修改（connect/disconnect 通过 runtime.call 切换）
+        # (地址映射, 使用该映射的目标列表)
+        self._groups: list[tuple[OscAddressMap, list[OscTarget]]] = []
+        self._sockets: dict[int, socket.socket] = {}
+        self._beat_toggle = False
+        self._last_chatbox_text: Optional[str] = None
+        self._last_chatbox_time = 0.0
+        self._chatbox_pending: Optional[str] = None
+        self._chatbox_timer: Optional['asyncio.TimerHandle'] = None
 
-    def connect(self, ip: str, port: int):
+    def connect(self, ip: str, port: int, extra_targets: Optional[list[dict]] = None):
         """
-        使用目标IP和端口初始化OSC客户端。
+        初始化OSC目标，之后的样本会发送到这些目标。
 
         Args:
             ip (str): VRChat客户端的IP地址。
             port (int): VRChat客户端的OSC端口。
-        
+            extra_targets (list[dict], optional): 额外的 OSC 目标配置，见 OscTarget.from_config。
+
         Returns:
             tuple[bool, str]: 返回一个元组，包含成功状态和消息。
         """
+        self.disconnect()
         self.ip = ip
         self.port = port
+        sockets: dict[int, socket.socket] = {}
         try:
-            self.client = udp_client.SimpleUDPClient(self.ip, self.port)
-            return True, f"OSC客户端已就绪，将发送至 {self.ip}:{self.port}"
+            targets = [OscTarget("VRChat", ip, port)]
+            targets += [OscTarget.from_config(config) for config in extra_targets or [] if config.get("enabled", True)]
+            groups: dict[tuple, tuple[OscAddressMap, list[OscTarget]]] = {}
+            for target in targets:
+                # 地址解析可能阻塞，在调用方线程中完成
+                target.resolve()
+                if target.family not in sockets:
+                    sock = socket.socket(target.family, socket.SOCK_DGRAM)
+                    sock.setblocking(False)
+                    sockets[target.family] = sock
+                address_map = OscAddressMap(target.addresses)
+                groups.setdefault(address_map.key, (address_map, []))[1].append(target)
         except Exception as e:
-            self.client = None
+            for sock in sockets.values():
+                sock.close()
             return False, f"创建OSC客户端失败: {e}"
 
+        self.targets = targets
+        # 发送在事件循环中进行，第一次连接时启动它
+        self.runtime.start()
+        self.runtime.call(self._install, list(groups.values()), sockets)
+        if len(targets) > 1:
+            return True, f"OSC客户端已就绪，将发送至 {len(targets)} 个目标: " + ", ".join(str(t) for t in targets)
+        return True, f"OSC客户端已就绪，将发送至 {self.ip}:{self.port}"
+
+    def _install(self, groups, sockets):
+        self._groups = groups
+        self._sockets = sockets
+        self._beat_toggle = False
+        self._last_chatbox_text = None
+        self._last_chatbox_time = 0.0
+        self._chatbox_pending = None
+
     def disconnect(self):
-        """断开OSC客户端。"""
-        self.client = None
+        """断开OSC客户端，返回后不会再发送任何消息。"""
+        self.runtime.call(self._uninstall)
+
+    def _uninstall(self):
+        if self._chatbox_timer:
+            self._chatbox_timer.cancel()
+            self._chatbox_timer = None
+        self._chatbox_pending = None
+        self._close_sockets()
+        self._groups = []
+
+    def _close_sockets(self):
+        for sock in self._sockets.values():
+            sock.close()
+        self._sockets = {}
 
     def is_connected(self) -> bool:
         """检查客户端是否已初始化。"""
-        return self.client is not None
+        return bool(self._sockets)
+
+    def get_target_stats(self) -> list[dict]:
+        """各目标的发送计数和错误计数"""
+        return [
+            {"name": t.name, "ip": t.ip, "port": t.port, "sent": t.sent, "errors": t.errors, "last_error": t.last_error}
+            for t in self.targets
+        ]
 
     def send_heart_rate(self, heart_rate: int):
         """
-        将心率发送到VRChat的聊天框。
+        提交一个心率样本，在事件循环中编码并发送（已在事件循环中时立即发送）。
 
         Args:
-            heart_rate (int): 要发送的当前心率值。
+            heart_rate (int): 要发送的当前心率值，0 表示设备断开。
         """
-        # --- UPDATED: 修改此处的判断条件 ---
-        # 将 `if not self.is_connected():` 替换为更直接的检查。
-        # 这能更好地帮助Pylance理解在此之后self.client不为None。
-        if self.client is None:
+        if not self._sockets:
             self.logger("OSC发送失败：客户端未连接或未初始化。")
             return
+        self.runtime.call_soon(self._process, heart_rate, None)
+
+    def send_alert_state(self, zone: int, alert: bool):
+        """
+        提交提醒状态（当前区间、是否处于提醒中）。
+        提醒状态只在变化时才会被调用，因此不随每个样本重复发送。
+        """
+        if not self._sockets:
+            return
+        self.runtime.call_soon(self._process, None, (zone, alert))
 
-        # VRChat聊天框的OSC地址
-        address = "/chatbox/input"
-        
-        # 要显示的消息内容，以及一个布尔值True以使其立即发送
-        message = f"❤️ {heart_rate}"
-        
+    def _process(self, heart_rate: Optional[int], alert_state: Optional[tuple[int, bool]]):
+        """
+        在事件循环中发送样本和提醒状态。
+        若有被限速推迟的聊天框文本，则安排定时器在限速结束时补发。
+        """
+        if not self._sockets:
+            return
         try:
-            # 经过上面的判断，Pylance现在可以确定这里的self.client不是None
-            self.client.send_message(address, [message, True])
+            if heart_rate is not None:
+                self._send_sample(heart_rate)
+            if alert_state is not None:
+                self._send_alert_state(*alert_state)
+            self._flush_chatbox()
         except Exception as e:
-            self.logger(f"发送OSC消息失败: {e}")
\ No newline at end of file
+            self.logger(f"发送OSC消息失败: {e}")
+        delay = self._chatbox_delay()
+        if delay is not None and self._chatbox_timer is None:
+            self._chatbox_timer = self.runtime.loop.call_later(max(0.0, delay), self._on_chatbox_timer)
+
+    def _on_chatbox_timer(self):
+        self._chatbox_timer = None
+        self._process(None, None)
+
+    def _chatbox_delay(self) -> Optional[float]:
+        """距离可以发送被推迟的聊天框文本还需等待的秒数，无待发文本时返回 None"""
+        if self._chatbox_pending is None:
+            return None
+        return self._last_chatbox_time + CHATBOX_MIN_INTERVAL - time.monotonic()
+
+    def _send_to(self, target: OscTarget, datagram: bytes):
+        """向单个目标发送数据报，失败只计入该目标的错误计数"""
+        start = time.perf_counter()
+        try:
+            self._sockets[target.family].sendto(datagram, target.sockaddr)
+            target.sent += 1
+            _SENDS.inc()
+            _LATENCY.observe(time.perf_counter() - start)
+        except OSError as e:
+            # 包括 BlockingIOError（发送缓冲区已满，丢弃本次数据）
+            target.errors += 1
+            _ERRORS.inc()
+            if str(e) != target.last_error:
+                self.logger(f"OSC 发送到 {target} 失败: {e}")
+            target.last_error = str(e)
+
+    def _send_sample(self, heart_rate: int):
+        if self.send_avatar_params:
+            connected = heart_rate > 0
+            if connected:
+                self._beat_toggle = not self._beat_toggle
+            span = NORMALIZE_MAX_BPM - NORMALIZE_MIN_BPM
+            normalized = min(1.0, max(0.0, (heart_rate - NORMALIZE_MIN_BPM) / span)) if connected else 0.0
+            for address_map, targets in self._groups:
+                datagram = address_map.encode_params(heart_rate, normalized, self._beat_toggle)
+                if datagram:
+                    for target in targets:
+                        self._send_to(target, datagram)
+
+        if self.send_chatbox and heart_rate > 0:
+            text = f"❤️ {heart_rate}"
+            self._chatbox_pending = text if text != self._last_chatbox_text else None
+
+    def _send_alert_state(self, zone: int, alert: bool):
+        if not self.send_avatar_params:
+            return
+        for address_map, targets in self._groups:
+            datagram = address_map.encode_alert_state(zone, alert)
+            if datagram:
+                for target in targets:
+                    self._send_to(target, datagram)
+
+    def _flush_chatbox(self):
+        """限速允许时向所有配置了聊天框地址的目标发送最新文本"""
+        delay = self._chatbox_delay()
+        if delay is None or delay > 0:
+            return
+        text = self._chatbox_pending
+        self._chatbox_pending = None
+        for address_map, targets in self._groups:
+            if address_map.chatbox:
+                datagram = address_map.chatbox.encode(text)
+                for target in targets:
+                    self._send_to(target, datagram)
+        self._last_chatbox_text = text
+        self._last_chatbox_time = time.monotonic()
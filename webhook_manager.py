@@ -3,14 +3,57 @@
 import threading
 import json
 import os
-from urllib import request, error
-from typing import Callable, Optional, List, Dict
+import time
+from datetime import datetime
+from typing import Callable, Optional, List, Dict, TYPE_CHECKING
+
+from config import ConfigStore
+from alerts import ALERT_TRIGGERS
+import metrics
+
+if TYPE_CHECKING:
+    import concurrent.futures
 
 # 定义 Webhook 的独立配置文件
 WEBHOOK_CONFIG_FILE = "config_webhook.json"
 # 定义 GitHub 仓库中的预设文件 URL
 GITHUB_CONFIG_URL = "https://raw.githubusercontent.com/ccc007ccc/HeartRateMonitor/main/config_webhook.json"
 
+_SENDS = metrics.SINK_SENDS.labels("webhook")
+_ERRORS = metrics.SINK_ERRORS.labels("webhook")
+_LATENCY = metrics.SINK_LATENCY.labels("webhook")
+
+def _placeholders(bpm_str: str, raw_str: str, captured_at: float, seq: int) -> Dict[str, str]:
+    """
+    URL、Header、Body 中可用的占位符。
+    {ts} 为 ISO 8601 格式的本地时间（含时区、精确到毫秒），{ts_ms} 为 Unix 毫秒时间戳。
+    """
+    return {
+        "{bpm}": bpm_str,
+        "{raw_bpm}": raw_str,
+        "{ts}": datetime.fromtimestamp(captured_at).astimezone().isoformat(timespec="milliseconds"),
+        "{ts_ms}": str(int(captured_at * 1000)),
+        "{seq}": str(seq),
+    }
+
+
+def _stat_placeholders(stats: Optional[Dict[str, Optional[float]]]) -> Dict[str, str]:
+    """统计占位符 {avg}、{max}、{min}、{avg_1m} 等（见 session_stats.py），平均值取整，无数据时为 N/A"""
+    from session_stats import placeholder_names
+    stats = stats or {}
+    return {
+        "{" + name + "}": "N/A" if stats.get(name) is None else str(int(round(stats[name])))
+        for name in placeholder_names()
+    }
+
+
+def _fill(text: str, placeholders: Dict[str, str]) -> str:
+    for key, value in placeholders.items():
+        if key in text:
+            text = text.replace(key, value)
+    return text
+
+
 class WebhookManager:
     """
     管理所有Webhook的加载、保存和发送。
@@ -20,6 +63,9 @@ class WebhookManager:
         self.logger = logger_func
         self.response_logger = response_logger
         self.webhooks: List[Dict] = []
+        self.store = ConfigStore(WEBHOOK_CONFIG_FILE, default=[], ensure_ascii=False)
+        # 发送请求用的线程池（通常是后台运行时的线程池）；为 None 时每个请求单独开一个线程
+        self.executor: Optional['concurrent.futures.Executor'] = None
         self.load_webhooks() # 初始化时即加载
 
     def load_webhooks(self):
@@ -28,22 +74,26 @@ class WebhookManager:
             self.webhooks = []
             self.logger("未找到 Webhook 配置文件，已初始化为空列表。")
             return
-        try:
-            with open(WEBHOOK_CONFIG_FILE, "r", encoding="utf-8") as f:
-                self.webhooks = json.load(f)
+        self.webhooks = self.store.load()
+        if self.store.last_error:
+            self.logger(f"加载 Webhook 配置失败: {self.store.last_error}")
+            self.store.last_error = None
+        else:
             self.logger(f"从 {WEBHOOK_CONFIG_FILE} 加载了 {len(self.webhooks)} 个 Webhook 配置。")
-        except (json.JSONDecodeError, IOError) as e:
-            self.webhooks = []
-            self.logger(f"加载 {WEBHOOK_CONFIG_FILE} 失败: {e}")
 
     def save_webhooks(self):
-        """将当前Webhook列表保存到 config_webhook.json"""
-        try:
-            with open(WEBHOOK_CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.webhooks, f, indent=4, ensure_ascii=False)
-            self.logger(f"已将 {len(self.webhooks)} 个 Webhook 配置保存到 {WEBHOOK_CONFIG_FILE}。")
-        except IOError as e:
-            self.logger(f"保存 {WEBHOOK_CONFIG_FILE} 失败: {e}")
+        """
+        将当前Webhook列表保存到 config_webhook.json。
+        连续的多次修改会合并为一次后台原子写入。
+        """
+        self.store.save(self.webhooks)
+        self.logger(f"已将 {len(self.webhooks)} 个 Webhook 配置提交保存到 {WEBHOOK_CONFIG_FILE}。")
+
+    def flush(self):
+        """立即写入尚未落盘的 Webhook 配置"""
+        self.store.flush()
+        if self.store.last_error:
+            self.logger(self.store.last_error)
 
     def get_webhooks(self) -> List[Dict]:
         """获取所有Webhook配置"""
@@ -69,15 +119,16 @@ class WebhookManager:
     def sync_from_github(self) -> tuple[bool, str]:
         """从GitHub下载最新的预设文件并覆盖本地文件"""
         self.logger("开始从 GitHub 同步 Webhook 预设...")
+        from urllib import request
         try:
             req = request.Request(GITHUB_CONFIG_URL, headers={'User-Agent': 'HeartRateMonitor-App'})
             with request.urlopen(req, timeout=15) as response:
                 if response.status == 200:
                     content = response.read().decode('utf-8')
                     # 验证下载的内容是合法的JSON
-                    json.loads(content)
-                    with open(WEBHOOK_CONFIG_FILE, "w", encoding="utf-8") as f:
-                        f.write(content)
+                    webhooks = json.loads(content)
+                    self.store.save(webhooks)
+                    self.store.flush()
                     self.logger("成功从 GitHub 同步并覆盖了本地 Webhook 配置文件。")
                     self.load_webhooks() # 同步后重新加载
                     return True, "同步成功！已从GitHub获取最新的官方预设。"
@@ -90,16 +141,26 @@ class WebhookManager:
             self.logger(msg)
             return False, msg
 
-    def trigger_event(self, event_type: str, heart_rate: int = 0):
+    def trigger_event(self, event_type: str, heart_rate: int = 0, captured_at: Optional[float] = None, seq: int = 0,
+                      raw_heart_rate: int = 0, detail: str = "", stats: Optional[Dict[str, Optional[float]]] = None):
         """
         [新增] 根据事件类型触发匹配的 Webhook。
-        event_type: "connected", "disconnected", "heart_rate_updated"
+        event_type: "connected", "disconnected", "heart_rate_updated"，或 alerts.ALERT_TRIGGERS 中的提醒事件
+        captured_at: 样本的采集时间（Unix 秒），用于 {ts}/{ts_ms} 占位符；为空时取当前时间
+        seq: 样本序号，用于 {seq} 占位符
+        raw_heart_rate: 滤波前的原始心率，用于 {raw_bpm} 占位符；为 0 时与 heart_rate 相同
+        detail: 提醒事件的规则/区间名称，用于 {alert} 占位符
+        stats: SessionStats.values，用于 {avg}/{max}/{min} 等统计占位符
         """
+        if captured_at is None:
+            captured_at = time.time()
         event_map = {
             "connected": "设备已连接",
             "disconnected": "设备已断开",
             "heart_rate_updated": f"心率刷新: {heart_rate}bpm"
         }
+        if event_type in ALERT_TRIGGERS:
+            event_map[event_type] = f"{ALERT_TRIGGERS[event_type]}: {detail} ({heart_rate}bpm)"
         self.logger(f"Webhook 事件触发: {event_map.get(event_type, event_type)}")
         
         for config in self.webhooks:
@@ -114,12 +175,7 @@ class WebhookManager:
                 body_str = config.get("body", "{}")
                 body_str = body_str.replace("{event}", event_map.get(event_type, ""))
 
-                thread = threading.Thread(
-                    target=self._send_request,
-                    args=(config, heart_rate, False, body_str),
-                    daemon=True
-                )
-                thread.start()
+                self._submit(config, heart_rate, False, body_str, captured_at, seq, raw_heart_rate, detail, stats)
 
     def test_webhook(self, config: Dict):
         """测试单个Webhook配置"""
@@ -127,14 +183,28 @@ class WebhookManager:
         test_heart_rate = 88 
         # 测试时，模拟心率更新事件
         test_body = config.get("body", "{}").replace("{event}", f"心率刷新: {test_heart_rate}bpm")
-        thread = threading.Thread(target=self._send_request, args=(config, test_heart_rate, True, test_body), daemon=True)
-        thread.start()
+        self._submit(config, test_heart_rate, True, test_body)
+
+    def _submit(self, *args):
+        """在后台发送一个请求，不阻塞调用方"""
+        if self.executor is not None:
+            try:
+                self.executor.submit(self._send_request, *args)
+                return
+            except RuntimeError:
+                pass  # 线程池已关闭（程序正在退出），退回到独立线程
+        threading.Thread(target=self._send_request, args=args, daemon=True).start()
 
-    def _send_request(self, config: Dict, heart_rate: int, is_test: bool = False, custom_body: Optional[str] = None):
+    def _send_request(self, config: Dict, heart_rate: int, is_test: bool = False, custom_body: Optional[str] = None,
+                      captured_at: Optional[float] = None, seq: int = 0, raw_heart_rate: int = 0, detail: str = "",
+                      stats: Optional[Dict[str, Optional[float]]] = None):
         """
         执行HTTP请求的内部方法。
         [修改] 增加了 custom_body 参数用于事件触发。
         """
+        # urllib.request 会连带加载 http.client/ssl，只在真正发送时才导入
+        from urllib import request, error
+
         def log_response(message):
             if is_test and self.response_logger:
                 self.response_logger(message)
@@ -143,16 +213,21 @@ class WebhookManager:
 
         try:
             bpm_str = str(heart_rate) if heart_rate > 0 else "N/A"
-            
-            url = config.get("url", "").replace("{bpm}", bpm_str)
+            raw = raw_heart_rate or heart_rate
+            raw_str = str(raw) if raw > 0 else "N/A"
+            placeholders = _placeholders(bpm_str, raw_str, captured_at if captured_at is not None else time.time(), seq)
+            placeholders["{alert}"] = detail
+            placeholders.update(_stat_placeholders(stats))
+
+            url = _fill(config.get("url", ""), placeholders)
             if not url.startswith(('http://', 'https://')):
                 log_response(f"[{config.get('name')}] 发送失败: 无效的URL。")
                 return
 
-            headers_str = config.get("headers", "{}").replace("{bpm}", bpm_str)
+            headers_str = _fill(config.get("headers", "{}"), placeholders)
             # 如果提供了自定义body，就用它，否则用配置里的
             body_str = custom_body if custom_body is not None else config.get("body", "{}")
-            body_str = body_str.replace("{bpm}", bpm_str)
+            body_str = _fill(body_str, placeholders)
 
 
             headers = json.loads(headers_str)
@@ -165,8 +240,12 @@ class WebhookManager:
 
             req = request.Request(url, data=data, headers=headers, method='POST')
 
+            start = time.perf_counter()
             with request.urlopen(req, timeout=10) as response:
                 response_body = response.read().decode('utf-8', errors='ignore')
+                if not is_test:
+                    _SENDS.inc()
+                    _LATENCY.observe(time.perf_counter() - start)
                 log_func = self.response_logger if is_test and self.response_logger else self.logger
                 log_func(
                     f"--- Webhook {'测试' if is_test else ''}响应 ---\n"
@@ -176,8 +255,10 @@ class WebhookManager:
                     f"----------------------"
                 )
         except json.JSONDecodeError as e:
+            if not is_test: _ERRORS.inc()
             log_response(f"[{config.get('name')}] 发送失败: Headers 或 Body 的 JSON 格式错误: {e}")
         except error.HTTPError as e:
+            if not is_test: _ERRORS.inc()
             log_response(
                 f"--- Webhook {'测试' if is_test else ''}响应 (HTTP错误) ---\n"
                 f"名称: {config.get('name')}\n"
@@ -186,6 +267,8 @@ class WebhookManager:
                 f"-----------------------------"
             )
         except error.URLError as e:
+            if not is_test: _ERRORS.inc()
             log_response(f"[{config.get('name')}] 发送失败 (URL错误): {e.reason}")
         except Exception as e:
+            if not is_test: _ERRORS.inc()
             log_response(f"[{config.get('name')}] 发送时发生未知错误: {e}")
\ No newline at end of file
@@ -5,6 +5,8 @@ from tkinter import ttk, scrolledtext, messagebox
 import json
 from typing import Optional
 
+from alerts import ALERT_TRIGGERS
+
 class WebhookWindow(tk.Toplevel):
     """
     Webhook管理的独立窗口
@@ -67,6 +69,8 @@ class WebhookWindow(tk.Toplevel):
         self.trigger_connect_var = tk.BooleanVar(value=False)
         self.trigger_disconnect_var = tk.BooleanVar(value=False)
         self.trigger_hr_update_var = tk.BooleanVar(value=True)
+        # 提醒规则产生的触发器（规则在 config.json 的 "alerts" 中配置）
+        self.alert_trigger_vars = {kind: tk.BooleanVar(value=False) for kind in ALERT_TRIGGERS}
 
 
         ttk.Checkbutton(details_frame, text="启用此 Webhook", variable=self.enabled_var).grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 5))
@@ -82,6 +86,8 @@ class WebhookWindow(tk.Toplevel):
         ttk.Checkbutton(trigger_frame, text="连接时", variable=self.trigger_connect_var).grid(row=0, column=0, sticky='w')
         ttk.Checkbutton(trigger_frame, text="断开时", variable=self.trigger_disconnect_var).grid(row=0, column=1, sticky='w')
         ttk.Checkbutton(trigger_frame, text="心率刷新", variable=self.trigger_hr_update_var).grid(row=0, column=2, sticky='w')
+        for i, (kind, label) in enumerate(ALERT_TRIGGERS.items()):
+            ttk.Checkbutton(trigger_frame, text=label, variable=self.alert_trigger_vars[kind]).grid(row=1 + i // 3, column=i % 3, sticky='w')
 
         ttk.Label(details_frame, text="Body (JSON):").grid(row=4, column=0, sticky="nw", pady=(10,0))
         self.body_text = tk.Text(details_frame, height=6, font=("Consolas", 9))
@@ -91,7 +97,7 @@ class WebhookWindow(tk.Toplevel):
         ttk.Label(details_frame, text="Headers (JSON):").grid(row=5, column=0, sticky="nw", pady=(10,0))
         self.headers_text = tk.Text(details_frame, height=4, font=("Consolas", 9))
         self.headers_text.grid(row=5, column=1, sticky="nsew", padx=(5,0), pady=(10,0))
-        ttk.Label(details_frame, text="可用占位符: {bpm}, {event}", foreground="gray").grid(row=6, column=1, sticky="w", padx=5)
+        ttk.Label(details_frame, text="可用占位符: {bpm}, {raw_bpm}, {event}, {alert}, {ts}, {ts_ms}, {seq}, {avg}, {max}, {min}", foreground="gray").grid(row=6, column=1, sticky="w", padx=5)
 
         response_frame = ttk.LabelFrame(edit_frame, text="测试响应日志", padding="10")
         response_frame.grid(row=4, column=0, sticky="nsew", pady=(10,0))
@@ -155,6 +161,8 @@ class WebhookWindow(tk.Toplevel):
         self.trigger_connect_var.set("connected" in triggers)
         self.trigger_disconnect_var.set("disconnected" in triggers)
         self.trigger_hr_update_var.set("heart_rate_updated" in triggers)
+        for kind, var in self.alert_trigger_vars.items():
+            var.set(kind in triggers)
         
         self.body_text.delete(1.0, tk.END)
         self.body_text.insert(1.0, config.get("body", "{\n    \"bpm\": \"{bpm}\",\n    \"event\": \"{event}\"\n}"))
@@ -174,6 +182,8 @@ class WebhookWindow(tk.Toplevel):
         self.trigger_connect_var.set(False)
         self.trigger_disconnect_var.set(False)
         self.trigger_hr_update_var.set(True)
+        for var in self.alert_trigger_vars.values():
+            var.set(False)
 
         self.body_text.delete(1.0, tk.END)
         self.body_text.insert(1.0, "{\n    \"bpm\": \"{bpm}\",\n    \"event\": \"{event}\"\n}")
@@ -213,6 +223,7 @@ class WebhookWindow(tk.Toplevel):
             triggers.append("disconnected")
         if self.trigger_hr_update_var.get():
             triggers.append("heart_rate_updated")
+        triggers += [kind for kind, var in self.alert_trigger_vars.items() if var.get()]
 
         return {
             "enabled": self.enabled_var.get(),
@@ -2,115 +2,577 @@
 
 import asyncio
 import json
-import threading
-from typing import Set, Optional, Callable, TYPE_CHECKING
+import math
+import struct
+from collections import deque
+from typing import Set, Optional, Callable, NamedTuple, Sequence, Union, TYPE_CHECKING
+import time
 import websockets
+from websockets.frames import Opcode
+from websockets.protocol import State
 from websockets.server import ServerProtocol
 
+import metrics
+from sinks import SinkEvent, EVENT_HEART_RATE, EVENT_DISCONNECTED
+from alerts import ALERT_TRIGGERS
+
+_SENDS = metrics.SINK_SENDS.labels("websocket")
+_ERRORS = metrics.SINK_ERRORS.labels("websocket")
+_LATENCY = metrics.SINK_LATENCY.labels("websocket")
+
 if TYPE_CHECKING:
     from heart_rate_display_ui import HeartRateMonitor
+    from http_async import Request
+    from runtime import AsyncRuntime
+
+# 子协议。客户端不指定子协议时使用 JSON 文本帧（与旧版本兼容）；
+# 在握手时请求 SUBPROTOCOL_BINARY 则改为接收下面定义的定长二进制帧。
+SUBPROTOCOL_JSON = "hrm.json.v1"
+SUBPROTOCOL_BINARY = "hrm.binary.v1"
+
+# 二进制帧（网络字节序）：
+#   u8  版本 (BINARY_VERSION)
+#   u8  标志位 (FLAG_*)
+#   u16 心率 bpm，断开时为 0
+#   u32 样本序号 seq
+#   f64 采集时间，Unix 秒
+#   u8  RR 间期个数 n
+#   n × u16 RR 间期，单位 1/1024 秒（与 BLE 心率规范一致）
+BINARY_VERSION = 1
+FLAG_CONNECTED = 0x01
+FLAG_STATUS = 0x02   # 连接状态变化事件，而非新样本
+_BINARY_HEADER = struct.Struct("!BBHIdB")
+_RR_STRUCTS: dict[int, struct.Struct] = {}
+
+
+# 订阅可选的字段
+FIELD_BPM = "bpm"        # heart_rate / connected / status，始终包含
+FIELD_TIME = "time"      # seq / timestamp / monotonic
+FIELD_RR = "rr"          # 本次通知携带的 RR 间期（秒）
+FIELD_HRV = "hrv"        # 最近 RR 间期的 RMSSD（毫秒）
+FIELD_DEVICE = "device"  # 设备标识
+FIELD_RAW = "raw"        # 滤波前的原始心率 raw_heart_rate
+FIELD_ALERTS = "alerts"  # 接收提醒事件（见 alerts.py），以单独的 {"type": "alert"} 消息发送
+FIELD_STATS = "stats"    # 1 分钟 / 10 分钟 / 会话的平均、最小、最大心率（见 session_stats.py）
+ALL_FIELDS = frozenset((FIELD_BPM, FIELD_TIME, FIELD_RR, FIELD_HRV, FIELD_DEVICE, FIELD_RAW, FIELD_ALERTS,
+                        FIELD_STATS))
+# 未发送订阅消息的客户端收到的字段，与旧版本一致
+DEFAULT_FIELDS = frozenset((FIELD_BPM, FIELD_TIME))
+# 二进制帧本身包含 RR 间期，未订阅时默认发送
+DEFAULT_BINARY_FIELDS = DEFAULT_FIELDS | {FIELD_RR}
+
+# 计算 HRV (RMSSD) 时使用的最近 RR 间期个数
+HRV_WINDOW = 30
+
+# 共用端口时，连接空闲多久发送一次 ping（秒）；再过同样长的时间仍无任何数据则断开
+PING_INTERVAL = 20.0
+
+
+class Subscription(NamedTuple):
+    """
+    一个客户端的订阅。订阅完全相同的客户端被归为一组，每组每个样本只判断、编码一次。
+    """
+    fields: frozenset = DEFAULT_FIELDS
+    devices: frozenset = frozenset()  # 为空表示所有设备
+    min_interval: float = 0.0         # 两次推送之间的最短间隔（秒），由 max_rate 换算
+    downsample: int = 1               # 每 N 个样本推送一次
+
+    @classmethod
+    def parse(cls, message: dict) -> 'Subscription':
+        """
+        解析客户端发来的订阅消息，例如：
+        {"type": "subscribe", "fields": ["bpm", "hrv"], "devices": ["AA:BB:..."], "max_rate": 1, "downsample": 2}
+        """
+        fields = message.get("fields")
+        if fields is None:
+            fields = DEFAULT_FIELDS
+        else:
+            fields = frozenset(fields) | {FIELD_BPM}
+            unknown = fields - ALL_FIELDS
+            if unknown:
+                raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+        devices = frozenset(str(d).upper() for d in message.get("devices") or ())
+        max_rate = float(message.get("max_rate") or 0)
+        if max_rate < 0 or math.isnan(max_rate):
+            raise ValueError("max_rate 不能为负数")
+        downsample = int(message.get("downsample") or 1)
+        if downsample < 1:
+            raise ValueError("downsample 必须 ≥ 1")
+        return cls(frozenset(fields), devices, 1.0 / max_rate if max_rate else 0.0, downsample)
+
+    def describe(self) -> dict:
+        return {
+            "fields": sorted(self.fields),
+            "devices": sorted(self.devices),
+            "max_rate": round(1.0 / self.min_interval, 3) if self.min_interval else None,
+            "downsample": self.downsample,
+        }
+
+
+DEFAULT_SUBSCRIPTION = Subscription()
+DEFAULT_BINARY_SUBSCRIPTION = Subscription(fields=DEFAULT_BINARY_FIELDS)
+
+
+def encode_json(event: SinkEvent, fields: frozenset = DEFAULT_FIELDS, hrv: Optional[float] = None,
+                stats: Optional[dict] = None) -> str:
+    """JSON 文本消息；尚无样本时不含时间字段"""
+    data = {
+        "heart_rate": event.heart_rate,
+        "connected": event.connected,
+        "status": "connected" if event.connected else "disconnected",
+    }
+    if FIELD_TIME in fields and event.timestamp:
+        data.update(event.timing())
+    if FIELD_RR in fields:
+        data["rr"] = [round(r, 4) for r in event.rr_intervals]
+    if FIELD_HRV in fields:
+        data["hrv"] = round(hrv, 1) if hrv is not None else None
+    if FIELD_DEVICE in fields:
+        data["device"] = event.device
+    if FIELD_RAW in fields:
+        data["raw_heart_rate"] = event.raw_heart_rate or event.heart_rate
+    if FIELD_STATS in fields:
+        data["stats"] = stats
+    return json.dumps(data)
+
+
+def encode_alert(event: SinkEvent) -> str:
+    """提醒事件总是以 JSON 文本帧发送（二进制子协议的客户端也一样）"""
+    data = {
+        "type": "alert",
+        "event": event.kind,
+        "detail": event.detail,
+        "heart_rate": event.heart_rate,
+    }
+    if event.timestamp:
+        data.update(event.timing())
+    return json.dumps(data, ensure_ascii=False)
+
+
+def encode_binary(event: SinkEvent, fields: frozenset = DEFAULT_BINARY_FIELDS, hrv: Optional[float] = None,
+                  stats: Optional[dict] = None) -> bytes:
+    """定长二进制消息，布局见上方注释；未订阅 rr 时 RR 个数为 0，二进制帧不含 hrv/device/stats"""
+    flags = FLAG_CONNECTED if event.connected else 0
+    if event.kind != EVENT_HEART_RATE:
+        flags |= FLAG_STATUS
+    rr_intervals = event.rr_intervals if FIELD_RR in fields else ()
+    rr = [min(0xFFFF, int(round(r * 1024))) for r in rr_intervals[:255]]
+    header = _BINARY_HEADER.pack(BINARY_VERSION, flags, min(0xFFFF, max(0, event.heart_rate)),
+                                 event.seq & 0xFFFFFFFF, event.timestamp, len(rr))
+    if not rr:
+        return header
+    rr_struct = _RR_STRUCTS.get(len(rr))
+    if rr_struct is None:
+        rr_struct = _RR_STRUCTS[len(rr)] = struct.Struct(f"!{len(rr)}H")
+    return header + rr_struct.pack(*rr)
+
+
+def _select_subprotocol(connection, subprotocols: Sequence[str]) -> Optional[str]:
+    """客户端请求了二进制子协议时使用它，否则（包括未请求任何子协议）使用 JSON"""
+    if SUBPROTOCOL_BINARY in subprotocols:
+        return SUBPROTOCOL_BINARY
+    if SUBPROTOCOL_JSON in subprotocols:
+        return SUBPROTOCOL_JSON
+    return None
+
+
+class _HrvTracker:
+    """根据最近 HRV_WINDOW 个 RR 间期计算 RMSSD（毫秒）"""
+
+    def __init__(self):
+        self._rr: deque[float] = deque(maxlen=HRV_WINDOW)
+        self.value: Optional[float] = None
+
+    def update(self, event: SinkEvent) -> Optional[float]:
+        if event.kind == EVENT_DISCONNECTED:
+            self._rr.clear()
+            self.value = None
+        elif event.rr_intervals:
+            self._rr.extend(event.rr_intervals)
+            if len(self._rr) >= 2:
+                rr = list(self._rr)
+                squares = sum((b - a) ** 2 for a, b in zip(rr, rr[1:]))
+                self.value = math.sqrt(squares / (len(rr) - 1)) * 1000
+        return self.value
+
+
+class _Group:
+    """订阅相同的一组客户端，以及该组的限速状态"""
+    __slots__ = ("subscription", "clients", "last_sent", "skipped")
+
+    def __init__(self, subscription: Subscription):
+        self.subscription = subscription
+        self.clients: Set[ServerProtocol] = set()
+        self.last_sent = 0.0
+        self.skipped = 0
+
+    def accepts(self, event: SinkEvent, now: float) -> bool:
+        """按设备过滤、降采样和限速判断本组是否需要这个事件；状态变化事件总是推送"""
+        sub = self.subscription
+        if sub.devices and event.device.upper() not in sub.devices:
+            return False
+        if event.kind != EVENT_HEART_RATE:
+            return True
+        self.skipped += 1
+        if self.skipped < sub.downsample:
+            return False
+        if sub.min_interval and now - self.last_sent < sub.min_interval:
+            return False
+        self.skipped = 0
+        self.last_sent = now
+        return True
+
+
+class _StreamConnection:
+    """
+    与 API 服务器共用端口时的 WebSocket 连接：握手与帧的编解码交给 websockets 的无 I/O 协议实现，
+    读写直接使用 HTTP 连接的 StreamReader/StreamWriter。
+    对外提供与 websockets 连接相同的接口（subprotocol、remote_address、send、异步迭代、close），
+    WebSocketServer 的处理逻辑无需区分两种连接。
+    """
+
+    def __init__(self, protocol: ServerProtocol, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.protocol = protocol
+        self.reader = reader
+        self.writer = writer
+        self.subprotocol = protocol.subprotocol
+        self.remote_address = writer.get_extra_info("peername")
+
+    def _flush(self):
+        for data in self.protocol.data_to_send():
+            if data:
+                self.writer.write(data)
+            elif self.writer.can_write_eof():
+                self.writer.write_eof()  # 协议要求关闭写方向（关闭握手完成）
+
+    async def send(self, message: Union[str, bytes]):
+        if self.protocol.state is not State.OPEN:
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+        if isinstance(message, str):
+            self.protocol.send_text(message.encode("utf-8"))
+        else:
+            self.protocol.send_binary(message)
+        self._flush()
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        if self.protocol.state is State.OPEN:
+            self.protocol.send_close(code, reason)
+            self._flush()
+        self.writer.close()
+
+    async def __aiter__(self):
+        """逐条产出客户端消息；正常关闭时结束，异常关闭时抛出 ConnectionClosedError"""
+        fragments: list[bytes] = []
+        opcode = None
+        idle = False
+        while self.protocol.state is not State.CLOSED:
+            try:
+                data = await asyncio.wait_for(self.reader.read(65536), PING_INTERVAL)
+            except asyncio.TimeoutError:
+                if idle:
+                    self.protocol.fail(1011, "keepalive ping timeout")
+                    self._flush()
+                    break
+                idle = True
+                self.protocol.send_ping(b"")
+                self._flush()
+                continue
+            except ConnectionError:
+                break
+            idle = False
+            if data:
+                self.protocol.receive_data(data)
+            else:
+                self.protocol.receive_eof()
+            for frame in self.protocol.events_received():
+                # 分片的消息先收集，收到最后一片时合并（ping/pong/close 由协议自行处理）
+                if frame.opcode in (Opcode.TEXT, Opcode.BINARY):
+                    opcode = frame.opcode
+                    fragments = [frame.data]
+                elif frame.opcode is Opcode.CONT and opcode is not None:
+                    fragments.append(frame.data)
+                else:
+                    continue
+                if frame.fin:
+                    message = b"".join(fragments)
+                    yield message.decode("utf-8") if opcode is Opcode.TEXT else message
+                    fragments, opcode = [], None
+            self._flush()
+            if not data:
+                break
+        self.writer.close()
+        if self.protocol.state is not State.CLOSED:
+            self.protocol.receive_eof()
+        exc = self.protocol.close_exc
+        if not isinstance(exc, websockets.exceptions.ConnectionClosedOK):
+            raise exc
 
 
 class WebSocketServer:
     """
-    运行在独立线程中的WebSocket服务器，用于实时推送心率数据。
+    运行在后台运行时中的WebSocket服务器（受看管的任务 "websocket"），用于实时推送心率数据。
+    shared 为 True 时不单独监听端口，而是由 API 服务器把 WebSocket 升级请求交给 handle_upgrade()。
+    客户端可以发送订阅消息选择字段、设备和推送频率（见 Subscription），
+    订阅相同的客户端组成一组，每组每种格式每个样本只编码一次。
     """
 
-    def __init__(self, monitor_instance: 'HeartRateMonitor', port: int, logger_func: Callable[[str], None]):
+    def __init__(self, monitor_instance: 'HeartRateMonitor', port: int, logger_func: Callable[[str], None],
+                 runtime: Optional['AsyncRuntime'] = None, shared: bool = False):
         self.monitor_instance = monitor_instance
         self.port = port
         self.logger = logger_func
-        self.server_thread: Optional[threading.Thread] = None
+        self.runtime = runtime or monitor_instance.runtime
+        self.shared = shared
+        # 共用端口时正在处理的连接（处理任务 -> 连接），停止时一并关闭
+        self._upgraded: dict[asyncio.Task, _StreamConnection] = {}
+        # 服务器运行期间为运行时的事件循环，未运行时为 None
         self.loop: Optional[asyncio.AbstractEventLoop] = None
         self.server = None
         self.connected_clients: Set[ServerProtocol] = set()
+        # 以下状态只在服务器的事件循环线程中读写
+        self._groups: dict[Subscription, _Group] = {}
+        self._client_subscriptions: dict[ServerProtocol, Subscription] = {}
+        self._hrv = _HrvTracker()
+        # 正在进行的发送任务；事件循环只弱引用任务，这里保留引用直到发送结束
+        self._send_tasks: set[asyncio.Task] = set()
 
     # [修正] 从函数签名中移除未使用的 'path' 参数，以解决 TypeError
     async def _handler(self, websocket: ServerProtocol):
         """处理新的客户端连接和消息"""
         self.connected_clients.add(websocket)
+        binary = websocket.subprotocol == SUBPROTOCOL_BINARY # type: ignore
+        self._set_subscription(websocket, DEFAULT_BINARY_SUBSCRIPTION if binary else DEFAULT_SUBSCRIPTION)
+        metrics.WEBSOCKET_CLIENTS.set(len(self.connected_clients))
         self.logger(f"[WebSocket] 客户端连接: {websocket.remote_address}") # type: ignore
         try:
             # 发送当前状态
             await self.send_data(websocket)
-            # 持续监听，直到客户端断开
+            # 持续监听订阅消息，直到客户端断开
             async for message in websocket: # type: ignore
-                pass
+                await self._handle_message(websocket, message)
         except websockets.exceptions.ConnectionClosed:
             self.logger(f"[WebSocket] 客户端断开连接: {websocket.remote_address}") # type: ignore
         finally:
             # 确保即使在发生异常时也能移除客户端
             if websocket in self.connected_clients:
                 self.connected_clients.remove(websocket)
+            self._set_subscription(websocket, None)
+            metrics.WEBSOCKET_CLIENTS.set(len(self.connected_clients))
+
+    async def _handle_message(self, websocket: ServerProtocol, message: Union[str, bytes]):
+        """处理客户端消息，目前只支持订阅：{"type": "subscribe", ...}"""
+        try:
+            request = json.loads(message)
+            if not isinstance(request, dict) or request.get("type") != "subscribe":
+                raise ValueError('只支持 {"type": "subscribe", ...} 消息')
+            subscription = Subscription.parse(request)
+        except (ValueError, TypeError) as e:
+            await self._reply(websocket, {"type": "error", "message": str(e)})
+            return
+        self._set_subscription(websocket, subscription)
+        await self._reply(websocket, {"type": "subscribed", **subscription.describe()})
+        # 立即按新的订阅发送一次当前状态
+        await self.send_data(websocket)
+
+    async def _reply(self, websocket: ServerProtocol, data: dict):
+        try:
+            await websocket.send(json.dumps(data, ensure_ascii=False)) # type: ignore
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def _set_subscription(self, websocket: ServerProtocol, subscription: Optional[Subscription]):
+        """把客户端移到对应订阅的组中；subscription 为 None 时移除客户端"""
+        old = self._client_subscriptions.pop(websocket, None)
+        if old is not None:
+            group = self._groups.get(old)
+            if group:
+                group.clients.discard(websocket)
+                if not group.clients:
+                    del self._groups[old]
+        if subscription is None:
+            return
+        group = self._groups.get(subscription)
+        if group is None:
+            group = self._groups[subscription] = _Group(subscription)
+        group.clients.add(websocket)
+        self._client_subscriptions[websocket] = subscription
 
     async def _run_server(self):
-        """启动WebSocket服务器的异步任务"""
+        """
+        WebSocket服务器任务。端口被占用时记录日志后结束（重启也无济于事）；
+        其他异常交给运行时，退避后重新启动服务器。任务被取消时关闭所有客户端连接。
+        """
         try:
-            async with websockets.serve(self._handler, "0.0.0.0", self.port) as server: # type: ignore
+            async with websockets.serve(self._handler, "0.0.0.0", self.port, # type: ignore
+                                        subprotocols=[SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON],
+                                        select_subprotocol=_select_subprotocol) as server:
                 self.server = server
                 self.logger(f"WebSocket 服务器已在 ws://0.0.0.0:{self.port} 启动")
                 await server.wait_closed()
         except OSError as e:
             self.logger(f"[WebSocket] 服务器启动失败: {e}. 端口可能已被占用。")
-        except Exception as e:
-            self.logger(f"[WebSocket] 服务器发生未知错误: {e}")
+        finally:
+            self.server = None
+            metrics.WEBSOCKET_CLIENTS.set(0)
+
+    async def handle_upgrade(self, request: 'Request', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        处理 API 服务器转交的 WebSocket 升级请求，直到连接关闭。
+        请求头无法被解析为握手请求时抛出 HttpError(400)，由 API 服务器回复。
+        """
+        from http_async import HttpError
+        protocol = ServerProtocol(subprotocols=[SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON], # type: ignore
+                                  select_subprotocol=_select_subprotocol)
+        protocol.receive_data(request.head)
+        events = protocol.events_received()
+        if not events or protocol.handshake_exc is not None:
+            raise HttpError(400, f"无效的 WebSocket 握手请求: {protocol.handshake_exc or '请求不完整'}")
+        handshake = events[0]
+        response = protocol.accept(handshake)
+        protocol.send_response(response)
+        connection = _StreamConnection(protocol, reader, writer)
+        connection._flush()
+        await writer.drain()
+        if response.status_code != 101:
+            return
+        task = asyncio.current_task()
+        self._upgraded[task] = connection
+        try:
+            await self._handler(connection) # type: ignore
+        finally:
+            self._upgraded.pop(task, None)
 
-    def _start_server_thread(self):
-        """在新的事件循环和线程中运行服务器"""
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-        self.loop.run_until_complete(self._run_server())
+    async def _close_upgraded(self):
+        """向客户端发送关闭帧（1001，服务器离开）后结束各连接的处理任务"""
+        tasks = list(self._upgraded)
+        for task, connection in list(self._upgraded.items()):
+            await connection.close(1001)
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
     def start(self):
-        """在独立线程中启动WebSocket服务器"""
-        if self.server_thread and self.server_thread.is_alive():
+        """在后台运行时中启动WebSocket服务器；共用端口时只开始接受 API 服务器转交的连接"""
+        self.runtime.start()
+        if self.shared:
+            self.loop = self.runtime.loop
+            self.logger(f"WebSocket 服务器与 API 服务器共用端口 {self.port}")
+            return
+        if self.runtime.is_running("websocket"):
             self.logger("[WebSocket] 服务器已在运行中。")
             return
-        self.server_thread = threading.Thread(target=self._start_server_thread, daemon=True)
-        self.server_thread.start()
+        self.loop = self.runtime.loop
+        self.runtime.supervise("websocket", self._run_server)
 
     def stop(self):
-        """停止WebSocket服务器"""
-        if self.server and self.loop:
+        """停止WebSocket服务器，返回时所有连接已关闭、端口已释放"""
+        if self.loop:
             self.logger("[WebSocket] 正在停止服务器...")
-            # 优雅地关闭所有客户端连接
-            for client in self.connected_clients:
-                self.loop.call_soon_threadsafe(asyncio.create_task, client.close()) # type: ignore
+            if self.shared:
+                import concurrent.futures
+                future = self.runtime.submit(self._close_upgraded())
+                try:
+                    future.result(2)
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+                    self.logger("[WebSocket] 等待连接关闭超时")
+            else:
+                self.runtime.cancel("websocket", timeout=2)
+            self.logger("[WebSocket] 服务器已停止。")
+        self.loop = None
 
-            # 停止服务器
-            self.loop.call_soon_threadsafe(self.server.close)
+    def _current_event(self) -> SinkEvent:
+        """根据主程序的当前状态构造一条消息（用于新连接的客户端）"""
+        return self.monitor_instance.state.current.to_event()
 
-            # 等待服务器完全关闭
-            if self.server_thread:
-                 self.server_thread.join(timeout=2)
+    def _stats(self) -> Optional[dict]:
+        """统计结果随快照一起整体替换，这里直接取引用，不需要加锁或复制"""
+        return self.monitor_instance.state.current.stats
 
-        if self.loop and self.loop.is_running():
-            self.loop.call_soon_threadsafe(self.loop.stop)
+    @staticmethod
+    def _encoder(websocket: ServerProtocol) -> Callable[..., Union[str, bytes]]:
+        return encode_binary if websocket.subprotocol == SUBPROTOCOL_BINARY else encode_json # type: ignore
 
-        self.logger("[WebSocket] 服务器已停止。")
-        self.server = None
-        self.server_thread = None
-        self.loop = None
-
-    async def send_data(self, websocket: ServerProtocol):
-        """向单个客户端发送当前的心率数据"""
-        data = {
-            "heart_rate": self.monitor_instance.heart_rate,
-            "connected": self.monitor_instance.connected,
-            "status": "connected" if self.monitor_instance.connected else "disconnected"
-        }
+    async def send_data(self, websocket: ServerProtocol, message: Union[str, bytes, None] = None):
+        """向单个客户端发送心率数据，未指定 message 时按其订阅发送当前状态"""
+        if message is None:
+            subscription = self._client_subscriptions.get(websocket, DEFAULT_SUBSCRIPTION)
+            # 同一快照、同样订阅的客户端共用一份编码结果（例如大量客户端同时重连）
+            encoder = self._encoder(websocket)
+            fields = subscription.fields
+            hrv = self._hrv.value
+            message = self.monitor_instance.state.current.cached(
+                ("websocket", encoder, fields, hrv), lambda s: encoder(s.to_event(), fields, hrv, s.stats))
+        start = time.perf_counter()
         try:
-            await websocket.send(json.dumps(data)) # type: ignore
+            await websocket.send(message) # type: ignore
+            _SENDS.inc()
+            _LATENCY.observe(time.perf_counter() - start)
         except websockets.exceptions.ConnectionClosed:
-            pass # 连接已关闭，无需处理
+            _ERRORS.inc() # 连接已关闭，无需处理
+
+    def broadcast(self, event: Optional[SinkEvent] = None):
+        """
+        向所有连接的客户端广播心率数据（可在任意线程中调用）。
+        event 为空时广播当前状态。实际分发在运行时的事件循环中进行，已在其中时直接分发。
+        """
+        if not self.loop:
+            return
+        if event is None:
+            event = self._current_event()
+        # 每个事件只调度一次；HRV 需要连续的 RR，因此即使没有客户端也要更新
+        self.runtime.call_soon(self._dispatch, event)
 
-    def broadcast(self):
-        """向所有连接的客户端广播心率数据"""
-        if not self.connected_clients or not self.loop:
+    def _dispatch(self, event: SinkEvent):
+        """在事件循环线程中按订阅组分发；字段和格式都相同的组共用同一份编码结果"""
+        if event.kind in ALERT_TRIGGERS:
+            self._dispatch_alert(event)
             return
+        hrv = self._hrv.update(event)
+        if not self._groups:
+            return
+        now = time.monotonic()
+        stats = self._stats()
+        encoded: dict = {}
+        for group in list(self._groups.values()):
+            if not group.accepts(event, now):
+                continue
+            fields = group.subscription.fields
+            for client in list(group.clients):
+                encoder = self._encoder(client)
+                key = (encoder, fields)
+                message = encoded.get(key)
+                if message is None:
+                    message = encoded[key] = encoder(event, fields, hrv, stats)
+                self._start_send(client, message)
+
+    def _dispatch_alert(self, event: SinkEvent):
+        """提醒事件只发给订阅了 alerts 字段的组，所有组共用一份编码结果"""
+        message = None
+        for group in list(self._groups.values()):
+            if FIELD_ALERTS not in group.subscription.fields:
+                continue
+            if not group.accepts(event, time.monotonic()):
+                continue
+            if message is None:
+                message = encode_alert(event)
+            for client in list(group.clients):
+                self._start_send(client, message)
 
-        # 使用 call_soon_threadsafe 从主线程安排协程在服务器的事件循环中执行
-        for client in list(self.connected_clients):
-            self.loop.call_soon_threadsafe(
-                asyncio.create_task, self.send_data(client)
-            )
\ No newline at end of file
+    def _start_send(self, client: ServerProtocol, message: Union[str, bytes]):
+        """在事件循环中发送给一个客户端，不等待；任务结束时取出异常并记录"""
+        task = asyncio.create_task(self.send_data(client, message))
+        self._send_tasks.add(task)
+        task.add_done_callback(self._on_send_done)
+
+    def _on_send_done(self, task: asyncio.Task):
+        self._send_tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            _ERRORS.inc()
+            self.logger(f"[WebSocket] 发送失败: {error!r}")